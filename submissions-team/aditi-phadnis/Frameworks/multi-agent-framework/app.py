@@ -1,10 +1,9 @@
 import streamlit as st
 from streamlit_chat import message
-from langchain_openai import ChatOpenAI
 from models import UserProfile
-from orchestrator import Orchestrator
 import pandas as pd
-from app3 import generate_exercises_tab
+from app3 import generate_exercises_tab, get_orchestrator
+from streaming import ThrottledRenderer
 import logging
 
 logging.basicConfig(level=logging.DEBUG)
@@ -12,14 +11,10 @@ logging.debug("Starting app.py execution")
 
 
 
-# Initialize the LLM
-llm = ChatOpenAI(temperature=0.2, model="gpt-4-turbo", streaming=True)
-
-# Create the orchestrator
-orchestrator = Orchestrator(llm)
-
 # Streamlit UI
 def main():
+    # Cached, so the conversation memories and learner state survive reruns
+    orchestrator = get_orchestrator()
     st.title("🌍 AI Language Tutor")
     st.sidebar.header("User Settings")
     
@@ -28,12 +23,17 @@ def main():
     difficulty_level = st.sidebar.selectbox("Difficulty Level", ["Beginner", "Intermediate", "Advanced"])
     learning_focus = st.sidebar.selectbox("Learning Focus", ["Vocabulary", "Grammar", "Conversation"])
     
-    # Initialize user profile
-    user_profile = UserProfile(
-        target_language=target_language,
-        difficulty_level=difficulty_level,
-        learning_focus=learning_focus
-    )
+    # Initialize user profile once per browser session; its user_id keys the memory and learner state
+    if "user_profile" not in st.session_state:
+        st.session_state.user_profile = UserProfile(
+            target_language=target_language,
+            difficulty_level=difficulty_level,
+            learning_focus=learning_focus
+        )
+    user_profile = st.session_state.user_profile
+    user_profile.target_language = target_language
+    user_profile.difficulty_level = difficulty_level
+    user_profile.learning_focus = learning_focus
     
     # Tabs for Chat and Exercises
     tab1, tab2 = st.tabs(["💬 Chat", "📚 Exercises"])
@@ -56,10 +56,23 @@ def main():
         # Chat input at the bottom
         user_input = st.chat_input("🗣️ Enter your message:")
         if user_input:
-            response = orchestrator.handle_conversation(user_input, user_profile)
             st.session_state.chat_history.append(("user", user_input))
+            with chat_container:
+                message(user_input, is_user=True, key=f"chat_{len(st.session_state.chat_history) - 1}")
+                # Tokens are drawn here in batches as they arrive; the finished reply replaces it on rerun
+                placeholder = st.empty()
+            renderer = ThrottledRenderer(lambda text: placeholder.markdown(text + "▌"))
+
+            response = orchestrator.stream_conversation(user_input, user_profile, renderer.add)
+            renderer.flush()
             st.session_state.chat_history.append(("bot", response))
             st.rerun()
+
+        # The orchestrator is a cached resource, so these stats cover every reply since the server started
+        report = orchestrator.stream_report()
+        if report["ttft_s_avg"] is not None:
+            st.caption(f"⏱️ Time to first token: {report['ttft_s_avg']}s avg, {report['ttft_s_p95']}s p95 "
+                       f"over {report['responses']} replies")
     
     with tab2:
         st.subheader("Language Exercises")
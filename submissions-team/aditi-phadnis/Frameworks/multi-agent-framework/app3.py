@@ -3,9 +3,14 @@ from langchain_openai import ChatOpenAI
 from models import UserProfile
 from orchestrator import Orchestrator
 
-# Initialize LLM and orchestrator
-llm = ChatOpenAI(temperature=0.2, model="gpt-4-turbo", streaming=True)
-orchestrator = Orchestrator(llm)
+
+@st.cache_resource
+def get_orchestrator() -> Orchestrator:
+    """One Orchestrator per server process, shared by every session and kept across reruns."""
+    llm = ChatOpenAI(temperature=0.2, model="gpt-4-turbo", streaming=True, stream_usage=True)
+    return Orchestrator(llm)
+
+
 # st.title("🌍 AI Language Tutor")
 # st.sidebar.header("User Settings")
     
@@ -20,6 +25,7 @@ orchestrator = Orchestrator(llm)
 #         learning_focus=learning_focus
 #     )
 def generate_exercises_tab(user_profile):
+    orchestrator = get_orchestrator()
 
     # Ensure session state variables exist
     if "exercises" not in st.session_state:
@@ -32,12 +38,25 @@ def generate_exercises_tab(user_profile):
         st.session_state.feedback = {}
 
 
-    # Generate exercises
+    # Generate exercises in the background; the script returns right away and picks the result up on a later run
     if st.button("Generate Exercises", key="generate_exercise_1"):
-        st.session_state.exercises = orchestrator.generate_exercises(user_profile)
-        st.session_state.user_answers = {}
-        st.session_state.correct_answers = {} # Clear previous correct answers
-        st.session_state.feedback = None # Clear previous feedback
+        st.session_state.exercise_job = orchestrator.submit_exercise_job(user_profile)
+
+    if st.session_state.get("exercise_job"):
+        job = orchestrator.exercise_job(st.session_state.exercise_job)
+        if job is None or job["status"] == "dead":
+            st.error(f"Exercise generation failed: {job['error'] if job else 'unknown job'}")
+            st.session_state.exercise_job = None
+        elif job["status"] == "done":
+            st.session_state.exercises = job["result"]
+            st.session_state.user_answers = {}
+            st.session_state.correct_answers = {} # Clear previous correct answers
+            st.session_state.feedback = None # Clear previous feedback
+            st.session_state.exercise_job = None
+        else:
+            attempt = f" (attempt {job['attempts']})" if job["attempts"] > 1 else ""
+            st.info(f"Generating exercises: {job['status']}{attempt}")
+            st.button("Refresh", key="refresh_exercise_job")
 
 
     exercises = st.session_state.exercises
@@ -46,6 +65,9 @@ def generate_exercises_tab(user_profile):
         st.warning("No exercises generated yet.")
         return
 
+    if any(isinstance(exercise, dict) and exercise.get("degraded") for exercise in exercises):
+        st.info("The tutor is responding slowly, so these are exercises from your practice bank.")
+
     # Display exercises interactively
     for i, exercise in enumerate(exercises):
         if not isinstance(exercise, dict):
@@ -88,7 +110,12 @@ def generate_exercises_tab(user_profile):
         st.session_state.user_answers[i] = user_answer
         st.session_state.correct_answers[i] = {
             "correct_answer": exercise.get("correctAnswer") or exercise.get("correct_answer"),
-            "explanation": exercise.get("explanation", "No explanation provided")
+            "explanation": exercise.get("explanation", "No explanation provided"),
+            "id": exercise.get("id"),
+            "exercise_type": exercise.get("exercise_type"),
+            "theme": exercise.get("theme"),
+            "grammar_topic": exercise.get("grammar_topic"),
+            "tokens": exercise.get("tokens", 0)
         }
         # print("DEBUG: Stored correct_answers =", st.session_state.correct_answers)
 
@@ -135,7 +162,7 @@ def generate_exercises_tab(user_profile):
 
             # Ensure `user_answers` exist before sending for feedback
             if st.session_state.user_answers:
-                feedback = orchestrator.provide_feedback(st.session_state.user_answers, st.session_state.correct_answers)
+                feedback = orchestrator.provide_feedback(st.session_state.user_answers, st.session_state.correct_answers, user_profile)
                 st.session_state.feedback = feedback
             else:
                 st.warning("No answers detected. Please provide your answers before submitting.")
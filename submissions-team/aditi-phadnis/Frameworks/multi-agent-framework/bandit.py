@@ -0,0 +1,155 @@
+import base64
+import json
+import math
+import random
+from array import array
+from typing import Callable, Dict, Any, Iterable, List, Optional
+from state_store import UserStateStore
+from config import DIFFICULTY_LEVELS, EXERCISE_TYPES
+
+# Rolling-accuracy buckets used as context, plus one for "no answers yet"
+ACCURACY_BUCKETS = [0.5, 0.8]
+N_CONTEXTS = len(DIFFICULTY_LEVELS) * (len(ACCURACY_BUCKETS) + 2)
+# Token cost floor (in thousands), so a cheap generation can't dominate the reward
+MIN_KILO_TOKENS = 0.1
+
+
+def context_key(difficulty_level: str, rolling_accuracy: Optional[float]) -> int:
+    """Maps the learner's level and recent accuracy to a small context index."""
+    level = DIFFICULTY_LEVELS.index(difficulty_level) if difficulty_level in DIFFICULTY_LEVELS else 0
+    if rolling_accuracy is None:
+        bucket = 0
+    else:
+        bucket = 1 + sum(rolling_accuracy >= cutoff for cutoff in ACCURACY_BUCKETS)
+    return level * (len(ACCURACY_BUCKETS) + 2) + bucket
+
+
+def learning_reward(gain: float, tokens: int) -> float:
+    """Learning gain per thousand LLM tokens spent."""
+    return gain / max(tokens / 1000.0, MIN_KILO_TOKENS)
+
+
+class ExerciseTypeBandit:
+    """
+    Per-user contextual UCB1 bandit over exercise types.
+    State is two float32 arrays (pulls and reward sums) per context/arm pair,
+    so it persists in well under a kilobyte.
+    """
+
+    def __init__(self, user_id: str, arms: List[str] = None, exploration: float = 1.0):
+        self.user_id = user_id
+        self.arms = list(arms or EXERCISE_TYPES)
+        self.exploration = exploration
+        size = N_CONTEXTS * len(self.arms)
+        self.pulls = array("f", [0.0]) * size
+        self.rewards = array("f", [0.0]) * size
+
+    def _slot(self, context: int, arm_idx: int) -> int:
+        return context * len(self.arms) + arm_idx
+
+    def choose(self, context: int, allowed: Iterable[str] = None) -> Optional[str]:
+        """Picks the arm with the highest upper confidence bound in this context; None if no arm is allowed."""
+        allowed = set(allowed) if allowed is not None else None
+        candidates = [idx for idx, arm in enumerate(self.arms) if allowed is None or arm in allowed]
+        if not candidates:
+            return None
+        untried = [idx for idx in candidates if self.pulls[self._slot(context, idx)] == 0]
+        if untried:
+            return self.arms[random.choice(untried)]
+
+        total = sum(self.pulls[self._slot(context, idx)] for idx in candidates)
+        log_total = math.log(total)
+
+        def ucb(idx: int) -> float:
+            slot = self._slot(context, idx)
+            mean = self.rewards[slot] / self.pulls[slot]
+            return mean + self.exploration * math.sqrt(2 * log_total / self.pulls[slot])
+
+        return self.arms[max(candidates, key=ucb)]
+
+    def update(self, context: int, arm: str, reward: float) -> None:
+        """O(1) online update after a graded exercise."""
+        if arm not in self.arms:
+            return
+        slot = self._slot(context, self.arms.index(arm))
+        self.pulls[slot] += 1
+        self.rewards[slot] += reward
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "user_id": self.user_id,
+            "arms": self.arms,
+            "pulls": base64.b64encode(self.pulls.tobytes()).decode("ascii"),
+            "rewards": base64.b64encode(self.rewards.tobytes()).decode("ascii")
+        }
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "ExerciseTypeBandit":
+        bandit = cls(data["user_id"], data.get("arms"))
+        bandit.pulls = array("f")
+        bandit.pulls.frombytes(base64.b64decode(data["pulls"]))
+        bandit.rewards = array("f")
+        bandit.rewards.frombytes(base64.b64decode(data["rewards"]))
+        return bandit
+
+
+class BanditStore:
+    """Holds an ExerciseTypeBandit per user_id, persisted as a UserStateStore row per user, with an optional JSONL event log."""
+
+    def __init__(self, state: UserStateStore = None, log_path: str = None):
+        self.state = state or UserStateStore("bandits")
+        self.log_path = log_path
+        self.users: Dict[str, ExerciseTypeBandit] = {}
+
+    def get(self, user_id: str) -> ExerciseTypeBandit:
+        bandit = self.users.get(user_id)
+        if bandit is None:
+            data = self.state.load(user_id)
+            bandit = self.users[user_id] = ExerciseTypeBandit.from_dict(data) if data else ExerciseTypeBandit(user_id)
+        return bandit
+
+    def update(self, user_id: str, context: int, arm: str, reward: float) -> None:
+        self.get(user_id).update(context, arm, reward)
+        if self.log_path:
+            with open(self.log_path, "a", encoding="utf-8") as f:
+                f.write(json.dumps({"user_id": user_id, "context": context, "arm": arm, "reward": reward}) + "\n")
+
+    def save(self, user_id: str) -> None:
+        """Persists one user's bandit state; call after a batch of updates."""
+        self.state.save(user_id, self.get(user_id).to_dict())
+
+
+def load_events(log_path: str) -> List[Dict[str, Any]]:
+    with open(log_path, encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def replay_evaluate(events: Iterable[Dict[str, Any]],
+                    make_policy: Callable[[str], ExerciseTypeBandit] = ExerciseTypeBandit) -> Dict[str, Any]:
+    """
+    Offline replay evaluation (Li et al., 2011) over logged sessions.
+    For each logged event the candidate policy picks an arm; only events where it
+    agrees with the logged arm are counted and fed back to the policy. Unbiased
+    when the logging policy chose arms uniformly at random.
+    """
+    policies: Dict[str, ExerciseTypeBandit] = {}
+    matched, total, reward_sum = 0, 0, 0.0
+    logged_reward_sum = 0.0
+    for event in events:
+        total += 1
+        logged_reward_sum += event["reward"]
+        policy = policies.get(event["user_id"])
+        if policy is None:
+            policy = policies[event["user_id"]] = make_policy(event["user_id"])
+        if policy.choose(event["context"]) != event["arm"]:
+            continue
+        matched += 1
+        reward_sum += event["reward"]
+        policy.update(event["context"], event["arm"], event["reward"])
+
+    return {
+        "events": total,
+        "matched": matched,
+        "policy_mean_reward": reward_sum / matched if matched else None,
+        "logged_mean_reward": logged_reward_sum / total if total else None
+    }
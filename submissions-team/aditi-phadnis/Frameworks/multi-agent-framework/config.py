@@ -8,3 +8,84 @@ OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
 # Constants
 DEFAULT_LANGUAGE = "Spanish"
 DIFFICULTY_LEVELS = ["Beginner", "Intermediate", "Advanced"]
+# Exercise types the exercise agent can generate (and the bandit chooses between); there is no audio
+# output, so no listening exercises
+EXERCISE_TYPES = ["Vocabulary", "Grammar", "Conversation", "Reading", "Multiple Choice"]
+# Exercises in one generated set
+EXERCISES_PER_SET = 2
+
+# Number of recent graded answers used for rolling accuracy
+ROLLING_WINDOW = 20
+
+# Failed spaced-repetition items are shown again after this delay
+RELEARN_DELAY_SECONDS = 10 * 60
+
+# SQLite file holding generated exercises for reuse
+EXERCISE_BANK_PATH = "exercise_bank.db"
+# Calibrated exercises (irt.py) are matched to the learner's ability from this many most informative items
+IRT_PICK_CANDIDATES = 10
+# The calibration runs offline, so the in-memory item pickers are rebuilt this often
+IRT_PICKER_REFRESH_SECONDS = 600
+
+# Token budget for the conversation history sent with each prompt (None = unbounded)
+MEMORY_TOKEN_BUDGET = 2000
+# Fold turns that fall out of the budget into a background-refreshed summary
+SUMMARIZE_HISTORY = True
+# Number of turns of memory bookkeeping stats kept for inspection
+MEMORY_STATS_HISTORY = 500
+
+# Per-learner statistics, review schedules and bandit state, one row per user and table
+LEARNER_STATE_PATH = "learner_state.db"
+
+# Evicted history is summarized in the background once it reaches this many tokens
+SUMMARY_TRIGGER_TOKENS = 300
+# Upper bound on the running conversation summary
+SUMMARY_MAX_WORDS = 150
+
+# Conversation memories kept in RAM; older sessions are written to SESSION_STORE_PATH
+MAX_RESIDENT_SESSIONS = 200
+SESSION_STORE_PATH = "sessions.db"
+
+# Append-only conversation/exercise/feedback history; profiles keep the last HISTORY_RECENT_ITEMS in RAM
+HISTORY_STORE_PATH = "history.db"
+HISTORY_RECENT_ITEMS = 50
+
+# Retrieval memory: every past turn is embedded locally and the most relevant ones are re-sent
+RETRIEVE_HISTORY = False
+RETRIEVAL_TOP_K = 4
+RETRIEVAL_MIN_SCORE = 0.25
+RETRIEVAL_EMBED_DIM = 256
+# Below this many indexed turns search is exact; above it only the RETRIEVAL_PROBES nearest clusters are scanned
+RETRIEVAL_EXACT_ROWS = 8192
+RETRIEVAL_PROBES = 8
+
+# HTTP service (service.py): Orchestrator instances, with each session pinned to one of them
+SERVICE_ORCHESTRATORS = 2
+# Requests running LLM work at once; more wait up to SERVICE_QUEUE_TIMEOUT seconds, then get 503
+SERVICE_MAX_CONCURRENCY = 16
+SERVICE_QUEUE_TIMEOUT = 5.0
+# Idle sessions are dropped after this many seconds, oldest first beyond SERVICE_MAX_SESSIONS
+SERVICE_SESSION_TTL = 3600
+SERVICE_MAX_SESSIONS = 10000
+
+# Background exercise generation (job_queue.py): SQLite-backed jobs run by EXERCISE_WORKERS threads
+JOB_QUEUE_PATH = "jobs.db"
+EXERCISE_WORKERS = 2
+# Failed jobs are retried after JOB_RETRY_BASE_SECONDS * 2^(attempt-1), then dead-lettered
+JOB_MAX_ATTEMPTS = 3
+JOB_RETRY_BASE_SECONDS = 2.0
+# A running job not finished within this many seconds of being claimed is picked up again
+# (there is no heartbeat, so this must exceed the longest job)
+JOB_LEASE_SECONDS = 300
+JOB_POLL_SECONDS = 0.5
+
+# LLM circuit breaker: opens after this many consecutive failed or slow calls, retries after the reset delay
+BREAKER_FAILURE_THRESHOLD = 3
+BREAKER_RESET_SECONDS = 30
+BREAKER_SLOW_CALL_SECONDS = 20
+# Latency budget for one generate_exercises request; past it banked exercises are served instead
+EXERCISE_BUDGET_SECONDS = 30
+
+# Streamed replies are redrawn at most this often, or sooner once this many characters are waiting
+STREAM_FLUSH_SECONDS = 0.1
+STREAM_FLUSH_CHARS = 400
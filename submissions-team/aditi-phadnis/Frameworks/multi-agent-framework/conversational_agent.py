@@ -2,16 +2,21 @@ from langchain.prompts import ChatPromptTemplate, MessagesPlaceholder
 from langchain.tools import Tool
 from langchain.agents import AgentExecutor, create_openai_functions_agent
 from langchain_openai import ChatOpenAI
-from models import MultiInputMemory, UserProfile
-from config import DEFAULT_LANGUAGE
+from models import MultiInputMemory, SummarizingMemory, RetrievalMemory, UserProfile
+from memory_pool import MemoryPool
+from prompts import BudgetedMessagesPlaceholder, PromptCacheCallback
+from config import DEFAULT_LANGUAGE, MEMORY_TOKEN_BUDGET, SUMMARIZE_HISTORY, RETRIEVE_HISTORY, MAX_RESIDENT_SESSIONS
 
 class ConversationAgent:
-    def __init__(self, llm: ChatOpenAI):
-        include_keys = ["target_language", "difficulty_level"]
+    def __init__(self, llm: ChatOpenAI, memory_token_budget: int = MEMORY_TOKEN_BUDGET,
+                 summarize_history: bool = SUMMARIZE_HISTORY, retrieve_history: bool = RETRIEVE_HISTORY,
+                 max_resident_sessions: int = MAX_RESIDENT_SESSIONS):
         self.llm = llm
-        self.memory = MultiInputMemory(memory_key="chat_history", 
-                                       include_keys=include_keys,  
-                                       return_messages=True)
+        self.memory_token_budget = memory_token_budget
+        self.summarize_history = summarize_history
+        self.retrieve_history = retrieve_history
+        # One memory per user session; idle sessions are spilled to disk
+        self.memory_pool = MemoryPool(self._new_memory, max_resident=max_resident_sessions)
 
         # Define tools for the agent
         self.tools = [
@@ -21,27 +26,53 @@ class ConversationAgent:
             Tool(name="RequestExerciseGeneration", func=self.request_exercise, description="Requests an exercise based on context")
         ]
         
-        # Define prompt template
+        # Define prompt template, ordered from most to least stable so requests share a cacheable prefix:
+        # static instructions, then the target language, then the learner's history, then the turn
         self.prompt = ChatPromptTemplate.from_messages([
             ("system", """You are a multilingual AI language tutor.
-            When responding in {target_language}, always provide the English translation immediately after.
-            Your responses should follow this format and should be in Markdown Language:
+            When responding in the target language, always provide the English translation immediately after.
+            Your responses should follow this format and should be in Markdown Language,
+            with the name of the target language as the first column header:
             
 
              
-             {target_language} | English Translation
+             [Target language] | English Translation
             :------------------------------------------------------ | :------------------------| 
-            [Response in {target_language}] | [Translation in English]
+            [Response in the target language] | [Translation in English]
 
             
             Provide helpful, engaging, and educational responses for learners of all levels."""),
+            ("system", "Target language: {target_language}"),
+            BudgetedMessagesPlaceholder("chat_history", optional=True, max_tokens=memory_token_budget),
             ("user", "{input}"),
             ("assistant", "{agent_scratchpad}")
         ])
         
         # Create agent
         self.agent = create_openai_functions_agent(llm, self.tools, self.prompt)
-        self.agent_executor = AgentExecutor(agent=self.agent, tools=self.tools, memory=self.memory, verbose=True)
+        self.agent_executor = AgentExecutor(agent=self.agent, tools=self.tools, verbose=True)
+        self.cache_callback = PromptCacheCallback("conversation")
+
+    def _new_memory(self) -> MultiInputMemory:
+        """Creates an empty memory for a new (or reloaded) session."""
+        # Language and level reach the prompt through the pinned profile facts,
+        # so they are not repeated inside every stored turn
+        if self.retrieve_history:
+            return RetrievalMemory(memory_key="chat_history",
+                                   return_messages=True,
+                                   max_token_limit=self.memory_token_budget)
+        if self.summarize_history and self.memory_token_budget is not None:
+            return SummarizingMemory(self.llm,
+                                     memory_key="chat_history",
+                                     return_messages=True,
+                                     max_token_limit=self.memory_token_budget)
+        return MultiInputMemory(memory_key="chat_history",
+                                return_messages=True,
+                                max_token_limit=self.memory_token_budget)
+
+    def memory_costs(self, user_id: str) -> dict:
+        """Per-turn memory bookkeeping time versus history tokens sent, for one session."""
+        return self.memory_pool.get(user_id).cost_report()
     
     def translate_text(self, text: str, source_lang: str, target_lang: str) -> str:
         """Translates text between languages."""
@@ -59,13 +90,24 @@ class ConversationAgent:
         """Requests an exercise from the Exercise Agent."""
         return f"Requesting a {difficulty} exercise focusing on {focus_area}."
     
-    def respond(self, user_input: str, user_profile: UserProfile) -> str:
-        """Generate a response to user input."""
-        response = self.agent_executor.invoke({
-            "input": user_input,
-            "target_language": user_profile.target_language,
-            "difficulty_level": user_profile.difficulty_level,
-            "learning_focus": ", ".join(user_profile.learning_focus)
-        })
-        user_profile.conversation_history.append({"user": user_input, "agent": response["output"]})
+    def respond(self, user_input: str, user_profile: UserProfile, callbacks: list = None) -> str:
+        """Generate a response to user input; `callbacks` are extra LangChain handlers, e.g. for token streaming."""
+        # Checked out for the whole turn, so the pool can't evict it while the LLM runs
+        with self.memory_pool.checkout(user_profile.user_id) as memory:
+            memory.set_pinned_facts({
+                "target language": user_profile.target_language,
+                "level": user_profile.difficulty_level,
+                "weaknesses": ", ".join(user_profile.weaknesses)
+            })
+            inputs = {
+                "input": user_input,
+                "target_language": user_profile.target_language,
+                "difficulty_level": user_profile.difficulty_level,
+                "learning_focus": ", ".join(user_profile.learning_focus)
+            }
+            inputs.update(memory.load_memory_variables(inputs))
+            response = self.agent_executor.invoke(inputs,
+                                                  config={"callbacks": [self.cache_callback] + (callbacks or [])})
+            memory.save_context(inputs, {"output": response["output"]})
+        user_profile.add_history("conversation", {"user": user_input, "agent": response["output"]})
         return response["output"]
@@ -0,0 +1,232 @@
+import unicodedata
+from difflib import SequenceMatcher
+from functools import lru_cache
+from typing import Dict, Iterable, List, Tuple
+
+# Error categories, ordered from most to least specific
+ACCENT = "accent"
+AGREEMENT = "agreement"
+ENDING = "ending"
+STEM = "stem"
+TYPO = "typo"
+OTHER = "other"
+
+# Human readable labels used when feeding UserProfile.weaknesses
+WEAKNESS_LABELS = {
+    ACCENT: "Accent marks",
+    AGREEMENT: "Gender/number agreement",
+    ENDING: "Verb endings and person",
+    STEM: "Word stems and irregular forms",
+    TYPO: "Spelling (typos)",
+    OTHER: "Vocabulary choice",
+}
+
+# Ending swaps that only change gender (Spanish/Portuguese/Italian -o/-a, French -/-e)
+GENDER_SWAPS = {frozenset(("o", "a")), frozenset(("os", "as")), frozenset(("", "e")), frozenset(("s", "es"))}
+# Suffixes that only add plural number
+PLURAL_SUFFIXES = ("s", "es", "x")
+# Articles and determiners, where any swap is an agreement mistake
+DETERMINERS = {
+    "el", "la", "los", "las", "un", "una", "unos", "unas",
+    "le", "les", "l'", "une", "des", "du",
+    "il", "lo", "gli", "i", "uno",
+    "der", "die", "das", "den", "dem", "ein", "eine", "einen", "einem", "einer",
+}
+# Common verb endings (accents stripped), longest first; swapping one for another is an ending mistake
+VERB_ENDINGS = tuple(sorted({
+    # Spanish present, preterite, imperfect, future/conditional
+    "o", "as", "a", "amos", "ais", "an", "es", "e", "emos", "eis", "en", "imos", "is",
+    "aste", "asteis", "aron", "iste", "isteis", "ieron", "io",
+    "aba", "abas", "abamos", "abais", "aban", "ia", "ias", "iamos", "iais", "ian",
+    "are", "aras", "ara", "aremos", "areis", "aran", "ere", "eras", "era", "eremos", "ereis", "eran",
+    "ire", "iras", "ira", "iremos", "ireis", "iran",
+    # French
+    "ons", "ez", "ent", "ais", "ait", "ions", "iez", "aient", "ai", "erai", "eras", "era", "erons", "erez", "eront",
+    # Italian
+    "i", "iamo", "ate", "ete", "ite", "ano", "ono", "avo", "avi", "ava", "avamo", "avano", "evo", "eva",
+}, key=len, reverse=True))
+# Stems shorter than this are too short to tell an ending swap from an irregular stem ("fuemos")
+MIN_STEM_LENGTH = 3
+
+# Neighbouring keys on a QWERTY keyboard, used to recognise fat-finger typos
+_KEYBOARD_ROWS = ["qwertyuiop", "asdfghjkl", "zxcvbnm"]
+_KEYBOARD_NEIGHBOURS: Dict[str, set] = {}
+for _row_idx, _row in enumerate(_KEYBOARD_ROWS):
+    for _col, _key in enumerate(_row):
+        _neighbours = set(_row[max(0, _col - 1):_col + 2])
+        for _other_idx in (_row_idx - 1, _row_idx + 1):
+            if 0 <= _other_idx < len(_KEYBOARD_ROWS):
+                _neighbours.update(_KEYBOARD_ROWS[_other_idx][max(0, _col - 1):_col + 2])
+        _neighbours.discard(_key)
+        _KEYBOARD_NEIGHBOURS[_key] = _neighbours
+
+
+def strip_accents(text: str) -> str:
+    """Removes diacritics so 'comí' and 'comi' compare equal."""
+    decomposed = unicodedata.normalize("NFD", text)
+    return "".join(ch for ch in decomposed if unicodedata.category(ch) != "Mn")
+
+
+def _normalize(text: str) -> str:
+    return unicodedata.normalize("NFC", str(text).strip().lower())
+
+
+def _common_prefix(a: str, b: str) -> int:
+    n = min(len(a), len(b))
+    i = 0
+    while i < n and a[i] == b[i]:
+        i += 1
+    return i
+
+
+def _common_suffix(a: str, b: str, limit: int) -> int:
+    n = min(len(a), len(b)) - limit
+    i = 0
+    while i < n and a[-1 - i] == b[-1 - i]:
+        i += 1
+    return i
+
+
+def _is_agreement(user_ending: str, correct_ending: str) -> bool:
+    """True when two endings differ only in gender or number."""
+    if frozenset((user_ending, correct_ending)) in GENDER_SWAPS:
+        return True
+    shorter, longer = sorted((user_ending, correct_ending), key=len)
+    return any(longer == shorter + suffix for suffix in PLURAL_SUFFIXES)
+
+
+def _is_ending_swap(user: str, correct: str) -> bool:
+    """True when both words are one stem with two different verb endings, e.g. 'comemos'/'comimos'."""
+    for correct_ending in VERB_ENDINGS:
+        if not correct.endswith(correct_ending):
+            continue
+        stem = correct[:-len(correct_ending)]
+        if len(stem) >= MIN_STEM_LENGTH and user.startswith(stem) and user[len(stem):] in VERB_ENDINGS:
+            return True
+    return False
+
+
+def _is_typo(user: str, correct: str) -> bool:
+    """True for a single dropped/doubled letter, transposition or neighbouring-key slip."""
+    if abs(len(user) - len(correct)) > 1:
+        return False
+
+    prefix = _common_prefix(user, correct)
+    suffix = _common_suffix(user, correct, prefix)
+    user_diff = user[prefix:len(user) - suffix]
+    correct_diff = correct[prefix:len(correct) - suffix]
+
+    # Dropped or extra letter
+    if not user_diff or not correct_diff:
+        return len(user_diff) + len(correct_diff) == 1
+
+    # Swapped adjacent letters
+    if len(user_diff) == len(correct_diff) == 2:
+        return user_diff == correct_diff[::-1]
+
+    # Neighbouring key pressed instead of the intended one
+    if len(user_diff) == len(correct_diff) == 1:
+        return user_diff in _KEYBOARD_NEIGHBOURS.get(correct_diff, ())
+
+    return False
+
+
+@lru_cache(maxsize=65536)
+def classify_word(user_word: str, correct_word: str) -> str:
+    """Classifies the mistake in a single word. Returns '' when the words match."""
+    user_word = _normalize(user_word)
+    correct_word = _normalize(correct_word)
+    if user_word == correct_word:
+        return ""
+
+    user_base = strip_accents(user_word)
+    correct_base = strip_accents(correct_word)
+    if user_base == correct_base:
+        return ACCENT
+    if user_base in DETERMINERS and correct_base in DETERMINERS:
+        return AGREEMENT
+
+    prefix = _common_prefix(user_base, correct_base)
+    suffix = _common_suffix(user_base, correct_base, prefix)
+
+    # Shared stem with a different ending: inflection error
+    if suffix == 0 and prefix >= 2:
+        if _is_agreement(user_base[prefix:], correct_base[prefix:]):
+            return AGREEMENT
+        if _is_typo(user_base, correct_base) and len(correct_base) > 4:
+            return TYPO
+        return ENDING
+
+    if _is_typo(user_base, correct_base):
+        return TYPO
+    # The words differ inside their endings rather than at the very end
+    if _is_ending_swap(user_base, correct_base):
+        return ENDING
+
+    # Little in common at all: a different word rather than a misspelling
+    similarity = SequenceMatcher(None, user_base, correct_base, autojunk=False).ratio()
+    if similarity < 0.5:
+        return OTHER
+    return STEM
+
+
+def _tokenize(text: str) -> List[str]:
+    return [token.strip(".,;:!?¡¿\"'()") for token in _normalize(text).split()]
+
+
+def classify_answer(user_answer: str, correct_answer: str) -> List[Dict[str, str]]:
+    """
+    Aligns a (possibly multi-word) answer against the correct one and tags
+    each differing word with an error category.
+    """
+    user_tokens = _tokenize(user_answer)
+    correct_tokens = _tokenize(correct_answer)
+    errors = []
+
+    matcher = SequenceMatcher(None, user_tokens, correct_tokens, autojunk=False)
+    for tag, u_start, u_end, c_start, c_end in matcher.get_opcodes():
+        if tag == "equal":
+            continue
+        user_span = user_tokens[u_start:u_end]
+        correct_span = correct_tokens[c_start:c_end]
+
+        if tag == "replace" and len(user_span) == len(correct_span):
+            for user_word, correct_word in zip(user_span, correct_span):
+                category = classify_word(user_word, correct_word)
+                if category:
+                    errors.append({"category": category, "user": user_word, "correct": correct_word})
+        else:
+            # Inserted, missing or re-ordered words
+            errors.append({
+                "category": OTHER,
+                "user": " ".join(user_span),
+                "correct": " ".join(correct_span)
+            })
+
+    return errors
+
+
+def primary_category(errors: List[Dict[str, str]]) -> str:
+    """Returns the single most relevant category of classify_answer's errors, or '' if there are none."""
+    if not errors:
+        return ""
+    categories = [error["category"] for error in errors]
+    for category in (ENDING, AGREEMENT, STEM, ACCENT, TYPO, OTHER):
+        if category in categories:
+            return category
+    return OTHER
+
+
+def classify_bulk(pairs: Iterable[Tuple[str, str]]) -> List[str]:
+    """Classifies many (user_answer, correct_answer) pairs without any LLM call."""
+    return [primary_category(classify_answer(user_answer, correct_answer)) for user_answer, correct_answer in pairs]
+
+
+def weaknesses_from_categories(categories: Iterable[str]) -> List[str]:
+    """Maps error categories to UserProfile.weaknesses labels, most frequent first."""
+    counts: Dict[str, int] = {}
+    for category in categories:
+        if category:
+            counts[category] = counts.get(category, 0) + 1
+    ranked = sorted(counts, key=lambda category: -counts[category])
+    return [WEAKNESS_LABELS[category] for category in ranked]
@@ -3,11 +3,28 @@ from langchain.tools import Tool
 from langchain.agents import AgentExecutor, create_openai_functions_agent
 from langchain_openai import ChatOpenAI
 from models import UserProfile
+from exercise_bank import ExerciseBank
+from scheduler import SchedulerStore, SpacedRepetitionScheduler
+from irt import ItemPicker
+from prompts import assemble_prompt, PROMPT_CACHE_STATS
+from config import IRT_PICK_CANDIDATES, IRT_PICKER_REFRESH_SECONDS
 import json
 import random
+import threading
 import time
 import logging
 
+# Exercise types used when the caller doesn't choose them (e.g. through the orchestrator's bandit)
+DEFAULT_EXERCISE_TYPES = ("Vocabulary", "Grammar")
+# What to ask for, for the types without a dedicated generator
+TYPE_INSTRUCTIONS = {
+    "Conversation": "Write one line a native speaker might say in a situation about '{theme}', "
+                    "and ask which reply fits best.",
+    "Reading": "Write a short passage (2-4 sentences) about '{theme}' and ask one comprehension "
+               "question about it; put the passage in the question.",
+    "Multiple Choice": "Write a multiple choice question testing a common expression about '{theme}'.",
+}
+
 # Set up logging
 logging.basicConfig(
     filename="exercise_generation.log",
@@ -18,8 +35,16 @@ logging.basicConfig(
 
 
 class ExerciseGeneratorAgent:
-    def __init__(self, llm: ChatOpenAI):
+    def __init__(self, llm: ChatOpenAI, bank: ExerciseBank = None, schedulers: SchedulerStore = None):
         self.llm = llm
+        self.bank = bank
+        self.schedulers = schedulers
+        # (language, exercise type) -> (built at, ItemPicker over the calibrated exercises)
+        self.pickers = {}
+        # Running total of LLM tokens spent
+        self.tokens_used = 0
+        # Tokens of the generation running on this thread; workers generate in parallel
+        self.generation = threading.local()
         
         # Define tools
         self.tools = [
@@ -28,8 +53,8 @@ class ExerciseGeneratorAgent:
         
         # Define prompt
         self.prompt = ChatPromptTemplate.from_messages([
-            ("system", """You are an expert language exercise creator for {target_language}.
-            Design engaging exercises suitable for {difficulty_level} learners.
+            ("system", """You are an expert language exercise creator.
+            Design engaging exercises suitable for the learner's level.
             Tailor them based on the user's learning focus and past interactions.
             
             **STRICT RULES:**
@@ -40,6 +65,8 @@ class ExerciseGeneratorAgent:
             - If the JSON is invalid, **think step by step** and regenerate it.
 
             **If your response contains any invalid JSON, retry until it is correct.**"""),
+            # Volatile values after the shared instructions, so the prefix stays cacheable
+            ("system", "Target language: {target_language}\nLearner level: {difficulty_level}"),
             ("user", "{input}"),
             ("assistant", "{agent_scratchpad}")
         ])
@@ -48,6 +75,19 @@ class ExerciseGeneratorAgent:
         self.agent = create_openai_functions_agent(llm, self.tools, self.prompt)
         self.agent_executor = AgentExecutor(agent=self.agent, tools=self.tools, verbose=True)
     
+    def invoke_llm(self, prompt: str):
+        """Calls the LLM and adds the reported (or estimated) token usage to `tokens_used` and this thread's generation."""
+        response = self.llm.invoke(prompt)
+        PROMPT_CACHE_STATS.record("exercise", response)
+        usage = getattr(response, "usage_metadata", None) or {}
+        tokens = usage.get("total_tokens")
+        if tokens is None:
+            content = response.content if hasattr(response, "content") else str(response)
+            tokens = (len(prompt) + len(content)) // 4
+        self.tokens_used += tokens
+        self.generation.tokens = getattr(self.generation, "tokens", 0) + tokens
+        return response
+
     def generate_valid_exercise(self, generation_func, *args, **kwargs):
         """
         Uses ReAct-style reasoning to ensure exercises are valid JSON.
@@ -85,7 +125,7 @@ class ExerciseGeneratorAgent:
             **Identify the issue** and regenerate a corrected JSON.
             """
             
-            corrected_response = self.llm.invoke(react_prompt)
+            corrected_response = self.invoke_llm(react_prompt)
             
             try:
                 corrected_exercise = json.loads(
@@ -104,7 +144,8 @@ class ExerciseGeneratorAgent:
         return None
 
     
-    def generate_exercises(self, user_profile):
+    def generate_exercises(self, user_profile, exercise_types: list = DEFAULT_EXERCISE_TYPES):
+        """One exercise per entry of `exercise_types` (see EXERCISE_TYPES), banked ones first."""
         exercise_prompt= f"""
         You are an AI language tutor generating language exercises. 
 
@@ -125,9 +166,11 @@ class ExerciseGeneratorAgent:
             "Advanced": ["Politics", "Environment", "Technology", "Literature", "Philosophy"]
         }
 
-        # Select a random theme based on the user's difficulty level
+        scheduler = self.schedulers.get(user_profile.user_id) if self.schedulers else None
+
+        # Select a theme based on the user's difficulty level, preferring ones due for review
         if user_profile.difficulty_level in themes:
-            theme = random.choice(themes[user_profile.difficulty_level])
+            theme = self.select_item(scheduler, "theme", themes[user_profile.difficulty_level])
         else:
             theme = "General"
 
@@ -174,60 +217,157 @@ class ExerciseGeneratorAgent:
 
 
         if user_profile.difficulty_level in grammar_topic:
-            grammar_topic = random.choice(grammar_topic[user_profile.difficulty_level])
+            grammar_topic = self.select_item(scheduler, "grammar_topic", grammar_topic[user_profile.difficulty_level])
         else:
             grammar_topic = "Nouns and Pronouns"
 
         print(f"DEBUG: Selected Grammar Topic = {grammar_topic}")  # Debugging
 
-        # Generate Vocabulary Exercise
-        # vocab_exercise = self.generate_vocabulary_exercise(user_profile.difficulty_level, user_profile.target_language, theme)
-        # if isinstance(vocab_exercise, dict):  # Ensure valid JSON
-        #     exercises.append(vocab_exercise)
-        
-        vocab_exercise = self.generate_valid_exercise(
-                    self.generate_vocabulary_exercise,
-                    user_profile.difficulty_level,
-                    user_profile.target_language,
-                    theme
-                )
-        if isinstance(vocab_exercise, dict):
-            exercises.append(vocab_exercise)
-
-
-        # Generate Grammar Exercise
-        grammar_exercise = self.generate_valid_exercise(
-            self.generate_grammar_exercise,
-            user_profile.difficulty_level, 
-            user_profile.target_language, 
-            grammar_topic)
-        if isinstance(grammar_exercise, dict):  # Ensure valid JSON
-            exercises.append(grammar_exercise)
-        
-        print("DEBUG: General exercises =", exercises)
+        for exercise_type in exercise_types:
+            exercise = self.exercise_of_type(scheduler, user_profile, exercise_type, theme, grammar_topic)
+            if isinstance(exercise, dict):
+                exercises.append(exercise)
 
         return exercises
 
-        
-    
+    def exercise_of_type(self, scheduler: SpacedRepetitionScheduler, user_profile: UserProfile,
+                         exercise_type: str, theme: str, grammar_topic: str):
+        """A banked exercise of the type if one is due or unseen, otherwise a newly generated (and banked) one."""
+        # Grammar exercises are organised by grammar topic, every other type by theme
+        if exercise_type == "Grammar":
+            tags = {"grammar_topic": grammar_topic}
+            generation = (self.generate_grammar_exercise, grammar_topic)
+        elif exercise_type == "Vocabulary":
+            tags = {"theme": theme}
+            generation = (self.generate_vocabulary_exercise, theme)
+        else:
+            tags = {"theme": theme}
+            generation = (self.generate_typed_exercise, theme, exercise_type)
+
+        # Reuse a banked exercise that is due for review before paying for a new one
+        exercise = self.banked_exercise(scheduler, user_profile, exercise_type, **tags)
+        if exercise is not None:
+            return exercise
+
+        self.generation.tokens = 0
+        generation_func, *args = generation
+        exercise = self.generate_valid_exercise(generation_func, user_profile.difficulty_level,
+                                                user_profile.target_language, *args)
+        if isinstance(exercise, dict):
+            exercise.update({"exercise_type": exercise_type, **tags, "tokens": self.generation.tokens})
+            self.store_exercise(exercise, user_profile)
+        return exercise
+
+    def select_item(self, scheduler: SpacedRepetitionScheduler, kind: str, candidates: list) -> str:
+        """Picks a theme/topic that is due for review, then an unseen one, then any at random."""
+        if scheduler is not None:
+            picked = scheduler.pick(kind, [f"{kind}:{candidate}" for candidate in candidates])
+            if picked:
+                return picked.split(":", 1)[1]
+        return random.choice(candidates)
+
+    def banked_exercise(self, scheduler: SpacedRepetitionScheduler, user_profile: UserProfile,
+                        exercise_type: str, theme: str = None, grammar_topic: str = None):
+        """Returns a due review exercise, or an unseen banked one for the topic, or None."""
+        if self.bank is None:
+            return None
+
+        if scheduler is not None:
+            review_kind = f"exercise:{user_profile.target_language}:{exercise_type}"
+            for item_id in scheduler.due(review_kind, limit=1):
+                exercise = self.bank.get(item_id.split(":", 1)[1])
+                if exercise is not None:
+                    exercise["tokens"] = 0
+                    return exercise
+
+        seen = (lambda exercise_id: f"exercise:{exercise_id}" in scheduler) if scheduler is not None else None
+        calibrated = self.calibrated_exercise(user_profile, exercise_type, seen, theme, grammar_topic)
+        if calibrated is not None:
+            calibrated["tokens"] = 0
+            return calibrated
+        banked = self.bank.find(user_profile.target_language, user_profile.difficulty_level,
+                                exercise_type=exercise_type, theme=theme, grammar_topic=grammar_topic, skip=seen)
+        if not banked:
+            return None
+        banked[0]["tokens"] = 0  # Reused, so no LLM tokens spent
+        return banked[0]
+
+    def item_picker(self, language: str, exercise_type: str) -> ItemPicker:
+        built_at, picker = self.pickers.get((language, exercise_type), (0.0, None))
+        if picker is None or time.time() - built_at > IRT_PICKER_REFRESH_SECONDS:
+            picker = ItemPicker.from_bank(self.bank, language, exercise_type)
+            self.pickers[(language, exercise_type)] = (time.time(), picker)
+        return picker
+
+    def calibrated_exercise(self, user_profile: UserProfile, exercise_type: str, seen=None,
+                            theme: str = None, grammar_topic: str = None):
+        """The unseen calibrated exercise most informative at the learner's fitted ability, or None."""
+        ability = self.bank.get_ability(user_profile.user_id)
+        if ability is None:
+            return None
+        picker = self.item_picker(user_profile.target_language, exercise_type)
+        for exercise_id in picker.pick_items(ability, IRT_PICK_CANDIDATES):
+            if seen is not None and seen(exercise_id):
+                continue
+            exercise = self.bank.get(exercise_id)
+            if exercise is None or (theme and exercise.get("theme") != theme) \
+                    or (grammar_topic and exercise.get("grammar_topic") != grammar_topic):
+                continue
+            return exercise
+        return None
+
+    def fallback_exercises(self, user_profile: UserProfile, exercise_types: list = DEFAULT_EXERCISE_TYPES,
+                           count: int = None) -> list:
+        """
+        Up to `count` (default: one per type) banked exercises, for when the LLM
+        can't be used: due or unseen ones of the types first, then any at the level.
+        """
+        if self.bank is None:
+            return []
+        count = len(exercise_types) if count is None else count
+        scheduler = self.schedulers.get(user_profile.user_id) if self.schedulers else None
+        exercises = []
+        for exercise_type in exercise_types:
+            if len(exercises) >= count:
+                break
+            exercise = self.banked_exercise(scheduler, user_profile, exercise_type)
+            if exercise is not None:
+                exercises.append(exercise)
+        if len(exercises) < count:
+            chosen = {exercise.get("id") for exercise in exercises}
+            for exercise in self.bank.find(user_profile.target_language, user_profile.difficulty_level,
+                                           skip=lambda exercise_id: exercise_id in chosen,
+                                           limit=count - len(exercises)):
+                exercise["tokens"] = 0
+                exercises.append(exercise)
+        return exercises
+
+    def store_exercise(self, exercise: dict, user_profile: UserProfile) -> None:
+        """Adds a freshly generated exercise to the bank so it can be reused later."""
+        if self.bank is not None:
+            self.bank.add(exercise, user_profile.target_language, user_profile.difficulty_level)
+
     def generate_vocabulary_exercise(self, difficulty: str, target_language: str, theme: str = "Everyday Conversation", count: int = 2,) -> dict:
         """Generates a vocabulary exercise with translations and example sentences in the target language."""
-        prompt = f"""Generate {count} vocabulary words in {target_language} for 
-        {difficulty} level learners based on the theme '{theme}'. 
-        Format your responses as valid JSON:
-
-        {{
-            "type": "single_choice",
-            "question": "Translate 'hello' to {target_language}",
-            "options": ["Hola", "Bonjour", "Ciao", "Hallo"],
-            "correctAnswer": "Hola",
-            "explanation": "'Hola' means 'hello' in Spanish."
-        }}
-
-        Ensure the response is always valid JSON.
-        """
+        prompt = assemble_prompt(
+            """You write vocabulary exercises for language learners.
+            Format your responses as valid JSON, like this example:
+
+            {
+                "type": "single_choice",
+                "question": "Translate 'hello' to Spanish",
+                "options": ["Hola", "Bonjour", "Ciao", "Hallo"],
+                "correctAnswer": "Hola",
+                "explanation": "'Hola' means 'hello' in Spanish."
+            }
+
+            Ensure the response is always valid JSON.""",
+            language=f"Target language: {target_language}",
+            user=f"Learner level: {difficulty}",
+            turn=f"Generate {count} vocabulary words based on the theme '{theme}'."
+        )
         
-        response = self.llm.invoke(prompt)
+        response = self.invoke_llm(prompt)
 
         # Ensure JSON parsing
         try:
@@ -241,22 +381,26 @@ class ExerciseGeneratorAgent:
     
     def generate_grammar_exercise(self, difficulty: str, target_language: str, grammar_topic: str = "Verb Conjugation") -> dict:
         """Generates a grammar exercise based on the target language and grammar topic."""
-        prompt = f"""Generate a grammar exercise for {difficulty} level learners in {target_language} 
-        on the topic '{grammar_topic}'. Provide the response as **valid JSON** in the following format:
-
-        {{
-            "type": "single_choice",
-            "question": "Choose the correct conjugation of the verb 'ser' (to be) for 'yo' (I):",
-            "options": ["soy", "eres", "es", "somos"],
-            "correctAnswer": "soy",
-            "explanation": "'Soy' is the correct conjugation of 'ser' for the first-person singular pronoun 'yo'."
-        }}
-
-        Ensure the JSON response is valid and does not contain extra text.
-        Always ensure to provide an English explanation in the Json. 
-        """
+        prompt = assemble_prompt(
+            """You write grammar exercises for language learners.
+            Provide the response as **valid JSON** in the following format:
+
+            {
+                "type": "single_choice",
+                "question": "Choose the correct conjugation of the verb 'ser' (to be) for 'yo' (I):",
+                "options": ["soy", "eres", "es", "somos"],
+                "correctAnswer": "soy",
+                "explanation": "'Soy' is the correct conjugation of 'ser' for the first-person singular pronoun 'yo'."
+            }
 
-        response = self.llm.invoke(prompt)
+            Ensure the JSON response is valid and does not contain extra text.
+            Always ensure to provide an English explanation in the Json.""",
+            language=f"Target language: {target_language}",
+            user=f"Learner level: {difficulty}",
+            turn=f"Generate a grammar exercise on the topic '{grammar_topic}'."
+        )
+
+        response = self.invoke_llm(prompt)
 
         # Ensure response is valid JSON
         try:
@@ -268,30 +412,59 @@ class ExerciseGeneratorAgent:
             return {"error": "Invalid JSON returned from LLM"}
 
     
+    def generate_typed_exercise(self, difficulty: str, target_language: str, theme: str, exercise_type: str) -> dict:
+        """Generates a single-question exercise of one of the TYPE_INSTRUCTIONS types."""
+        prompt = assemble_prompt(
+            """You write exercises for language learners.
+            Provide the response as **valid JSON** in the following format:
+
+            {
+                "type": "single_choice",
+                "question": "...",
+                "options": ["...", "...", "...", "..."],
+                "correctAnswer": "...",
+                "explanation": "..."
+            }
+
+            The question may be in the target language; the explanation is in English.
+            Ensure the JSON response is valid and does not contain extra text.""",
+            language=f"Target language: {target_language}",
+            user=f"Learner level: {difficulty}",
+            turn=TYPE_INSTRUCTIONS[exercise_type].format(theme=theme)
+        )
+        response = self.invoke_llm(prompt)
+        try:
+            return json.loads(response.content if hasattr(response, "content") else str(response))
+        except json.JSONDecodeError as e:
+            print(f"Error decoding JSON: {e}")
+            return {"error": "Invalid JSON returned from LLM"}
+
     def generate_conversation_exercise(self, difficulty: str, target_language: str, scenario: str) -> dict:
         """Generates a conversation role-play exercise in the target language."""
 
-        prompt = f"""Create a role-play conversation exercise in {target_language} 
-        for a {difficulty} level learner. The scenario is '{scenario}'.
-
-        Return a JSON object with the following structure:
-        {{
-        "scenario": "{scenario}",
-        "context": "[Optional brief context or setting]",
-        "dialogue": [
-            {{"speaker": "Person A", "text": "[Line in {target_language}]", "translation": "[English translation]"}},
-            {{"speaker": "You", "text": "[Suggested response in {target_language}]", "translation": "[English translation]"}},
-            // ... more dialogue turns
-        ],
-        "questions": [
-            {{"prompt": "[Question about the dialogue]", "answer": "[Expected answer]"}},
-            // ... more questions
-        ]
-        }}
+        prompt = assemble_prompt(
+            """You write role-play conversation exercises for language learners.
+            Return a JSON object with the following structure:
+            {
+            "scenario": "[The scenario]",
+            "context": "[Optional brief context or setting]",
+            "dialogue": [
+                {"speaker": "Person A", "text": "[Line in the target language]", "translation": "[English translation]"},
+                {"speaker": "You", "text": "[Suggested response in the target language]", "translation": "[English translation]"},
+                // ... more dialogue turns
+            ],
+            "questions": [
+                {"prompt": "[Question about the dialogue]", "answer": "[Expected answer]"},
+                // ... more questions
+            ]
+            }
 
-        Only include the JSON, no additional text.
-        """
-        response = self.llm.invoke(prompt)
+            Only include the JSON, no additional text.""",
+            language=f"Target language: {target_language}",
+            user=f"Learner level: {difficulty}",
+            turn=f"The scenario is '{scenario}'."
+        )
+        response = self.invoke_llm(prompt)
         try:
             return json.loads(response.content if hasattr(response, "content") else str(response))
         except json.JSONDecodeError as e:
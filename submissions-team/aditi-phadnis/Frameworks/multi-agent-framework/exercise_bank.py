@@ -0,0 +1,158 @@
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+from typing import Callable, Dict, Any, List, Optional
+from config import EXERCISE_BANK_PATH
+
+
+class ExerciseBank:
+    """SQLite-backed store of generated exercises, so they can be reused instead of regenerated."""
+
+    def __init__(self, path: str = EXERCISE_BANK_PATH):
+        self.path = path
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.row_factory = sqlite3.Row
+        self.lock = threading.Lock()
+        with self.lock, self.conn:
+            self.conn.execute("""
+                CREATE TABLE IF NOT EXISTS exercises (
+                    id TEXT PRIMARY KEY,
+                    language TEXT NOT NULL,
+                    difficulty TEXT NOT NULL,
+                    exercise_type TEXT,
+                    theme TEXT,
+                    grammar_topic TEXT,
+                    payload TEXT NOT NULL,
+                    created_at REAL NOT NULL
+                )
+            """)
+            self.conn.execute(
+                "CREATE INDEX IF NOT EXISTS idx_exercises_lookup "
+                "ON exercises (language, difficulty, exercise_type, theme, grammar_topic)"
+            )
+            self.conn.execute("""
+                CREATE TABLE IF NOT EXISTS responses (
+                    user_id TEXT NOT NULL,
+                    exercise_id TEXT NOT NULL,
+                    correct INTEGER NOT NULL,
+                    answered_at REAL NOT NULL
+                )
+            """)
+            self.conn.execute("""
+                CREATE TABLE IF NOT EXISTS abilities (
+                    user_id TEXT PRIMARY KEY,
+                    ability REAL NOT NULL,
+                    updated_at REAL NOT NULL
+                )
+            """)
+            # Calibrated item parameters, added to banks created before calibration existed
+            columns = {row["name"] for row in self.conn.execute("PRAGMA table_info(exercises)")}
+            for column, column_type in (("irt_difficulty", "REAL"), ("irt_discrimination", "REAL"),
+                                        ("calibrated_level", "TEXT")):
+                if column not in columns:
+                    self.conn.execute(f"ALTER TABLE exercises ADD COLUMN {column} {column_type}")
+
+    @staticmethod
+    def exercise_id(exercise: Dict[str, Any], language: str) -> str:
+        """Stable id derived from the language and question text."""
+        key = f"{language}|{exercise.get('question', json.dumps(exercise, sort_keys=True))}"
+        return hashlib.sha1(key.encode("utf-8")).hexdigest()[:16]
+
+    def add(self, exercise: Dict[str, Any], language: str, difficulty: str) -> str:
+        """Stores an exercise (idempotently) and returns its id."""
+        exercise_id = exercise.get("id") or self.exercise_id(exercise, language)
+        exercise["id"] = exercise_id
+        with self.lock, self.conn:
+            self.conn.execute(
+                "INSERT OR IGNORE INTO exercises "
+                "(id, language, difficulty, exercise_type, theme, grammar_topic, payload, created_at) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (exercise_id, language, difficulty, exercise.get("exercise_type"), exercise.get("theme"),
+                 exercise.get("grammar_topic"), json.dumps(exercise, ensure_ascii=False), time.time())
+            )
+        return exercise_id
+
+    def get(self, exercise_id: str) -> Optional[Dict[str, Any]]:
+        with self.lock:
+            row = self.conn.execute("SELECT payload FROM exercises WHERE id = ?", (exercise_id,)).fetchone()
+        return json.loads(row["payload"]) if row else None
+
+    def find(self, language: str, difficulty: str, exercise_type: str = None, theme: str = None,
+             grammar_topic: str = None, skip: Callable[[str], bool] = None, limit: int = 1) -> List[Dict[str, Any]]:
+        """Returns banked exercises matching the filters, skipping ids for which `skip` is true."""
+        # A calibrated level (irt.py) overrides the level the exercise was generated for
+        query = "SELECT id, payload FROM exercises WHERE language = ? AND COALESCE(calibrated_level, difficulty) = ?"
+        params: list = [language, difficulty]
+        for column, value in (("exercise_type", exercise_type), ("theme", theme), ("grammar_topic", grammar_topic)):
+            if value is not None:
+                query += f" AND {column} = ?"
+                params.append(value)
+
+        results = []
+        with self.lock:
+            for row in self.conn.execute(query, params):
+                if skip is not None and skip(row["id"]):
+                    continue
+                results.append(json.loads(row["payload"]))
+                if len(results) >= limit:
+                    break
+        return results
+
+    def record_response(self, user_id: str, exercise_id: str, correct: bool) -> None:
+        """Logs one graded answer for offline difficulty calibration."""
+        with self.lock, self.conn:
+            self.conn.execute(
+                "INSERT INTO responses (user_id, exercise_id, correct, answered_at) VALUES (?, ?, ?, ?)",
+                (user_id, exercise_id, int(bool(correct)), time.time())
+            )
+
+    def iter_responses(self, batch_size: int = 100000):
+        """Yields (user_id, exercise_id, correct) batches straight from the cursor."""
+        with self.lock:
+            cursor = self.conn.execute("SELECT user_id, exercise_id, correct FROM responses")
+        while True:
+            # The connection is shared, so each batch is read under the lock
+            with self.lock:
+                rows = cursor.fetchmany(batch_size)
+            if not rows:
+                break
+            yield rows
+
+    def update_item_parameters(self, rows: List[tuple]) -> None:
+        """Writes (exercise_id, difficulty, discrimination, level) rows from a calibration run."""
+        with self.lock, self.conn:
+            self.conn.executemany(
+                "UPDATE exercises SET irt_difficulty = ?, irt_discrimination = ?, calibrated_level = ? WHERE id = ?",
+                [(difficulty, discrimination, level, exercise_id)
+                 for exercise_id, difficulty, discrimination, level in rows]
+            )
+
+    def update_abilities(self, rows: List[tuple]) -> None:
+        """Writes (user_id, ability) rows from a calibration run."""
+        now = time.time()
+        with self.lock, self.conn:
+            self.conn.executemany(
+                "INSERT OR REPLACE INTO abilities (user_id, ability, updated_at) VALUES (?, ?, ?)",
+                [(user_id, ability, now) for user_id, ability in rows]
+            )
+
+    def get_ability(self, user_id: str) -> Optional[float]:
+        with self.lock:
+            row = self.conn.execute("SELECT ability FROM abilities WHERE user_id = ?", (user_id,)).fetchone()
+        return row["ability"] if row else None
+
+    def calibrated_items(self, language: str = None, exercise_type: str = None) -> List[tuple]:
+        """Returns (exercise_id, difficulty, discrimination) for every calibrated exercise."""
+        query = "SELECT id, irt_difficulty, irt_discrimination FROM exercises WHERE irt_difficulty IS NOT NULL"
+        params = []
+        for column, value in (("language", language), ("exercise_type", exercise_type)):
+            if value is not None:
+                query += f" AND {column} = ?"
+                params.append(value)
+        with self.lock:
+            return [tuple(row) for row in self.conn.execute(query, params)]
+
+    def close(self) -> None:
+        self.conn.close()
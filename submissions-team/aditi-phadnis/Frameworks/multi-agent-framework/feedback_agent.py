@@ -1,8 +1,13 @@
+import json
+from typing import List
 from langchain.prompts import ChatPromptTemplate
 from langchain.tools import Tool
 from langchain.agents import AgentExecutor, create_openai_functions_agent
 from langchain_openai import ChatOpenAI
 from models import UserProfile
+from error_classifier import classify_answer, primary_category, weaknesses_from_categories
+from learner_stats import LearnerStats
+from prompts import assemble_prompt, PROMPT_CACHE_STATS
 
 class FeedbackAgent:
     def __init__(self, llm: ChatOpenAI):
@@ -51,6 +56,10 @@ class FeedbackAgent:
         for question, correct_info in correct_answers.items():
             user_answer = user_answers.get(question, "").strip().lower()
 
+            # Allow plain answer keys as well as {"correctAnswer": ..., "explanation": ...}
+            if isinstance(correct_info, str):
+                correct_info = {"correctAnswer": correct_info}
+
             # Ensure correct_info is a valid dictionary
             if not correct_info or not isinstance(correct_info, dict):
                 feedback[question] = {
@@ -61,7 +70,7 @@ class FeedbackAgent:
                 continue
 
             # Extract values safely
-            correct_answer = correct_info.get("correctAnswer")
+            correct_answer = correct_info.get("correctAnswer") or correct_info.get("correct_answer")
             explanation = correct_info.get("explanation", "No explanation available.")
 
             if not correct_answer:
@@ -79,12 +88,41 @@ class FeedbackAgent:
                     "explanation": explanation
                 }
             else:
+                errors = classify_answer(user_answer, correct_answer)
                 feedback[question] = {
                     "correct": False,
                     "message": f"❌ Incorrect. Correct answer: {correct_answer}",
-                    "explanation": explanation
+                    "explanation": explanation,
+                    "error_category": primary_category(errors),
+                    "errors": errors
                 }
 
         return feedback
 
+    def update_weaknesses(self, user_profile: UserProfile, feedback: dict) -> List[str]:
+        """Adds weaknesses derived from the tagged error categories, without an LLM call."""
+        categories = [item.get("error_category", "") for item in feedback.values() if isinstance(item, dict)]
+        new_weaknesses = weaknesses_from_categories(categories)
+        for weakness in new_weaknesses:
+            if weakness not in user_profile.weaknesses:
+                user_profile.weaknesses.append(weakness)
+        return new_weaknesses
+
+    def analyze_user_progress(self, stats: LearnerStats, user_profile: UserProfile, narrate: bool = False) -> dict:
+        """Reports progress from the incremental statistics store; the LLM is only used to narrate."""
+        summary = stats.summary()
+        analysis = {"type": "progress_analysis", "stats": summary}
+
+        if narrate and summary["answers"]:
+            prompt = assemble_prompt(
+                """You are a supportive language tutor. Describe the learner's progress
+                in 3-4 sentences, using only the numbers given below.""",
+                language=f"Target language: {user_profile.target_language}",
+                user=f"Learner level: {user_profile.difficulty_level}\n"
+                     f"Statistics: {json.dumps(summary, ensure_ascii=False)}"
+            )
+            response = self.llm.invoke(prompt)
+            PROMPT_CACHE_STATS.record("feedback", response)
+            analysis["content"] = response.content if hasattr(response, "content") else str(response)
 
+        return analysis
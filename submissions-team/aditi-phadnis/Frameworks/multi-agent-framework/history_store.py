@@ -0,0 +1,151 @@
+import argparse
+import json
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+from typing import Dict, Any, List, Optional, Tuple
+from config import HISTORY_STORE_PATH
+
+# History kinds kept per user; each maps to a UserProfile `<kind>_history` field
+HISTORY_KINDS = ["conversation", "exercise", "feedback"]
+
+
+class HistoryStore:
+    """
+    Append-only SQLite (WAL) log of conversation, exercise and feedback history.
+    Rows are keyed by (user_id, kind, seq), so appending a turn and reading the
+    last N turns of one user are both index operations, whatever the history size.
+    """
+
+    def __init__(self, path: str = HISTORY_STORE_PATH):
+        self.path = path
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.lock = threading.Lock()
+        # (user_id, kind) -> next sequence number, read once per user from the index
+        self.next_seq: Dict[Tuple[str, str], int] = {}
+        with self.lock, self.conn:
+            self.conn.execute("PRAGMA journal_mode=WAL")
+            # WAL commits are durable across process crashes at this level
+            self.conn.execute("PRAGMA synchronous=NORMAL")
+            self.conn.execute("""
+                CREATE TABLE IF NOT EXISTS history (
+                    user_id TEXT NOT NULL,
+                    kind TEXT NOT NULL,
+                    seq INTEGER NOT NULL,
+                    payload TEXT NOT NULL,
+                    created_at REAL NOT NULL,
+                    PRIMARY KEY (user_id, kind, seq)
+                ) WITHOUT ROWID
+            """)
+
+    def _next_seq(self, user_id: str, kind: str) -> int:
+        key = (user_id, kind)
+        seq = self.next_seq.get(key)
+        if seq is None:
+            row = self.conn.execute("SELECT MAX(seq) FROM history WHERE user_id = ? AND kind = ?",
+                                    (user_id, kind)).fetchone()
+            seq = self.next_seq[key] = (row[0] + 1) if row[0] is not None else 0
+        return seq
+
+    def append(self, user_id: str, kind: str, entry: Dict[str, Any]) -> int:
+        """Appends one entry and returns its sequence number."""
+        return self.append_many(user_id, kind, [entry])[0]
+
+    def append_many(self, user_id: str, kind: str, entries: List[Dict[str, Any]]) -> List[int]:
+        """Appends entries in a single transaction."""
+        now = time.time()
+        with self.lock, self.conn:
+            start = self._next_seq(user_id, kind)
+            rows = [(user_id, kind, start + offset, json.dumps(entry, ensure_ascii=False), now)
+                    for offset, entry in enumerate(entries)]
+            self.conn.executemany(
+                "INSERT INTO history (user_id, kind, seq, payload, created_at) VALUES (?, ?, ?, ?, ?)", rows
+            )
+            self.next_seq[(user_id, kind)] = start + len(entries)
+        return [row[2] for row in rows]
+
+    def count(self, user_id: str, kind: str) -> int:
+        with self.lock:
+            return self._next_seq(user_id, kind)
+
+    def recent(self, user_id: str, kind: str, limit: int, before: Optional[int] = None) -> List[Dict[str, Any]]:
+        """
+        Returns up to `limit` entries in chronological order, ending just before
+        sequence number `before` (default: the latest entry).
+        """
+        query = "SELECT payload FROM history WHERE user_id = ? AND kind = ?"
+        params: list = [user_id, kind]
+        if before is not None:
+            query += " AND seq < ?"
+            params.append(before)
+        query += " ORDER BY seq DESC LIMIT ?"
+        params.append(limit)
+        with self.lock:
+            rows = self.conn.execute(query, params).fetchall()
+        return [json.loads(row[0]) for row in reversed(rows)]
+
+    def iter_history(self, user_id: str, kind: str, batch_size: int = 1000):
+        """Yields every entry of one history in order, one batch at a time."""
+        cursor = self.conn.execute("SELECT payload FROM history WHERE user_id = ? AND kind = ? ORDER BY seq",
+                                   (user_id, kind))
+        while True:
+            rows = cursor.fetchmany(batch_size)
+            if not rows:
+                break
+            for row in rows:
+                yield json.loads(row[0])
+
+    def close(self) -> None:
+        self.conn.close()
+
+
+def benchmark(turns: int = 100000, recent: int = 50, path: str = None) -> Dict[str, Any]:
+    """Append throughput (per-turn commits) and cold-load latency of the last `recent` turns."""
+    directory = None
+    if path is None:
+        directory = tempfile.mkdtemp()
+        path = os.path.join(directory, "history_benchmark.db")
+
+    store = HistoryStore(path)
+    entry = {"user": "¿Dónde está la biblioteca?", "agent": "La biblioteca está al lado del parque."}
+    started = time.perf_counter()
+    for _ in range(turns):
+        store.append("benchmark-user", "conversation", entry)
+    append_seconds = time.perf_counter() - started
+    store.close()
+
+    # A fresh connection, as after a restart
+    started = time.perf_counter()
+    store = HistoryStore(path)
+    total = store.count("benchmark-user", "conversation")
+    last = store.recent("benchmark-user", "conversation", recent)
+    cold_load_ms = (time.perf_counter() - started) * 1000
+    store.close()
+
+    size_mb = os.path.getsize(path) / 1e6
+    if directory is not None:
+        for name in os.listdir(directory):
+            os.remove(os.path.join(directory, name))
+        os.rmdir(directory)
+
+    return {
+        "turns": total,
+        "appends_per_second": round(turns / append_seconds),
+        "cold_load_ms": round(cold_load_ms, 3),
+        "loaded_entries": len(last),
+        "db_mb": round(size_mb, 1),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the append-only history store.")
+    parser.add_argument("--turns", type=int, default=100000)
+    parser.add_argument("--recent", type=int, default=50)
+    args = parser.parse_args()
+    print(benchmark(args.turns, args.recent))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,304 @@
+import json
+import sqlite3
+import threading
+import time
+import uuid
+from collections import deque
+from typing import Callable, Dict, Any, Iterator, List, Optional
+from config import (JOB_QUEUE_PATH, JOB_MAX_ATTEMPTS, JOB_RETRY_BASE_SECONDS, JOB_LEASE_SECONDS,
+                    JOB_POLL_SECONDS)
+
+# Jobs in these states are finished and never picked up again
+TERMINAL_STATUSES = ("done", "dead")
+
+
+class JobQueue:
+    """
+    SQLite (WAL) job queue. A job is queued -> running -> done, or back to queued
+    with a backoff after a failure, and "dead" (the dead-letter queue) once it has
+    used up its attempts. Identical jobs share a dedup key: submitting one while
+    an equal job is still queued or running returns the existing job id.
+    """
+
+    def __init__(self, path: str = JOB_QUEUE_PATH):
+        self.path = path
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.row_factory = sqlite3.Row
+        self.lock = threading.Lock()
+        # Wakes in-process workers on submit; workers in other processes poll
+        self.available = threading.Condition()
+        with self.lock, self.conn:
+            self.conn.execute("PRAGMA journal_mode=WAL")
+            self.conn.execute("""
+                CREATE TABLE IF NOT EXISTS jobs (
+                    id TEXT PRIMARY KEY,
+                    kind TEXT NOT NULL,
+                    dedup_key TEXT,
+                    payload TEXT NOT NULL,
+                    status TEXT NOT NULL,
+                    attempts INTEGER NOT NULL DEFAULT 0,
+                    max_attempts INTEGER NOT NULL,
+                    result TEXT,
+                    error TEXT,
+                    created_at REAL NOT NULL,
+                    available_at REAL NOT NULL,
+                    started_at REAL,
+                    finished_at REAL,
+                    lease_expires REAL
+                )
+            """)
+            self.conn.execute("CREATE INDEX IF NOT EXISTS idx_jobs_ready ON jobs (status, available_at)")
+            # At most one unfinished job per dedup key
+            self.conn.execute(
+                "CREATE UNIQUE INDEX IF NOT EXISTS idx_jobs_dedup ON jobs (kind, dedup_key) "
+                "WHERE status IN ('queued', 'running') AND dedup_key IS NOT NULL"
+            )
+
+    def submit(self, kind: str, payload: Dict[str, Any], dedup_key: str = None,
+               max_attempts: int = JOB_MAX_ATTEMPTS) -> str:
+        """Queues a job and returns its id, or the id of an identical unfinished job."""
+        now = time.time()
+        job_id = uuid.uuid4().hex
+        with self.lock, self.conn:
+            if dedup_key is not None:
+                row = self.conn.execute(
+                    "SELECT id FROM jobs WHERE kind = ? AND dedup_key = ? AND status IN ('queued', 'running')",
+                    (kind, dedup_key)
+                ).fetchone()
+                if row is not None:
+                    return row["id"]
+            self.conn.execute(
+                "INSERT INTO jobs (id, kind, dedup_key, payload, status, max_attempts, created_at, available_at) "
+                "VALUES (?, ?, ?, ?, 'queued', ?, ?, ?)",
+                (job_id, kind, dedup_key, json.dumps(payload, ensure_ascii=False), max_attempts, now, now)
+            )
+        with self.available:
+            self.available.notify()
+        return job_id
+
+    def claim(self, kinds: List[str], lease_seconds: float = JOB_LEASE_SECONDS) -> Optional[Dict[str, Any]]:
+        """
+        Marks the oldest ready job of one of `kinds` as running and returns it.
+        A running job whose lease ran out (its worker died or hung) is claimed
+        again, or dead-lettered if it has no attempts left.
+        """
+        now = time.time()
+        placeholders = ", ".join("?" for _ in kinds)
+        with self.lock:
+            # IMMEDIATE takes the write lock up front, so two processes can't claim the same job
+            self.conn.execute("BEGIN IMMEDIATE")
+            try:
+                self.conn.execute(
+                    f"UPDATE jobs SET status = 'dead', error = 'Lease expired on the last attempt', finished_at = ?, "
+                    f"lease_expires = NULL WHERE kind IN ({placeholders}) AND status = 'running' "
+                    "AND lease_expires < ? AND attempts >= max_attempts",
+                    (now, *kinds, now)
+                )
+                row = self.conn.execute(
+                    f"SELECT * FROM jobs WHERE kind IN ({placeholders}) AND "
+                    "((status = 'queued' AND available_at <= ?) OR (status = 'running' AND lease_expires < ?)) "
+                    "ORDER BY available_at LIMIT 1",
+                    (*kinds, now, now)
+                ).fetchone()
+                if row is None:
+                    self.conn.execute("COMMIT")
+                    return None
+                self.conn.execute(
+                    "UPDATE jobs SET status = 'running', attempts = attempts + 1, started_at = ?, lease_expires = ? "
+                    "WHERE id = ?",
+                    (now, now + lease_seconds, row["id"])
+                )
+                self.conn.execute("COMMIT")
+            except BaseException:
+                self.conn.execute("ROLLBACK")
+                raise
+        job = self._to_dict(row)
+        job["attempts"] += 1
+        job["status"] = "running"
+        job["started_at"] = now
+        return job
+
+    def complete(self, job_id: str, attempt: int, result: Any) -> bool:
+        """
+        Stores the result of `attempt` (the claimed job's attempts). False if the
+        lease was lost meanwhile and the job was reclaimed; the result is then dropped.
+        """
+        with self.lock, self.conn:
+            cursor = self.conn.execute(
+                "UPDATE jobs SET status = 'done', result = ?, error = NULL, finished_at = ?, lease_expires = NULL "
+                "WHERE id = ? AND status = 'running' AND attempts = ?",
+                (json.dumps(result, ensure_ascii=False), time.time(), job_id, attempt)
+            )
+        return cursor.rowcount == 1
+
+    def fail(self, job_id: str, attempt: int, error: str, retry_base: float = JOB_RETRY_BASE_SECONDS) -> str:
+        """
+        Requeues the job with exponential backoff, or moves it to the dead-letter queue.
+        Returns the new status, or "lost" if `attempt` no longer owns the job.
+        """
+        now = time.time()
+        with self.lock, self.conn:
+            row = self.conn.execute(
+                "SELECT attempts, max_attempts FROM jobs WHERE id = ? AND status = 'running' AND attempts = ?",
+                (job_id, attempt)
+            ).fetchone()
+            if row is None:
+                return "lost"
+            if row["attempts"] >= row["max_attempts"]:
+                status, available_at = "dead", now
+            else:
+                status, available_at = "queued", now + retry_base * 2 ** (row["attempts"] - 1)
+            self.conn.execute(
+                "UPDATE jobs SET status = ?, error = ?, available_at = ?, finished_at = ?, lease_expires = NULL "
+                "WHERE id = ?",
+                (status, error, available_at, now if status == "dead" else None, job_id)
+            )
+        return status
+
+    def poll(self, job_id: str) -> Optional[Dict[str, Any]]:
+        """Current state of a job, with its result once done; None for an unknown id."""
+        with self.lock:
+            row = self.conn.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return self._to_dict(row) if row else None
+
+    def stream(self, job_id: str, interval: float = JOB_POLL_SECONDS,
+               timeout: float = None) -> Iterator[Dict[str, Any]]:
+        """Yields the job each time its status or attempt count changes, until it finishes."""
+        deadline = None if timeout is None else time.time() + timeout
+        last = None
+        while True:
+            job = self.poll(job_id)
+            if job is None:
+                return
+            state = (job["status"], job["attempts"])
+            if state != last:
+                last = state
+                yield job
+            if job["status"] in TERMINAL_STATUSES or (deadline is not None and time.time() >= deadline):
+                return
+            time.sleep(interval)
+
+    def wait(self, job_id: str, timeout: float = None) -> Optional[Dict[str, Any]]:
+        """Blocks until the job finishes (or the timeout passes) and returns its last state."""
+        job = None
+        for job in self.stream(job_id, timeout=timeout):
+            pass
+        return job
+
+    def dead_letters(self, limit: int = 100) -> List[Dict[str, Any]]:
+        with self.lock:
+            rows = self.conn.execute("SELECT * FROM jobs WHERE status = 'dead' ORDER BY finished_at DESC LIMIT ?",
+                                     (limit,)).fetchall()
+        return [self._to_dict(row) for row in rows]
+
+    def requeue(self, job_id: str) -> None:
+        """Gives a dead job a fresh set of attempts."""
+        with self.lock, self.conn:
+            self.conn.execute(
+                "UPDATE jobs SET status = 'queued', attempts = 0, available_at = ?, finished_at = NULL "
+                "WHERE id = ? AND status = 'dead'", (time.time(), job_id)
+            )
+        with self.available:
+            self.available.notify()
+
+    def counts(self) -> Dict[str, int]:
+        with self.lock:
+            rows = self.conn.execute("SELECT status, COUNT(*) FROM jobs GROUP BY status").fetchall()
+        return {row[0]: row[1] for row in rows}
+
+    @staticmethod
+    def _to_dict(row: sqlite3.Row) -> Dict[str, Any]:
+        job = dict(row)
+        job["payload"] = json.loads(job["payload"])
+        job["result"] = json.loads(job["result"]) if job["result"] is not None else None
+        return job
+
+
+class JobWorkerPool:
+    """Worker threads that run queued jobs with the handler registered for their kind."""
+
+    def __init__(self, queue: JobQueue, handlers: Dict[str, Callable[[Dict[str, Any]], Any]], workers: int = 2):
+        self.queue = queue
+        self.handlers = handlers
+        self.workers = workers
+        self.threads: List[threading.Thread] = []
+        self.stopping = threading.Event()
+        self.lock = threading.Lock()
+        self.completed = 0
+        self.retried = 0
+        self.dead = 0
+        self.running = 0
+        # (finished_at, queue wait seconds, run seconds) of recent jobs
+        self.recent = deque(maxlen=1000)
+
+    def start(self) -> None:
+        if self.threads:
+            return
+        for index in range(self.workers):
+            thread = threading.Thread(target=self._loop, name=f"job-worker-{index}", daemon=True)
+            thread.start()
+            self.threads.append(thread)
+
+    def stop(self, timeout: float = None) -> None:
+        self.stopping.set()
+        with self.queue.available:
+            self.queue.available.notify_all()
+        for thread in self.threads:
+            thread.join(timeout)
+        self.threads = []
+
+    def _loop(self) -> None:
+        kinds = list(self.handlers)
+        while not self.stopping.is_set():
+            job = self.queue.claim(kinds)
+            if job is None:
+                with self.queue.available:
+                    self.queue.available.wait(JOB_POLL_SECONDS)
+                continue
+            self._run(job)
+
+    def _run(self, job: Dict[str, Any]) -> None:
+        with self.lock:
+            self.running += 1
+        started = time.perf_counter()
+        try:
+            result = self.handlers[job["kind"]](job["payload"])
+        except Exception as e:
+            status = self.queue.fail(job["id"], job["attempts"], f"{type(e).__name__}: {e}")
+            with self.lock:
+                self.running -= 1
+                if status == "dead":
+                    self.dead += 1
+                elif status == "queued":
+                    self.retried += 1
+            return
+
+        owned = self.queue.complete(job["id"], job["attempts"], result)
+        finished = time.time()
+        with self.lock:
+            self.running -= 1
+            if not owned:
+                # Another worker reclaimed the job after the lease ran out
+                return
+            self.completed += 1
+            self.recent.append((finished, job["started_at"] - job["created_at"], time.perf_counter() - started))
+
+    def metrics(self, window: float = 300.0) -> Dict[str, Any]:
+        """Throughput over the last `window` seconds, latencies, retries and queue depth."""
+        now = time.time()
+        with self.lock:
+            recent = [entry for entry in self.recent if entry[0] >= now - window]
+            figures = {"running": self.running, "completed": self.completed, "retried": self.retried,
+                       "dead": self.dead}
+        waits = sorted(entry[1] for entry in recent)
+        runs = sorted(entry[2] for entry in recent)
+        counts = self.queue.counts()
+        figures.update({
+            "queued": counts.get("queued", 0),
+            "dead_letters": counts.get("dead", 0),
+            "jobs_per_minute": round(len(recent) * 60 / window, 2),
+            "queue_wait_s_avg": round(sum(waits) / len(waits), 3) if waits else None,
+            "run_s_avg": round(sum(runs) / len(runs), 3) if runs else None,
+            "run_s_p95": round(runs[int(0.95 * (len(runs) - 1))], 3) if runs else None,
+        })
+        return figures
@@ -0,0 +1,149 @@
+from collections import deque
+from typing import Dict, Any, List, Optional
+from state_store import UserStateStore
+from config import ROLLING_WINDOW
+
+# Dimensions that graded answers are broken down by
+DIMENSIONS = ["exercise_type", "theme", "grammar_topic", "error_category"]
+
+
+class LearnerStats:
+    """Incremental per-user statistics. Every update is O(1)."""
+
+    def __init__(self, user_id: str, window_size: int = ROLLING_WINDOW):
+        self.user_id = user_id
+        self.window_size = window_size
+        self.total = 0
+        self.correct = 0
+        # dimension -> value -> [correct, attempts]
+        self.breakdown: Dict[str, Dict[str, List[int]]] = {dimension: {} for dimension in DIMENSIONS}
+        self.window = deque(maxlen=window_size)
+        self.window_correct = 0
+        self.current_streak = 0
+        self.best_streak = 0
+        self.miss_streak = 0
+
+    def record(self, correct: bool, exercise_type: str = None, theme: str = None,
+               grammar_topic: str = None, error_category: str = None) -> None:
+        """Records one graded answer."""
+        correct = bool(correct)
+        self.total += 1
+        self.correct += correct
+
+        # Rolling window keeps a running sum so accuracy never needs a rescan
+        if len(self.window) == self.window.maxlen:
+            self.window_correct -= self.window[0]
+        self.window.append(int(correct))
+        self.window_correct += correct
+
+        if correct:
+            self.current_streak += 1
+            self.miss_streak = 0
+            self.best_streak = max(self.best_streak, self.current_streak)
+        else:
+            self.current_streak = 0
+            self.miss_streak += 1
+
+        values = {
+            "exercise_type": exercise_type,
+            "theme": theme,
+            "grammar_topic": grammar_topic,
+            "error_category": error_category if not correct else None
+        }
+        for dimension, value in values.items():
+            if not value:
+                continue
+            counts = self.breakdown[dimension].setdefault(value, [0, 0])
+            counts[0] += correct
+            counts[1] += 1
+
+    def accuracy(self, dimension: str = None, value: str = None) -> Optional[float]:
+        """Overall accuracy, or accuracy for one value of a dimension."""
+        if dimension is None:
+            return self.correct / self.total if self.total else None
+        counts = self.breakdown.get(dimension, {}).get(value)
+        if not counts or not counts[1]:
+            return None
+        return counts[0] / counts[1]
+
+    def rolling_accuracy(self) -> Optional[float]:
+        """Accuracy over the last `window_size` graded answers."""
+        return self.window_correct / len(self.window) if self.window else None
+
+    def weakest(self, dimension: str, min_attempts: int = 3, limit: int = 3) -> List[str]:
+        """Values of a dimension with the lowest accuracy (most frequent for error categories)."""
+        entries = self.breakdown.get(dimension, {})
+        if dimension == "error_category":
+            return sorted(entries, key=lambda value: -entries[value][1])[:limit]
+        eligible = [value for value, counts in entries.items() if counts[1] >= min_attempts]
+        return sorted(eligible, key=lambda value: entries[value][0] / entries[value][1])[:limit]
+
+    def summary(self) -> Dict[str, Any]:
+        """Precomputed numbers describing the learner's progress."""
+        return {
+            "user_id": self.user_id,
+            "answers": self.total,
+            "accuracy": self.accuracy(),
+            "rolling_accuracy": self.rolling_accuracy(),
+            "current_streak": self.current_streak,
+            "best_streak": self.best_streak,
+            "miss_streak": self.miss_streak,
+            "accuracy_by": {
+                dimension: {value: counts[0] / counts[1] for value, counts in values.items()}
+                for dimension, values in self.breakdown.items() if dimension != "error_category"
+            },
+            "error_counts": {value: counts[1] for value, counts in self.breakdown["error_category"].items()},
+            "weakest_topics": self.weakest("grammar_topic"),
+            "weakest_themes": self.weakest("theme"),
+        }
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "user_id": self.user_id,
+            "window_size": self.window_size,
+            "total": self.total,
+            "correct": self.correct,
+            "breakdown": self.breakdown,
+            "window": list(self.window),
+            "current_streak": self.current_streak,
+            "best_streak": self.best_streak,
+            "miss_streak": self.miss_streak
+        }
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "LearnerStats":
+        stats = cls(data["user_id"], data.get("window_size", ROLLING_WINDOW))
+        stats.total = data.get("total", 0)
+        stats.correct = data.get("correct", 0)
+        for dimension, values in data.get("breakdown", {}).items():
+            stats.breakdown[dimension] = {value: list(counts) for value, counts in values.items()}
+        stats.window.extend(data.get("window", []))
+        stats.window_correct = sum(stats.window)
+        stats.current_streak = data.get("current_streak", 0)
+        stats.best_streak = data.get("best_streak", 0)
+        stats.miss_streak = data.get("miss_streak", 0)
+        return stats
+
+
+class LearnerStatsStore:
+    """Holds LearnerStats per user_id, loaded from and saved to a UserStateStore row per user."""
+
+    def __init__(self, state: UserStateStore = None):
+        self.state = state or UserStateStore("learner_stats")
+        self.users: Dict[str, LearnerStats] = {}
+
+    def get(self, user_id: str) -> LearnerStats:
+        stats = self.users.get(user_id)
+        if stats is None:
+            data = self.state.load(user_id)
+            stats = self.users[user_id] = LearnerStats.from_dict(data) if data else LearnerStats(user_id)
+        return stats
+
+    def record(self, user_id: str, correct: bool, **context) -> LearnerStats:
+        stats = self.get(user_id)
+        stats.record(correct, **context)
+        return stats
+
+    def save(self, user_id: str) -> None:
+        """Persists one user's statistics; call after recording a batch of answers."""
+        self.state.save(user_id, self.get(user_id).to_dict())
@@ -0,0 +1,85 @@
+"""
+Load test for service.py: many concurrent learners, each creating a session
+and sending conversation turns. Reports latency percentiles, throughput and
+how many requests were shed with 503. Start the service first:
+
+    python service.py --port 8000
+    python load_test.py --url http://127.0.0.1:8000 --learners 200 --turns 3
+"""
+import argparse
+import json
+import time
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Any, List, Tuple
+
+MESSAGES = ["Hola, ¿cómo estás?", "¿Qué hiciste el fin de semana?", "Me gusta cocinar paella",
+            "¿Cómo se dice 'train station'?", "Ayer fui al mercado"]
+
+
+def _post(url: str, body: Dict[str, Any], timeout: float) -> Tuple[int, Dict[str, Any]]:
+    request = urllib.request.Request(url, data=json.dumps(body).encode("utf-8"),
+                                     headers={"Content-Type": "application/json"}, method="POST")
+    try:
+        with urllib.request.urlopen(request, timeout=timeout) as response:
+            return response.status, json.loads(response.read())
+    except urllib.error.HTTPError as e:
+        return e.code, {}
+    except (urllib.error.URLError, TimeoutError):
+        # Refused or timed out; reported as status 0
+        return 0, {}
+
+
+def _learner(base_url: str, learner: int, turns: int, timeout: float) -> List[Tuple[str, int, float]]:
+    """One learner's requests as (kind, status, seconds)."""
+    results = []
+    started = time.perf_counter()
+    status, body = _post(f"{base_url}/sessions", {"target_language": "Spanish"}, timeout)
+    results.append(("session", status, time.perf_counter() - started))
+    if status != 200:
+        return results
+    for turn in range(turns):
+        started = time.perf_counter()
+        status, _ = _post(f"{base_url}/sessions/{body['session_id']}/conversation",
+                          {"message": MESSAGES[(learner + turn) % len(MESSAGES)]}, timeout)
+        results.append(("conversation", status, time.perf_counter() - started))
+    return results
+
+
+def load_test(base_url: str, learners: int = 200, turns: int = 3, concurrency: int = 64,
+              timeout: float = 120.0) -> Dict[str, Any]:
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        runs = list(executor.map(lambda learner: _learner(base_url, learner, turns, timeout), range(learners)))
+    elapsed = time.perf_counter() - started
+
+    results = [result for run in runs for result in run]
+    ok = sorted(seconds for kind, status, seconds in results if kind == "conversation" and status == 200)
+    statuses: Dict[int, int] = {}
+    for _, status, _ in results:
+        statuses[status] = statuses.get(status, 0) + 1
+    return {
+        "learners": learners,
+        "requests": len(results),
+        "statuses": statuses,
+        "seconds": round(elapsed, 1),
+        "requests_per_s": round(len(results) / elapsed, 2),
+        "conversation_s_p50": round(ok[len(ok) // 2], 3) if ok else None,
+        "conversation_s_p95": round(ok[int(0.95 * (len(ok) - 1))], 3) if ok else None,
+        "conversation_s_max": round(ok[-1], 3) if ok else None,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load test a running tutor service.")
+    parser.add_argument("--url", default="http://127.0.0.1:8000")
+    parser.add_argument("--learners", type=int, default=200)
+    parser.add_argument("--turns", type=int, default=3, help="Conversation turns per learner")
+    parser.add_argument("--concurrency", type=int, default=64, help="Learners sending requests at once")
+    args = parser.parse_args()
+    print(load_test(args.url.rstrip("/"), args.learners, args.turns, args.concurrency))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,191 @@
+import argparse
+import os
+import random
+import tempfile
+import threading
+import time
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from typing import Callable, Dict, Any, Iterator
+from models import MultiInputMemory
+from state_store import UserStateStore
+from config import MAX_RESIDENT_SESSIONS, SESSION_STORE_PATH
+
+
+class SessionStore(UserStateStore):
+    """SQLite (WAL) store for memory snapshots of sessions evicted from the pool."""
+
+    def __init__(self, path: str = SESSION_STORE_PATH):
+        super().__init__("sessions", path)
+
+
+class MemoryPool:
+    """
+    Per-session conversation memories keyed by UserProfile.user_id.
+    At most `max_resident` memories stay in RAM; the least recently used one
+    is written to the SessionStore on eviction and reloaded when it returns.
+    """
+
+    def __init__(self, factory: Callable[[], MultiInputMemory], max_resident: int = MAX_RESIDENT_SESSIONS,
+                 store: SessionStore = None):
+        self.factory = factory
+        self.max_resident = max_resident
+        self.store = store or SessionStore()
+        self.resident: "OrderedDict[str, MultiInputMemory]" = OrderedDict()
+        # Evicted memories whose snapshot is still being written
+        self.evicting: Dict[str, MultiInputMemory] = {}
+        # user_id -> turns in flight; pinned memories are never evicted
+        self.pins: Dict[str, int] = {}
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.reloads = 0
+        self.evictions = 0
+        self.reload_seconds = deque(maxlen=1000)
+
+    def get(self, user_id: str) -> MultiInputMemory:
+        """Returns the session's memory, reloading it from the store if it was evicted."""
+        with self.lock:
+            memory = self.resident.get(user_id) or self.evicting.get(user_id)
+            if memory is not None:
+                self.resident[user_id] = memory
+                self.resident.move_to_end(user_id)
+                self.hits += 1
+                return memory
+            self.misses += 1
+
+        # Reload outside the pool lock so one slow read doesn't stall other sessions
+        started = time.perf_counter()
+        memory = self.factory()
+        state = self.store.load(user_id)
+        if state is not None:
+            memory.load_state(state)
+            self.reloads += 1
+            self.reload_seconds.append(time.perf_counter() - started)
+
+        evicted = []
+        with self.lock:
+            # Another request for the same session may have loaded it meanwhile
+            existing = self.resident.get(user_id)
+            if existing is not None:
+                self.resident.move_to_end(user_id)
+                return existing
+            self.resident[user_id] = memory
+            while len(self.resident) > self.max_resident:
+                # Oldest session without a turn in flight; with none, stay over the limit until one ends
+                evicted_id = next((uid for uid in self.resident if uid not in self.pins), None)
+                if evicted_id is None:
+                    break
+                evicted_memory = self.resident.pop(evicted_id)
+                self.evicting[evicted_id] = evicted_memory
+                evicted.append((evicted_id, evicted_memory))
+                self.evictions += 1
+
+        for evicted_id, evicted_memory in evicted:
+            self.store.save(evicted_id, evicted_memory.to_state())
+            with self.lock:
+                if self.evicting.get(evicted_id) is evicted_memory:
+                    del self.evicting[evicted_id]
+        return memory
+
+    @contextmanager
+    def checkout(self, user_id: str) -> Iterator[MultiInputMemory]:
+        """
+        The session's memory, pinned in RAM until the block exits, so a turn saved
+        after a long LLM call can't land in a memory that was already evicted.
+        """
+        with self.lock:
+            self.pins[user_id] = self.pins.get(user_id, 0) + 1
+        try:
+            yield self.get(user_id)
+        finally:
+            with self.lock:
+                self.pins[user_id] -= 1
+                if not self.pins[user_id]:
+                    del self.pins[user_id]
+
+    def flush(self) -> None:
+        """Persists every resident session (e.g. on shutdown)."""
+        with self.lock:
+            sessions = list(self.resident.items())
+        for user_id, memory in sessions:
+            self.store.save(user_id, memory.to_state())
+
+    def metrics(self) -> Dict[str, Any]:
+        """Resident memory and reload latency figures for monitoring."""
+        with self.lock:
+            memories = list(self.resident.values())
+        reload_ms = sorted(seconds * 1000 for seconds in self.reload_seconds)
+        return {
+            "resident_sessions": len(memories),
+            "pinned_sessions": len(self.pins),
+            "resident_messages": sum(len(memory.chat_memory.messages) for memory in memories),
+            "resident_tokens": sum(memory.memory_tokens for memory in memories),
+            "hits": self.hits,
+            "misses": self.misses,
+            "reloads": self.reloads,
+            "evictions": self.evictions,
+            "reload_ms_avg": round(sum(reload_ms) / len(reload_ms), 3) if reload_ms else None,
+            "reload_ms_p95": round(reload_ms[int(0.95 * (len(reload_ms) - 1))], 3) if reload_ms else None,
+        }
+
+
+def benchmark(learners: int = 500, turns: int = 20, max_resident: int = MAX_RESIDENT_SESSIONS,
+              concurrency: int = 32, token_budget: int = 2000) -> Dict[str, Any]:
+    """
+    Simulated load without LLM calls: `concurrency` threads play `turns` turns
+    for each of `learners` sessions in random order, against a pool that holds
+    `max_resident` of them. Reports per-turn memory latency and the pool metrics.
+    """
+    directory = tempfile.mkdtemp()
+    path = os.path.join(directory, "sessions_benchmark.db")
+    pool = MemoryPool(lambda: MultiInputMemory(memory_key="chat_history", return_messages=True,
+                                               max_token_limit=token_budget),
+                      max_resident=max_resident, store=SessionStore(path))
+    schedule = [f"learner-{index}" for index in range(learners) for _ in range(turns)]
+    random.shuffle(schedule)
+    turn_ms = []
+
+    def turn(user_id: str) -> None:
+        started = time.perf_counter()
+        with pool.checkout(user_id) as memory:
+            inputs = {"input": "¿Cómo se dice 'good morning' en español?"}
+            memory.load_memory_variables(inputs)
+            memory.save_context(inputs, {"output": "Se dice 'buenos días'. | It's 'buenos días'."})
+        turn_ms.append((time.perf_counter() - started) * 1000)
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        list(executor.map(turn, schedule))
+    elapsed = time.perf_counter() - started
+
+    turn_ms.sort()
+    report = {
+        "learners": learners,
+        "turns": len(schedule),
+        "turns_per_second": round(len(schedule) / elapsed),
+        "turn_ms_p50": round(turn_ms[len(turn_ms) // 2], 3),
+        "turn_ms_p95": round(turn_ms[int(0.95 * (len(turn_ms) - 1))], 3),
+    }
+    report.update(pool.metrics())
+    report["store_mb"] = round(os.path.getsize(path) / 1e6, 2)
+    pool.store.close()
+    for name in os.listdir(directory):
+        os.remove(os.path.join(directory, name))
+    os.rmdir(directory)
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load-test the per-session memory pool.")
+    parser.add_argument("--learners", type=int, default=500)
+    parser.add_argument("--turns", type=int, default=20)
+    parser.add_argument("--max-resident", type=int, default=MAX_RESIDENT_SESSIONS)
+    parser.add_argument("--concurrency", type=int, default=32)
+    args = parser.parse_args()
+    print(benchmark(args.learners, args.turns, args.max_resident, args.concurrency))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,8 +1,21 @@
+import threading
+import time
 import uuid
-from typing import Dict, Any, List, Tuple
-from pydantic import BaseModel, Field
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Any, List, Optional, Tuple
+from pydantic import BaseModel, Field, PrivateAttr
 from langchain.memory.chat_memory import BaseChatMemory
 from langchain.memory import ConversationBufferMemory
+from langchain.schema import BaseMessage, SystemMessage, messages_from_dict, messages_to_dict
+from token_counter import count_message_tokens
+from history_store import HistoryStore
+from vector_index import HashingEmbedder, VectorIndex
+from config import (MEMORY_STATS_HISTORY, SUMMARY_TRIGGER_TOKENS, SUMMARY_MAX_WORDS, HISTORY_RECENT_ITEMS,
+                    RETRIEVAL_TOP_K, RETRIEVAL_MIN_SCORE)
+
+# Shared worker for history summaries, so they never run on the chat thread
+_SUMMARY_EXECUTOR = ThreadPoolExecutor(max_workers=2, thread_name_prefix="memory-summary")
 
 
 class UserProfile(BaseModel):
@@ -15,22 +28,70 @@ class UserProfile(BaseModel):
     conversation_history: List[Dict] = []
     exercise_history: List[Dict] = []
     feedback_history: List[Dict] = []
+    # With a history store attached, the *_history lists only hold the most recent entries
+    _history_store: Optional[HistoryStore] = PrivateAttr(default=None)
+
+    def attach_history(self, store: HistoryStore, recent: int = HISTORY_RECENT_ITEMS) -> None:
+        """Backs the histories with `store` and pages in only their last `recent` entries."""
+        if self._history_store is store:
+            return
+        self._history_store = store
+        for kind in ("conversation", "exercise", "feedback"):
+            field = f"{kind}_history"
+            # Entries gathered before the store was attached are appended to it first
+            unsaved = getattr(self, field)
+            if unsaved:
+                store.append_many(self.user_id, kind, unsaved)
+            setattr(self, field, store.recent(self.user_id, kind, recent))
+
+    def add_history(self, kind: str, entry: Dict) -> None:
+        """Appends to `<kind>_history`, persisting it when a store is attached."""
+        history = getattr(self, f"{kind}_history")
+        history.append(entry)
+        if self._history_store is not None:
+            self._history_store.append(self.user_id, kind, entry)
+            if len(history) > 2 * HISTORY_RECENT_ITEMS:
+                del history[:-HISTORY_RECENT_ITEMS]
+
+    def older_history(self, kind: str, before: int, limit: int = HISTORY_RECENT_ITEMS) -> List[Dict]:
+        """Pages in up to `limit` entries preceding sequence number `before`."""
+        if self._history_store is None:
+            return getattr(self, f"{kind}_history")[max(0, before - limit):before]
+        return self._history_store.recent(self.user_id, kind, limit, before=before)
+
+    def history_count(self, kind: str) -> int:
+        if self._history_store is None:
+            return len(getattr(self, f"{kind}_history"))
+        return self._history_store.count(self.user_id, kind)
 
 class MultiInputMemory(ConversationBufferMemory):
-    """Memory class that handles multiple input keys and combines them."""
+    """
+    Memory class that handles multiple input keys and combines them.
+    With `max_token_limit` set, only the most recent turns that fit in the
+    budget (after the pinned profile facts) are kept.
+    """
     
     def __init__(self, 
                 memory_key: str = "chat_history", 
                 primary_input_key: str = "input",  
                 include_keys: List[str] = None, 
                 output_key: str = "output", 
-                return_messages: bool = False):
+                return_messages: bool = False,
+                max_token_limit: Optional[int] = None):
         super().__init__(memory_key=memory_key, 
                          output_key=output_key, 
                          return_messages=return_messages)
         
         object.__setattr__(self, "primary_input_key", primary_input_key)
         object.__setattr__(self, "include_keys", include_keys or [])
+        object.__setattr__(self, "max_token_limit", max_token_limit)
+        object.__setattr__(self, "pinned_facts", {})
+        object.__setattr__(self, "pinned_tokens", 0)
+        # Token count of each stored message, kept in step with chat_memory.messages
+        object.__setattr__(self, "message_tokens", [])
+        object.__setattr__(self, "memory_tokens", 0)
+        # Per-turn bookkeeping: messages/tokens held and tokens handed to the prompt
+        object.__setattr__(self, "turn_stats", deque(maxlen=MEMORY_STATS_HISTORY))
 
         self.chat_memory.messages = []
     
@@ -51,6 +112,273 @@ class MultiInputMemory(ConversationBufferMemory):
         output_str = outputs.get(self.output_key, "")
         return input_str, output_str
     
+    def set_pinned_facts(self, facts: Dict[str, Any]) -> None:
+        """Profile facts that are always sent, ahead of the conversation window."""
+        object.__setattr__(self, "pinned_facts", {key: value for key, value in facts.items() if value})
+        object.__setattr__(self, "pinned_tokens", sum(count_message_tokens(m) for m in self.pinned_messages()))
+
+    def pinned_messages(self) -> List[BaseMessage]:
+        if not self.pinned_facts:
+            return []
+        facts = "; ".join(f"{key}: {value}" for key, value in self.pinned_facts.items())
+        return [SystemMessage(content=f"Learner profile: {facts}")]
+
+    def context_messages(self) -> List[BaseMessage]:
+        """Messages sent ahead of the conversation window."""
+        return self.pinned_messages()
+
+    def context_tokens(self) -> int:
+        return self.pinned_tokens
+
+    def _sync_token_counts(self) -> None:
+        """Counts tokens for newly stored messages (or recounts if the history was edited)."""
+        messages = self.chat_memory.messages
+        counted = len(self.message_tokens)
+        if counted > len(messages):
+            self.message_tokens.clear()
+            counted = 0
+            object.__setattr__(self, "memory_tokens", 0)
+        new_counts = [count_message_tokens(message) for message in messages[counted:]]
+        self.message_tokens.extend(new_counts)
+        object.__setattr__(self, "memory_tokens", self.memory_tokens + sum(new_counts))
+
+    def _evict_to_budget(self) -> List[BaseMessage]:
+        """Drops the oldest turns until the history fits the token budget; returns what was dropped."""
+        if self.max_token_limit is None:
+            return []
+        budget = self.max_token_limit - self.context_tokens()
+        messages = self.chat_memory.messages
+        evicted = []
+        # Evict whole turns (user + AI message) and always keep the latest one
+        while self.memory_tokens > budget and len(messages) > 2:
+            for _ in range(2):
+                evicted.append(messages.pop(0))
+                object.__setattr__(self, "memory_tokens", self.memory_tokens - self.message_tokens.pop(0))
+        return evicted
+
+    def save_context(self, inputs: Dict[str, Any], outputs: Dict[str, str]) -> None:
+        """Save the turn, then trim the history back under the token budget."""
+        started = time.perf_counter()
+        super().save_context(inputs, outputs)
+        self._sync_token_counts()
+        self._evict_to_budget()
+        if self.turn_stats:
+            self.turn_stats[-1]["bookkeeping_ms"] += (time.perf_counter() - started) * 1000
+
     def load_memory_variables(self, inputs: Dict[str, Any]) -> Dict[str, Any]:
         """Return history in format appropriate for the prompt."""
-        return {self.memory_key: self.chat_memory.messages}
+        started = time.perf_counter()
+        self._sync_token_counts()
+        self._evict_to_budget()
+        messages = self.context_messages() + self.chat_memory.messages
+        self.turn_stats.append({
+            "memory_messages": len(self.chat_memory.messages),
+            "memory_tokens": self.memory_tokens,
+            "prompt_tokens": self.context_tokens() + self.memory_tokens,
+            "bookkeeping_ms": (time.perf_counter() - started) * 1000
+        })
+        return {self.memory_key: messages}
+
+    def cost_report(self) -> Dict[str, Any]:
+        """Averages over `turn_stats`: bookkeeping time per turn against the history tokens it sends."""
+        stats = list(self.turn_stats)
+        if not stats:
+            return {"turns": 0}
+        return {
+            "turns": len(stats),
+            "bookkeeping_ms_avg": round(sum(s["bookkeeping_ms"] for s in stats) / len(stats), 3),
+            "memory_messages_avg": round(sum(s["memory_messages"] for s in stats) / len(stats), 1),
+            "history_tokens_avg": round(sum(s["prompt_tokens"] for s in stats) / len(stats), 1),
+            "history_tokens_last": stats[-1]["prompt_tokens"]
+        }
+
+    def to_state(self) -> Dict[str, Any]:
+        """Serializable snapshot, used when a session is evicted from the memory pool."""
+        return {"messages": messages_to_dict(self.chat_memory.messages), "pinned_facts": self.pinned_facts}
+
+    def load_state(self, state: Dict[str, Any]) -> None:
+        self.chat_memory.messages = messages_from_dict(state.get("messages", []))
+        self.message_tokens.clear()
+        object.__setattr__(self, "memory_tokens", 0)
+        self._sync_token_counts()
+        self.set_pinned_facts(state.get("pinned_facts", {}))
+
+
+class SummarizingMemory(MultiInputMemory):
+    """
+    Token-budgeted memory that folds turns evicted from the window into a
+    running summary. Summaries are refreshed on a background worker once the
+    evicted turns cross `summary_trigger_tokens`, so saving a turn never waits
+    on the LLM; until a refresh lands, the previous summary is sent.
+    """
+
+    def __init__(self, llm, summary_trigger_tokens: int = SUMMARY_TRIGGER_TOKENS,
+                 summary_max_words: int = SUMMARY_MAX_WORDS, **kwargs):
+        super().__init__(**kwargs)
+        object.__setattr__(self, "llm", llm)
+        object.__setattr__(self, "summary_trigger_tokens", summary_trigger_tokens)
+        object.__setattr__(self, "summary_max_words", summary_max_words)
+        object.__setattr__(self, "summary", "")
+        object.__setattr__(self, "summary_tokens", 0)
+        # Evicted turns waiting to be folded into the summary
+        object.__setattr__(self, "pending", [])
+        object.__setattr__(self, "pending_tokens", 0)
+        object.__setattr__(self, "summary_lock", threading.Lock())
+        object.__setattr__(self, "summary_future", None)
+        object.__setattr__(self, "summary_stats", {"refreshes": 0, "failures": 0, "last_seconds": None})
+
+    def context_messages(self) -> List[BaseMessage]:
+        messages = self.pinned_messages()
+        if self.summary:
+            messages.append(SystemMessage(content=f"Summary of the earlier conversation: {self.summary}"))
+        return messages
+
+    def context_tokens(self) -> int:
+        return self.pinned_tokens + self.summary_tokens
+
+    def _evict_to_budget(self) -> List[BaseMessage]:
+        evicted = super()._evict_to_budget()
+        if evicted:
+            with self.summary_lock:
+                self.pending.extend(evicted)
+                object.__setattr__(self, "pending_tokens",
+                                   self.pending_tokens + sum(count_message_tokens(m) for m in evicted))
+            self._schedule_refresh()
+        return evicted
+
+    def _schedule_refresh(self) -> None:
+        """Starts a background refresh if the threshold is crossed and none is running."""
+        with self.summary_lock:
+            if self.pending_tokens < self.summary_trigger_tokens:
+                return
+            if self.summary_future is not None and not self.summary_future.done():
+                return
+            object.__setattr__(self, "summary_future", _SUMMARY_EXECUTOR.submit(self._refresh_summary))
+
+    def _refresh_summary(self) -> None:
+        """Runs on the summary worker: folds pending turns into the summary until none remain."""
+        while True:
+            with self.summary_lock:
+                batch = list(self.pending)
+                previous = self.summary
+            if not batch:
+                return
+
+            transcript = "\n".join(f"{message.type}: {message.content}" for message in batch)
+            prompt = f"""Update the running summary of a language tutoring session.
+            Keep the learner's goals, recurring mistakes, vocabulary introduced and open questions.
+            Use at most {self.summary_max_words} words.
+
+            Current summary:
+            {previous or "(none)"}
+
+            New turns:
+            {transcript}
+
+            Updated summary:"""
+
+            started = time.perf_counter()
+            try:
+                response = self.llm.invoke(prompt)
+            except Exception as e:
+                print(f"⚠️ Summary refresh failed: {e}")
+                self.summary_stats["failures"] += 1
+                return
+            new_summary = response.content if hasattr(response, "content") else str(response)
+
+            with self.summary_lock:
+                object.__setattr__(self, "summary", new_summary.strip())
+                object.__setattr__(self, "summary_tokens", count_message_tokens(self.summary))
+                del self.pending[:len(batch)]
+                object.__setattr__(self, "pending_tokens", sum(count_message_tokens(m) for m in self.pending))
+                self.summary_stats["refreshes"] += 1
+                self.summary_stats["last_seconds"] = round(time.perf_counter() - started, 3)
+                if self.pending_tokens < self.summary_trigger_tokens:
+                    return
+
+    def to_state(self) -> Dict[str, Any]:
+        state = super().to_state()
+        with self.summary_lock:
+            state["summary"] = self.summary
+            state["pending"] = messages_to_dict(self.pending)
+        return state
+
+    def load_state(self, state: Dict[str, Any]) -> None:
+        super().load_state(state)
+        with self.summary_lock:
+            object.__setattr__(self, "summary", state.get("summary", ""))
+            object.__setattr__(self, "summary_tokens", count_message_tokens(self.summary) if self.summary else 0)
+            self.pending[:] = messages_from_dict(state.get("pending", []))
+            object.__setattr__(self, "pending_tokens", sum(count_message_tokens(m) for m in self.pending))
+
+    def wait_for_summary(self, timeout: float = None) -> None:
+        """Blocks until any in-flight summary refresh finishes (for tests and shutdown)."""
+        future = self.summary_future
+        if future is not None:
+            future.result(timeout=timeout)
+
+
+class RetrievalMemory(MultiInputMemory):
+    """
+    Token-budgeted memory that also indexes every past turn with a local
+    embedding. Each prompt gets the recent window plus the `top_k` earlier
+    turns most similar to the current input, instead of all-or-nothing history.
+    """
+
+    def __init__(self, top_k: int = RETRIEVAL_TOP_K, min_score: float = RETRIEVAL_MIN_SCORE, **kwargs):
+        super().__init__(**kwargs)
+        object.__setattr__(self, "top_k", top_k)
+        object.__setattr__(self, "min_score", min_score)
+        object.__setattr__(self, "embedder", HashingEmbedder())
+        object.__setattr__(self, "index", VectorIndex(self.embedder.dim))
+        # (learner text, tutor text) for each indexed turn, aligned with index rows
+        object.__setattr__(self, "turns", [])
+        object.__setattr__(self, "retrieved", [])
+        object.__setattr__(self, "retrieved_tokens", 0)
+        object.__setattr__(self, "retrieval_stats", deque(maxlen=MEMORY_STATS_HISTORY))
+
+    def context_messages(self) -> List[BaseMessage]:
+        return self.pinned_messages() + self.retrieved
+
+    def context_tokens(self) -> int:
+        return self.pinned_tokens + self.retrieved_tokens
+
+    def retrieve(self, query: str) -> List[Tuple[str, str]]:
+        """Returns the most relevant turns that are no longer in the recent window, oldest first."""
+        window_turns = len(self.chat_memory.messages) // 2
+        started = time.perf_counter()
+        hits = self.index.search(self.embedder.embed(query), self.top_k,
+                                 limit=len(self.turns) - window_turns, min_score=self.min_score)
+        self.retrieval_stats.append({"indexed_turns": len(self.turns), "hits": len(hits),
+                                     "ms": round((time.perf_counter() - started) * 1000, 3)})
+        return [self.turns[row] for row, _ in sorted(hits)]
+
+    def load_memory_variables(self, inputs: Dict[str, Any]) -> Dict[str, Any]:
+        turns = self.retrieve(str(inputs.get(self.primary_input_key, "")))
+        if turns:
+            lines = "\n".join(f"- learner: {user} / tutor: {agent}" for user, agent in turns)
+            retrieved = [SystemMessage(content=f"Relevant earlier turns:\n{lines}")]
+        else:
+            retrieved = []
+        object.__setattr__(self, "retrieved", retrieved)
+        object.__setattr__(self, "retrieved_tokens", sum(count_message_tokens(m) for m in retrieved))
+        return super().load_memory_variables(inputs)
+
+    def save_context(self, inputs: Dict[str, Any], outputs: Dict[str, str]) -> None:
+        super().save_context(inputs, outputs)
+        user_text = str(inputs.get(self.primary_input_key, ""))
+        agent_text = outputs.get(self.output_key, "")
+        self.turns.append((user_text, agent_text))
+        self.index.add(self.embedder.embed(f"{user_text}\n{agent_text}"))
+
+    def to_state(self) -> Dict[str, Any]:
+        state = super().to_state()
+        state["turns"] = self.turns
+        state["vectors"] = self.index.to_base64()
+        return state
+
+    def load_state(self, state: Dict[str, Any]) -> None:
+        super().load_state(state)
+        object.__setattr__(self, "turns", [tuple(turn) for turn in state.get("turns", [])])
+        if "vectors" in state:
+            object.__setattr__(self, "index", VectorIndex.from_base64(state["vectors"], self.embedder.dim))
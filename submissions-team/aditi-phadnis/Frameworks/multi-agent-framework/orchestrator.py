@@ -1,35 +1,260 @@
+import asyncio
+import time
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_EXCEPTION
 from langchain_openai import ChatOpenAI
 from models import UserProfile
 from exercise_agent import ExerciseGeneratorAgent
 from feedback_agent import FeedbackAgent
 from conversational_agent import ConversationAgent
+from learner_stats import LearnerStatsStore
+from exercise_bank import ExerciseBank
+from scheduler import SchedulerStore
+from bandit import BanditStore, context_key, learning_reward
+from history_store import HistoryStore
+from prompts import PROMPT_CACHE_STATS
+from job_queue import JobQueue, JobWorkerPool
+from streaming import TokenStreamCallback, StreamLatencyStats
+from resilience import (CircuitBreaker, BreakerCallback, DegradationLog, CircuitOpenError, BudgetExceededError,
+                        call_with_budget)
+from config import EXERCISE_WORKERS, EXERCISE_BUDGET_SECONDS, EXERCISE_TYPES, EXERCISES_PER_SET
 
 class Orchestrator:
     def __init__(self, llm: ChatOpenAI):
+        # Every LLM call feeds the breaker; while it is open, requests are served from fallbacks.
+        # The callback is bound into this orchestrator's invoke config; the caller's LLM is left as it is
+        self.breaker = CircuitBreaker()
+        llm = llm.with_config(callbacks=[BreakerCallback(self.breaker)])
         self.llm = llm
         self.conversational_agent = ConversationAgent(llm)
-        self.exercise_agent = ExerciseGeneratorAgent(llm)
+        self.bank = ExerciseBank()
+        self.schedulers = SchedulerStore()
+        self.exercise_agent = ExerciseGeneratorAgent(llm, bank=self.bank, schedulers=self.schedulers)
         self.feedback_agent = FeedbackAgent(llm)
+        self.stats_store = LearnerStatsStore()
+        self.bandits = BanditStore()
+        self.history_store = HistoryStore()
+        # Runs the conversation and exercise branches of run()/arun() side by side
+        self.executor = ThreadPoolExecutor(max_workers=4, thread_name_prefix="orchestrator")
+        # Seconds spent per branch in the last run()/arun()
+        self.last_timings = {}
+        self.degradation = DegradationLog()
+        self.stream_stats = StreamLatencyStats()
+        # Budgeted calls get their own threads, so they can't starve run()'s branches
+        self.budget_executor = ThreadPoolExecutor(max_workers=8, thread_name_prefix="budgeted-llm")
+        # Exercise generation jobs; the workers start with the first submitted job
+        self.jobs = JobQueue()
+        self.job_workers = JobWorkerPool(self.jobs, {"generate_exercises": self.run_exercise_job},
+                                         workers=EXERCISE_WORKERS)
     
-    def handle_conversation(self, user_input: str, user_profile: UserProfile) -> str:
+    def handle_conversation(self, user_input: str, user_profile: UserProfile, callbacks: list = None) -> str:
         """Handles user conversation and returns AI response."""
-        return self.conversational_agent.respond(user_input, user_profile)
+        user_profile.attach_history(self.history_store)
+        return self.conversational_agent.respond(user_input, user_profile, callbacks=callbacks)
+
+    def stream_conversation(self, user_input: str, user_profile: UserProfile, on_token) -> str:
+        """Like handle_conversation, but calls on_token with each token as it streams; records time to first token."""
+        stream = TokenStreamCallback(on_token)
+        try:
+            return self.handle_conversation(user_input, user_profile, callbacks=[stream])
+        finally:
+            self.stream_stats.record(stream)
+
+    def stream_report(self) -> dict:
+        """Time to first token and total time of recent streamed conversation turns."""
+        return self.stream_stats.report()
     
-    def generate_exercises(self, user_profile: UserProfile) -> str:
-        """Generates a set of 3 exercises for the user."""
-        return self.exercise_agent.generate_exercises(user_profile)
+    def memory_metrics(self) -> dict:
+        """Resident conversation memory and session reload latency."""
+        return self.conversational_agent.memory_pool.metrics()
+
+    def prompt_cache_report(self) -> dict:
+        """Share of prompt tokens served from the provider's prompt cache, per agent."""
+        return PROMPT_CACHE_STATS.report()
+
+    def generate_exercises(self, user_profile: UserProfile, budget_seconds: float = EXERCISE_BUDGET_SECONDS) -> str:
+        """
+        Generates a set of 3 exercises for the user. If that takes longer than
+        `budget_seconds`, or the LLM breaker is open, banked exercises are returned
+        instead, each marked with "degraded" and the reason.
+        """
+        user_profile.attach_history(self.history_store)
+        exercise_types = self.choose_exercise_types(user_profile)
+        try:
+            exercises = call_with_budget(self.budget_executor, budget_seconds, self.breaker,
+                                         self.exercise_agent.generate_exercises, user_profile, exercise_types)
+        except (CircuitOpenError, BudgetExceededError) as e:
+            # A generation that overran keeps running and still banks what it produces
+            reason = "circuit_open" if isinstance(e, CircuitOpenError) else "budget_exceeded"
+            exercises = self.exercise_agent.fallback_exercises(user_profile, exercise_types)
+            for exercise in exercises:
+                exercise["degraded"] = reason
+            self.degradation.record("generate_exercises", reason, user_id=user_profile.user_id,
+                                    served=len(exercises))
+        for exercise in exercises:
+            user_profile.add_history("exercise", {
+                key: exercise.get(key) for key in ("id", "exercise_type", "theme", "grammar_topic", "question")
+            })
+        return exercises
     
-    def provide_feedback(self, user_answers: dict, correct_answers: dict) -> str:
+    def submit_exercise_job(self, user_profile: UserProfile) -> str:
+        """Queues exercise generation and returns the job id at once; repeat requests share one job."""
+        self.job_workers.start()
+        profile = user_profile.model_dump(include={"user_id", "target_language", "difficulty_level",
+                                                   "learning_focus", "strengths", "weaknesses"})
+        dedup_key = "|".join(str(profile[key]) for key in
+                             ("user_id", "target_language", "difficulty_level", "learning_focus"))
+        return self.jobs.submit("generate_exercises", profile, dedup_key=dedup_key)
+
+    def run_exercise_job(self, payload: dict) -> list:
+        exercises = self.generate_exercises(UserProfile(**payload))
+        if not exercises:
+            # Raising lets the queue retry with backoff instead of storing an empty set
+            raise ValueError("No valid exercises were generated")
+        return exercises
+
+    def exercise_job(self, job_id: str) -> dict:
+        """Status of an exercise job: queued, running, done (with "result") or dead (with "error")."""
+        return self.jobs.poll(job_id)
+
+    def degradation_report(self) -> dict:
+        """Responses served from fallbacks, by operation and reason, plus the breaker state."""
+        report = self.degradation.report()
+        report["breaker"] = self.breaker.metrics()
+        return report
+
+    def job_metrics(self) -> dict:
+        return self.job_workers.metrics()
+
+    def provide_feedback(self, user_answers: dict, correct_answers: dict, user_profile: UserProfile = None) -> str:
         """Provides feedback based on user responses."""
         if correct_answers is None or all(v is None for v in correct_answers.values()):
             print("ERROR: correct_answers is missing or empty before providing feedback")
             return {}
 
-        return self.feedback_agent.provide_feedback(user_answers, correct_answers)
+        feedback = self.feedback_agent.provide_feedback(user_answers, correct_answers)
+        if user_profile is not None:
+            user_profile.attach_history(self.history_store)
+            for question, result in feedback.items():
+                user_profile.add_history("feedback", {
+                    "question": question,
+                    "correct": result.get("correct", False),
+                    "error_category": result.get("error_category")
+                })
+            self.feedback_agent.update_weaknesses(user_profile, feedback)
+            self.record_results(user_profile, feedback, correct_answers)
+        return feedback
+
+    def record_results(self, user_profile: UserProfile, feedback: dict, correct_answers: dict) -> None:
+        """Updates the learner statistics, review schedule and exercise-type bandit with each graded answer."""
+        scheduler = self.schedulers.get(user_profile.user_id)
+        stats = self.stats_store.get(user_profile.user_id)
+        # Baseline and context as they were when the exercises were chosen
+        baseline = stats.rolling_accuracy()
+        context = context_key(user_profile.difficulty_level, baseline)
+        by_type = {}
+
+        for question, result in feedback.items():
+            info = correct_answers.get(question)
+            info = info if isinstance(info, dict) else {}
+            correct = result.get("correct", False)
+            # Banked exercises cost no tokens and say nothing about what generating a type is worth
+            if info.get("exercise_type") and info.get("tokens"):
+                totals = by_type.setdefault(info["exercise_type"], [0, 0, 0])
+                totals[0] += correct
+                totals[1] += 1
+                totals[2] += info.get("tokens") or 0
+            self.stats_store.record(
+                user_profile.user_id,
+                correct,
+                exercise_type=info.get("exercise_type"),
+                theme=info.get("theme"),
+                grammar_topic=info.get("grammar_topic"),
+                error_category=result.get("error_category")
+            )
+
+            if info.get("theme"):
+                scheduler.review(f"theme:{info['theme']}", "theme", correct)
+            if info.get("grammar_topic"):
+                scheduler.review(f"grammar_topic:{info['grammar_topic']}", "grammar_topic", correct)
+            if info.get("id"):
+                review_kind = f"exercise:{user_profile.target_language}:{info.get('exercise_type')}"
+                scheduler.review(f"exercise:{info['id']}", review_kind, correct)
+                # Logged for the offline difficulty calibration in irt.py
+                self.bank.record_response(user_profile.user_id, info["id"], correct)
+
+        # Learning gain: accuracy on this exercise type versus the learner's recent baseline
+        for exercise_type, (correct_count, attempts, tokens) in by_type.items():
+            gain = correct_count / attempts - (baseline if baseline is not None else 0.5)
+            self.bandits.update(user_profile.user_id, context, exercise_type, learning_reward(gain, tokens))
+        self.stats_store.save(user_profile.user_id)
+        self.schedulers.save(user_profile.user_id)
+        self.bandits.save(user_profile.user_id)
+
+    def choose_exercise_types(self, user_profile: UserProfile, count: int = EXERCISES_PER_SET) -> list:
+        """Picks `count` different exercise types, each expected to give the most learning gain per LLM token."""
+        stats = self.stats_store.get(user_profile.user_id)
+        context = context_key(user_profile.difficulty_level, stats.rolling_accuracy())
+        bandit = self.bandits.get(user_profile.user_id)
+        remaining, chosen = list(EXERCISE_TYPES), []
+        while len(chosen) < count:
+            exercise_type = bandit.choose(context, remaining)
+            if exercise_type is None:
+                break
+            chosen.append(exercise_type)
+            remaining.remove(exercise_type)
+        return chosen
+
+    def analyze_progress(self, user_profile: UserProfile, narrate: bool = False) -> dict:
+        """Returns precomputed progress statistics, optionally narrated by the LLM."""
+        stats = self.stats_store.get(user_profile.user_id)
+        return self.feedback_agent.analyze_user_progress(stats, user_profile, narrate=narrate)
     
-    def run(self, user_input: str, user_profile: UserProfile) -> str:
-        """Orchestrates the workflow: conversation → exercises → feedback."""
-        conversation_response = self.handle_conversation(user_input, user_profile)
-        exercises = self.generate_exercises(user_profile)
-        
+    def _timed(self, timings: dict, name: str, func, *args):
+        started = time.perf_counter()
+        try:
+            return func(*args)
+        finally:
+            timings[name] = round(time.perf_counter() - started, 3)
+
+    def _branches(self, user_input: str, user_profile: UserProfile, timings: dict) -> list:
+        # Attach once up front; both branches append to the profile's history
+        user_profile.attach_history(self.history_store)
+        return [
+            (self._timed, timings, "conversation", self.handle_conversation, user_input, user_profile),
+            (self._timed, timings, "exercises", self.generate_exercises, user_profile)
+        ]
+
+    def _format_run(self, conversation_response: str, exercises, timings: dict, started: float) -> str:
+        timings["total"] = round(time.perf_counter() - started, 3)
+        self.last_timings = timings
         return f"### AI Response:\n{conversation_response}\n\n### Exercises:\n{exercises}\n\n(Submit your answers for feedback!)"
+
+    def run(self, user_input: str, user_profile: UserProfile) -> str:
+        """Orchestrates the workflow: conversation and exercises run concurrently on worker threads."""
+        started = time.perf_counter()
+        timings = {}
+        futures = [self.executor.submit(*branch) for branch in self._branches(user_input, user_profile, timings)]
+        done, pending = wait(futures, return_when=FIRST_EXCEPTION)
+        for future in done:
+            if future.exception() is not None:
+                # Branches that haven't started are dropped; a running LLM call finishes and is discarded
+                for other in pending:
+                    other.cancel()
+                raise future.exception()
+        conversation_response, exercises = (future.result() for future in futures)
+        return self._format_run(conversation_response, exercises, timings, started)
+
+    async def arun(self, user_input: str, user_profile: UserProfile) -> str:
+        """Async variant of run(): awaits both branches and cancels the other if one fails."""
+        loop = asyncio.get_running_loop()
+        started = time.perf_counter()
+        timings = {}
+        tasks = [asyncio.ensure_future(loop.run_in_executor(self.executor, *branch))
+                 for branch in self._branches(user_input, user_profile, timings)]
+        try:
+            conversation_response, exercises = await asyncio.gather(*tasks)
+        except BaseException:
+            for task in tasks:
+                task.cancel()
+            raise
+        return self._format_run(conversation_response, exercises, timings, started)
@@ -0,0 +1,109 @@
+import threading
+from typing import Any, Dict, List, Optional
+from langchain_core.callbacks import BaseCallbackHandler
+from langchain_core.messages import BaseMessage, HumanMessage, SystemMessage
+from langchain_core.outputs import LLMResult
+from langchain_core.prompts import MessagesPlaceholder
+from token_counter import count_message_tokens
+
+
+class BudgetedMessagesPlaceholder(MessagesPlaceholder):
+    """
+    MessagesPlaceholder for conversation memory that renders at most
+    `max_tokens` tokens. Leading system messages (profile facts, summaries,
+    retrieved turns) are always kept; the oldest turns after them are dropped
+    first, a human message together with the replies that follow it, so no
+    reply is left without its question. The latest turn always survives.
+    """
+
+    max_tokens: Optional[int] = None
+
+    def format_messages(self, **kwargs: Any) -> List[BaseMessage]:
+        messages = super().format_messages(**kwargs)
+        if self.max_tokens is None:
+            return messages
+
+        split = 0
+        while split < len(messages) and isinstance(messages[split], SystemMessage):
+            split += 1
+        context, turns = messages[:split], messages[split:]
+        budget = self.max_tokens - sum(count_message_tokens(message) for message in context)
+        # Each turn starts at a human message; anything before the first one is its own group
+        starts = [0] + [i for i, message in enumerate(turns) if i and isinstance(message, HumanMessage)]
+        counts = [sum(count_message_tokens(message) for message in turns[start:end])
+                  for start, end in zip(starts, starts[1:] + [len(turns)])]
+        total = sum(counts)
+        group = 0
+        while total > budget and group < len(starts) - 1:
+            total -= counts[group]
+            group += 1
+        return context + turns[starts[group]:]
+
+
+def assemble_prompt(static: str, language: str = "", user: str = "", turn: str = "") -> str:
+    """
+    Joins prompt segments from most to least stable: shared instructions, then
+    per-language, per-user and per-turn text. Requests that share a language
+    (or a user) then share a byte-identical prefix that the provider can cache.
+    """
+    return "\n\n".join(segment.strip() for segment in (static, language, user, turn) if segment and segment.strip())
+
+
+def cached_prompt_tokens(response: Any) -> tuple:
+    """Returns (prompt_tokens, cached_tokens) from a chat response or LLMResult, (0, 0) if unreported."""
+    usage = getattr(response, "usage_metadata", None) or {}
+    if usage:
+        details = usage.get("input_token_details") or {}
+        return usage.get("input_tokens", 0), details.get("cache_read", 0) or 0
+    metadata = getattr(response, "response_metadata", None) or getattr(response, "llm_output", None) or {}
+    token_usage = metadata.get("token_usage") or {}
+    details = token_usage.get("prompt_tokens_details") or {}
+    return token_usage.get("prompt_tokens", 0) or 0, details.get("cached_tokens", 0) or 0
+
+
+class PromptCacheStats:
+    """
+    Per-agent prompt and provider-cached token totals. OpenAI only caches
+    prompts of 1024 tokens or more, so cached_tokens stays 0 until a shared
+    prefix (plus history) reaches that size. Streaming LLMs need
+    stream_usage=True to report usage at all.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        # agent -> [calls, prompt tokens, cached tokens]
+        self.totals: Dict[str, List[int]] = {}
+
+    def record(self, agent: str, response: Any) -> None:
+        prompt_tokens, cached_tokens = cached_prompt_tokens(response)
+        with self.lock:
+            totals = self.totals.setdefault(agent, [0, 0, 0])
+            totals[0] += 1
+            totals[1] += prompt_tokens
+            totals[2] += cached_tokens
+
+    def report(self) -> Dict[str, Dict[str, Any]]:
+        with self.lock:
+            return {
+                agent: {"calls": calls, "prompt_tokens": prompt_tokens, "cached_tokens": cached_tokens,
+                        "cached_ratio": round(cached_tokens / prompt_tokens, 3) if prompt_tokens else None}
+                for agent, (calls, prompt_tokens, cached_tokens) in self.totals.items()
+            }
+
+
+class PromptCacheCallback(BaseCallbackHandler):
+    """Feeds token usage of LLM calls made inside an AgentExecutor into PromptCacheStats."""
+
+    def __init__(self, agent: str, stats: PromptCacheStats = None):
+        self.agent = agent
+        self.stats = stats or PROMPT_CACHE_STATS
+
+    def on_llm_end(self, response: LLMResult, **kwargs: Any) -> None:
+        generations = [generation for batch in response.generations for generation in batch]
+        message = getattr(generations[0], "message", None) if generations else None
+        # Chat models report usage on the message; otherwise fall back to llm_output
+        self.stats.record(self.agent, message if getattr(message, "usage_metadata", None) else response)
+
+
+# Shared by all agents so the Orchestrator can report one table
+PROMPT_CACHE_STATS = PromptCacheStats()
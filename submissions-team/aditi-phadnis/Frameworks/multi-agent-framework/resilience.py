@@ -0,0 +1,158 @@
+import threading
+import time
+from collections import Counter, deque
+from contextlib import contextmanager
+from concurrent.futures import Executor, TimeoutError as FutureTimeout
+from typing import Callable, Dict, Any
+from langchain_core.callbacks import BaseCallbackHandler
+from config import BREAKER_FAILURE_THRESHOLD, BREAKER_RESET_SECONDS, BREAKER_SLOW_CALL_SECONDS
+
+
+class CircuitOpenError(Exception):
+    """The LLM circuit breaker is open, so the call was not attempted."""
+
+
+class BudgetExceededError(Exception):
+    """A request ran past its latency budget."""
+
+
+class CircuitBreaker:
+    """
+    previous-code/resilience.py carries a copy of this class and BreakerCallback
+    for the legacy app; keep the two in step.
+
+    Tracks LLM call outcomes. After `failure_threshold` consecutive failures or
+    slow calls the breaker opens and callers fail fast; after `reset_seconds`
+    one trial request is let through (half-open) and its outcome closes or
+    re-opens the breaker. Take the trial with attempt(), which releases it if
+    the request ends without an LLM call.
+    """
+
+    def __init__(self, failure_threshold: int = BREAKER_FAILURE_THRESHOLD, reset_seconds: float = BREAKER_RESET_SECONDS,
+                 slow_call_seconds: float = BREAKER_SLOW_CALL_SECONDS):
+        self.failure_threshold = failure_threshold
+        self.reset_seconds = reset_seconds
+        self.slow_call_seconds = slow_call_seconds
+        self.lock = threading.Lock()
+        self.state = "closed"
+        self.failures = 0
+        self.opened_at = 0.0
+        self.trial_in_flight = False
+        self.opened_count = 0
+        self.rejected = 0
+        # Calls recorded so far; attempt() uses it to see whether a request reached the LLM
+        self.outcomes = 0
+
+    def allow(self) -> bool:
+        """Whether a request may call the LLM now."""
+        with self.lock:
+            if self.state == "closed":
+                return True
+            if self.state == "open" and time.monotonic() - self.opened_at >= self.reset_seconds:
+                self.state = "half_open"
+                self.trial_in_flight = False
+            if self.state == "half_open" and not self.trial_in_flight:
+                self.trial_in_flight = True
+                return True
+            self.rejected += 1
+            return False
+
+    def record(self, seconds: float, failed: bool = False) -> None:
+        """Counts one LLM call; a call slower than slow_call_seconds counts as a failure."""
+        failed = failed or seconds > self.slow_call_seconds
+        with self.lock:
+            self.outcomes += 1
+            if not failed:
+                self.failures = 0
+                self.state = "closed"
+                return
+            self.failures += 1
+            if self.state == "half_open" or self.failures >= self.failure_threshold:
+                if self.state != "open":
+                    self.opened_count += 1
+                self.state = "open"
+                self.opened_at = time.monotonic()
+
+    @contextmanager
+    def attempt(self):
+        """
+        Yields allow(). A half-open trial that records no outcome (e.g. it was
+        served from a cache, or failed before calling the LLM) is released on
+        exit, so the next request can be the trial.
+        """
+        allowed = self.allow()
+        outcomes = self.outcomes
+        try:
+            yield allowed
+        finally:
+            if allowed and self.outcomes == outcomes:
+                with self.lock:
+                    if self.state == "half_open":
+                        self.trial_in_flight = False
+
+    def metrics(self) -> Dict[str, Any]:
+        with self.lock:
+            return {"state": self.state, "consecutive_failures": self.failures,
+                    "times_opened": self.opened_count, "rejected": self.rejected}
+
+
+class BreakerCallback(BaseCallbackHandler):
+    """Feeds the duration and outcome of every LLM call into a CircuitBreaker."""
+
+    def __init__(self, breaker: CircuitBreaker):
+        self.breaker = breaker
+        self.started: Dict[Any, float] = {}
+
+    def on_llm_start(self, serialized, prompts, *, run_id, **kwargs) -> None:
+        self.started[run_id] = time.perf_counter()
+
+    def on_chat_model_start(self, serialized, messages, *, run_id, **kwargs) -> None:
+        self.started[run_id] = time.perf_counter()
+
+    def on_llm_end(self, response, *, run_id, **kwargs) -> None:
+        started = self.started.pop(run_id, None)
+        if started is not None:
+            self.breaker.record(time.perf_counter() - started)
+
+    def on_llm_error(self, error, *, run_id, **kwargs) -> None:
+        started = self.started.pop(run_id, None)
+        self.breaker.record(time.perf_counter() - started if started else 0.0, failed=True)
+
+
+def call_with_budget(executor: Executor, budget_seconds: float, breaker: CircuitBreaker, func: Callable, *args):
+    """
+    Runs func on the executor and waits at most `budget_seconds` for it.
+    Raises CircuitOpenError without calling func when the breaker is open, and
+    BudgetExceededError on timeout (the call itself finishes in the background).
+    """
+    with breaker.attempt() as allowed:
+        if not allowed:
+            raise CircuitOpenError("LLM circuit breaker is open")
+        future = executor.submit(func, *args)
+        try:
+            return future.result(timeout=budget_seconds)
+        except FutureTimeout:
+            # A hung call never reaches the callback, so count it here
+            breaker.record(budget_seconds, failed=True)
+            raise BudgetExceededError(f"No result within {budget_seconds}s")
+
+
+class DegradationLog:
+    """Which responses were served from fallbacks, and why."""
+
+    def __init__(self, maxlen: int = 500):
+        self.lock = threading.Lock()
+        self.events = deque(maxlen=maxlen)
+        self.counts = Counter()
+
+    def record(self, operation: str, reason: str, **details) -> None:
+        with self.lock:
+            self.events.append({"operation": operation, "reason": reason, "at": time.time(), **details})
+            self.counts[(operation, reason)] += 1
+
+    def report(self, recent: int = 20) -> Dict[str, Any]:
+        with self.lock:
+            return {
+                "counts": {f"{operation}:{reason}": count for (operation, reason), count in self.counts.items()},
+                "recent": list(self.events)[-recent:],
+            }
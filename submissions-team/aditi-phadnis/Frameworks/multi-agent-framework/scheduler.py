@@ -0,0 +1,209 @@
+import argparse
+import heapq
+import random
+import time
+from typing import Dict, Any, Iterable, List, Optional, Tuple
+from state_store import UserStateStore
+from config import RELEARN_DELAY_SECONDS
+
+DAY = 24 * 60 * 60
+
+
+class ItemState:
+    """SM-2 review state of a single item (theme, grammar topic or banked exercise)."""
+    __slots__ = ("item_id", "kind", "ease", "interval", "repetitions", "lapses", "due", "last_review")
+
+    def __init__(self, item_id: str, kind: str, ease: float = 2.5, interval: float = 0.0,
+                 repetitions: int = 0, lapses: int = 0, due: float = 0.0, last_review: float = 0.0):
+        self.item_id = item_id
+        self.kind = kind
+        self.ease = ease
+        self.interval = interval
+        self.repetitions = repetitions
+        self.lapses = lapses
+        self.due = due
+        self.last_review = last_review
+
+    def to_list(self) -> list:
+        return [self.item_id, self.kind, self.ease, self.interval, self.repetitions,
+                self.lapses, self.due, self.last_review]
+
+
+class SpacedRepetitionScheduler:
+    """
+    Per-user SM-2 scheduler with one due-heap per item kind.
+    Reviews push a new heap entry and leave the old one behind; stale entries
+    are skipped when popped, so both reviews and selections are O(log n).
+    """
+
+    def __init__(self, user_id: str):
+        self.user_id = user_id
+        self.items: Dict[str, ItemState] = {}
+        self._heaps: Dict[str, List[Tuple[float, str]]] = {}
+        self._kind_counts: Dict[str, int] = {}
+
+    def __contains__(self, item_id: str) -> bool:
+        return item_id in self.items
+
+    def __len__(self) -> int:
+        return len(self.items)
+
+    def _push(self, state: ItemState) -> None:
+        heap = self._heaps.setdefault(state.kind, [])
+        heapq.heappush(heap, (state.due, state.item_id))
+        # Rebuild once stale entries dominate, keeping the heap O(live items)
+        if len(heap) > 64 and len(heap) > 2 * self._kind_counts.get(state.kind, 0):
+            self._heaps[state.kind] = [(s.due, s.item_id) for s in self.items.values() if s.kind == state.kind]
+            heapq.heapify(self._heaps[state.kind])
+
+    def review(self, item_id: str, kind: str, correct: bool = None, quality: int = None,
+               now: float = None) -> ItemState:
+        """Applies an SM-2 update. `quality` is 0-5; `correct` maps to 4 or 1."""
+        now = time.time() if now is None else now
+        if quality is None:
+            quality = 4 if correct else 1
+
+        state = self.items.get(item_id)
+        if state is None:
+            state = self.items[item_id] = ItemState(item_id, kind)
+            self._kind_counts[kind] = self._kind_counts.get(kind, 0) + 1
+
+        if quality >= 3:
+            if state.repetitions == 0:
+                state.interval = 1.0
+            elif state.repetitions == 1:
+                state.interval = 6.0
+            else:
+                state.interval = round(state.interval * state.ease, 2)
+            state.repetitions += 1
+            state.due = now + state.interval * DAY
+        else:
+            # Failed items come back within the session, then restart the ladder
+            state.repetitions = 0
+            state.interval = 0.0
+            state.lapses += 1
+            state.due = now + RELEARN_DELAY_SECONDS
+
+        state.ease = max(1.3, state.ease + 0.1 - (5 - quality) * (0.08 + (5 - quality) * 0.02))
+        state.last_review = now
+        self._push(state)
+        return state
+
+    def due(self, kind: str, limit: int = 1, now: float = None) -> List[str]:
+        """Returns up to `limit` due item ids of a kind, most overdue first."""
+        now = time.time() if now is None else now
+        heap = self._heaps.get(kind)
+        if not heap:
+            return []
+
+        selected, popped = [], []
+        while heap and heap[0][0] <= now and len(selected) < limit:
+            entry = heapq.heappop(heap)
+            due_at, item_id = entry
+            state = self.items.get(item_id)
+            if state is None or state.due != due_at:
+                continue  # Stale entry left behind by a later review
+            popped.append(entry)
+            selected.append(item_id)
+
+        # Items stay scheduled until they are actually reviewed
+        for entry in popped:
+            heapq.heappush(heap, entry)
+        return selected
+
+    def pick(self, kind: str, candidates: Iterable[str], now: float = None) -> Optional[str]:
+        """
+        Picks the most overdue candidate, otherwise one never reviewed, otherwise None.
+        Looks up each candidate directly, so the cost is O(candidates) however many items are due.
+        """
+        now = time.time() if now is None else now
+        unseen, overdue = [], None
+        for item_id in candidates:
+            state = self.items.get(item_id)
+            if state is None:
+                unseen.append(item_id)
+            elif state.kind == kind and state.due <= now and (overdue is None or state.due < overdue.due):
+                overdue = state
+        if overdue is not None:
+            return overdue.item_id
+        return random.choice(unseen) if unseen else None
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {"user_id": self.user_id, "items": [state.to_list() for state in self.items.values()]}
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "SpacedRepetitionScheduler":
+        scheduler = cls(data["user_id"])
+        for row in data.get("items", []):
+            state = ItemState(*row)
+            scheduler.items[state.item_id] = state
+            scheduler._kind_counts[state.kind] = scheduler._kind_counts.get(state.kind, 0) + 1
+            scheduler._heaps.setdefault(state.kind, []).append((state.due, state.item_id))
+        for heap in scheduler._heaps.values():
+            heapq.heapify(heap)
+        return scheduler
+
+
+class SchedulerStore:
+    """Holds a SpacedRepetitionScheduler per user_id, loaded from and saved to a UserStateStore row per user."""
+
+    def __init__(self, state: UserStateStore = None):
+        self.state = state or UserStateStore("schedules")
+        self.users: Dict[str, SpacedRepetitionScheduler] = {}
+
+    def get(self, user_id: str) -> SpacedRepetitionScheduler:
+        scheduler = self.users.get(user_id)
+        if scheduler is None:
+            data = self.state.load(user_id)
+            scheduler = SpacedRepetitionScheduler.from_dict(data) if data else SpacedRepetitionScheduler(user_id)
+            self.users[user_id] = scheduler
+        return scheduler
+
+    def save(self, user_id: str) -> None:
+        """Persists one user's review state; call after a batch of reviews."""
+        self.state.save(user_id, self.get(user_id).to_dict())
+
+
+def benchmark(items: int = 100000, kinds: int = 10, candidates: int = 10, picks: int = 10000) -> Dict[str, Any]:
+    """
+    Per-operation latency of review, due and pick on one learner with `items`
+    scheduled items, most of them due (the worst case for selection).
+    """
+    scheduler = SpacedRepetitionScheduler("benchmark-user")
+    now = time.time()
+    started = time.perf_counter()
+    for index in range(items):
+        scheduler.review(f"item:{index}", f"kind:{index % kinds}", correct=index % 3 != 0, now=now - 30 * DAY)
+    review_us = (time.perf_counter() - started) * 1e6 / items
+
+    item_ids = list(scheduler.items)
+    started = time.perf_counter()
+    for index in range(picks):
+        scheduler.due(f"kind:{index % kinds}", limit=1, now=now)
+    due_us = (time.perf_counter() - started) * 1e6 / picks
+
+    pools = [random.sample(item_ids, candidates) + [f"unseen:{index}"] for index in range(picks)]
+    started = time.perf_counter()
+    for index, pool in enumerate(pools):
+        scheduler.pick(f"kind:{index % kinds}", pool, now=now)
+    pick_us = (time.perf_counter() - started) * 1e6 / picks
+
+    return {
+        "items": len(scheduler),
+        "due_items": sum(state.due <= now for state in scheduler.items.values()),
+        "review_us": round(review_us, 2),
+        "due_us": round(due_us, 2),
+        "pick_us": round(pick_us, 2),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the spaced-repetition scheduler (target: < 1 ms per pick).")
+    parser.add_argument("--items", type=int, default=100000)
+    parser.add_argument("--candidates", type=int, default=10)
+    args = parser.parse_args()
+    print(benchmark(args.items, candidates=args.candidates))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,278 @@
+import argparse
+import asyncio
+import json
+import time
+import zlib
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Any, List, Optional
+from fastapi import FastAPI, HTTPException
+from fastapi.responses import StreamingResponse
+from langchain_core.callbacks import BaseCallbackHandler
+from langchain_openai import ChatOpenAI
+from pydantic import BaseModel
+from models import UserProfile
+from orchestrator import Orchestrator
+from config import (SERVICE_ORCHESTRATORS, SERVICE_MAX_CONCURRENCY, SERVICE_QUEUE_TIMEOUT,
+                    SERVICE_SESSION_TTL, SERVICE_MAX_SESSIONS)
+
+
+class SessionRequest(BaseModel):
+    target_language: str = "Spanish"
+    difficulty_level: str = "Beginner"
+    learning_focus: str = "Vocabulary"
+
+
+class ConversationRequest(BaseModel):
+    message: str
+    stream: bool = False
+
+
+class FeedbackRequest(BaseModel):
+    # Exercise index (as returned by /exercises) -> the learner's answer
+    answers: Dict[int, Any]
+
+
+class Session:
+    """Per-session state: the profile, the exercises awaiting answers, and a lock serialising its turns."""
+
+    def __init__(self, profile: UserProfile):
+        self.profile = profile
+        self.correct_answers: Dict[int, Dict] = {}
+        self.lock = asyncio.Lock()
+        self.last_used = time.time()
+
+
+class OrchestratorPool:
+    """
+    A fixed set of Orchestrators built once at startup. Each session is pinned to
+    one of them by its id, so its conversation memory, learner stats and
+    schedulers always live in the same instance.
+    """
+
+    def __init__(self, llm: ChatOpenAI, size: int = SERVICE_ORCHESTRATORS):
+        self.orchestrators = [Orchestrator(llm) for _ in range(size)]
+
+    def for_session(self, session_id: str) -> Orchestrator:
+        return self.orchestrators[zlib.crc32(session_id.encode("utf-8")) % len(self.orchestrators)]
+
+    def flush(self) -> None:
+        for orchestrator in self.orchestrators:
+            orchestrator.conversational_agent.memory_pool.flush()
+
+
+class TokenQueueCallback(BaseCallbackHandler):
+    """Forwards streamed LLM tokens from a worker thread onto an asyncio queue."""
+
+    def __init__(self, loop: asyncio.AbstractEventLoop, queue: asyncio.Queue):
+        self.loop = loop
+        self.queue = queue
+
+    def on_llm_new_token(self, token: str, **kwargs) -> None:
+        if token:
+            self.loop.call_soon_threadsafe(self.queue.put_nowait, token)
+
+
+class TutorService:
+    """Sessions, admission control and the blocking-call thread pool behind the HTTP routes."""
+
+    def __init__(self, llm: ChatOpenAI, orchestrators: int = SERVICE_ORCHESTRATORS,
+                 max_concurrency: int = SERVICE_MAX_CONCURRENCY, queue_timeout: float = SERVICE_QUEUE_TIMEOUT):
+        self.pool = OrchestratorPool(llm, orchestrators)
+        self.sessions: "OrderedDict[str, Session]" = OrderedDict()
+        # Orchestrator calls block on the LLM, so they run on threads, at most max_concurrency at once
+        self.executor = ThreadPoolExecutor(max_workers=max_concurrency, thread_name_prefix="tutor-service")
+        self.slots = asyncio.Semaphore(max_concurrency)
+        self.max_concurrency = max_concurrency
+        self.queue_timeout = queue_timeout
+        self.in_flight = 0
+        self.waiting = 0
+        self.rejected = 0
+        self.completed = 0
+
+    def create_session(self, request: SessionRequest) -> str:
+        profile = UserProfile(target_language=request.target_language,
+                              difficulty_level=request.difficulty_level,
+                              learning_focus=request.learning_focus)
+        self.sessions[profile.user_id] = Session(profile)
+        self.expire_sessions()
+        return profile.user_id
+
+    def get_session(self, session_id: str) -> Session:
+        session = self.sessions.get(session_id)
+        if session is None:
+            raise HTTPException(status_code=404, detail=f"Unknown session {session_id}")
+        session.last_used = time.time()
+        self.sessions.move_to_end(session_id)
+        return session
+
+    def expire_sessions(self) -> None:
+        cutoff = time.time() - SERVICE_SESSION_TTL
+        while self.sessions:
+            session_id, session = next(iter(self.sessions.items()))
+            if session.last_used >= cutoff and len(self.sessions) <= SERVICE_MAX_SESSIONS:
+                break
+            del self.sessions[session_id]
+
+    async def acquire(self) -> None:
+        """Waits up to queue_timeout for a free slot, then sheds load with a 503."""
+        self.waiting += 1
+        try:
+            await asyncio.wait_for(self.slots.acquire(), timeout=self.queue_timeout)
+        except asyncio.TimeoutError:
+            self.rejected += 1
+            raise HTTPException(status_code=503, detail="Tutor is at capacity, retry shortly",
+                                headers={"Retry-After": str(int(self.queue_timeout))})
+        finally:
+            self.waiting -= 1
+        self.in_flight += 1
+
+    def release(self) -> None:
+        self.in_flight -= 1
+        self.completed += 1
+        self.slots.release()
+
+    async def call(self, session_id: str, method: str, *args, **kwargs):
+        """Runs an Orchestrator method for the session, one turn per session at a time."""
+        session = self.get_session(session_id)
+        orchestrator = self.pool.for_session(session_id)
+        async with session.lock:
+            await self.acquire()
+            try:
+                loop = asyncio.get_running_loop()
+                return await loop.run_in_executor(self.executor,
+                                                  lambda: getattr(orchestrator, method)(*args, **kwargs))
+            finally:
+                self.release()
+
+    async def stream_conversation(self, session_id: str, message: str):
+        """Yields server-sent events: one per token, then the full reply."""
+        session = self.get_session(session_id)
+        orchestrator = self.pool.for_session(session_id)
+        loop = asyncio.get_running_loop()
+        queue: asyncio.Queue = asyncio.Queue()
+        async with session.lock:
+            await self.acquire()
+            try:
+                future = loop.run_in_executor(
+                    self.executor,
+                    lambda: orchestrator.handle_conversation(message, session.profile,
+                                                             callbacks=[TokenQueueCallback(loop, queue)])
+                )
+                future.add_done_callback(lambda _: queue.put_nowait(None))
+                while True:
+                    token = await queue.get()
+                    if token is None:
+                        break
+                    yield f"data: {json.dumps({'token': token}, ensure_ascii=False)}\n\n"
+                try:
+                    response = future.result()
+                except Exception as e:
+                    yield f"data: {json.dumps({'error': str(e)})}\n\n"
+                    return
+                yield f"data: {json.dumps({'done': True, 'response': response}, ensure_ascii=False)}\n\n"
+            finally:
+                self.release()
+
+    def metrics(self) -> Dict[str, Any]:
+        return {
+            "sessions": len(self.sessions),
+            "orchestrators": len(self.pool.orchestrators),
+            "max_concurrency": self.max_concurrency,
+            "in_flight": self.in_flight,
+            "waiting": self.waiting,
+            "rejected": self.rejected,
+            "completed": self.completed,
+            "memory": [orchestrator.memory_metrics() for orchestrator in self.pool.orchestrators],
+        }
+
+
+def correct_answer_info(exercise: Dict) -> Dict:
+    """What provide_feedback needs to grade and record one exercise (as in app3)."""
+    return {
+        "correct_answer": exercise.get("correctAnswer") or exercise.get("correct_answer"),
+        "explanation": exercise.get("explanation", "No explanation provided"),
+        "id": exercise.get("id"),
+        "exercise_type": exercise.get("exercise_type"),
+        "theme": exercise.get("theme"),
+        "grammar_topic": exercise.get("grammar_topic"),
+        "tokens": exercise.get("tokens", 0)
+    }
+
+
+def create_app(llm: ChatOpenAI = None, **service_options) -> FastAPI:
+    app = FastAPI(title="AI Language Tutor")
+    service = TutorService(llm or ChatOpenAI(temperature=0.2, model="gpt-4-turbo", streaming=True, stream_usage=True),
+                           **service_options)
+    app.state.service = service
+
+    @app.post("/sessions")
+    async def create_session(request: SessionRequest):
+        return {"session_id": service.create_session(request)}
+
+    @app.get("/sessions/{session_id}")
+    async def get_session(session_id: str):
+        return service.get_session(session_id).profile.model_dump(
+            include={"user_id", "target_language", "difficulty_level", "learning_focus", "strengths", "weaknesses"}
+        )
+
+    @app.post("/sessions/{session_id}/conversation")
+    async def conversation(session_id: str, request: ConversationRequest):
+        if request.stream:
+            # Look the session up now so an unknown id is a 404, not an error inside the stream
+            service.get_session(session_id)
+            return StreamingResponse(service.stream_conversation(session_id, request.message),
+                                     media_type="text/event-stream")
+        session = service.get_session(session_id)
+        response = await service.call(session_id, "handle_conversation", request.message, session.profile)
+        return {"response": response}
+
+    @app.post("/sessions/{session_id}/exercises")
+    async def exercises(session_id: str):
+        session = service.get_session(session_id)
+        generated: List[Dict] = await service.call(session_id, "generate_exercises", session.profile)
+        session.correct_answers = {index: correct_answer_info(exercise)
+                                   for index, exercise in enumerate(generated) if isinstance(exercise, dict)}
+        return {"exercises": generated}
+
+    @app.post("/sessions/{session_id}/feedback")
+    async def feedback(session_id: str, request: FeedbackRequest):
+        session = service.get_session(session_id)
+        if not session.correct_answers:
+            raise HTTPException(status_code=409, detail="No exercises awaiting answers; generate some first")
+        correct_answers = {index: info for index, info in session.correct_answers.items() if index in request.answers}
+        result = await service.call(session_id, "provide_feedback", request.answers, correct_answers, session.profile)
+        return {"feedback": result}
+
+    @app.get("/metrics")
+    async def metrics():
+        return service.metrics()
+
+    @app.get("/health")
+    async def health():
+        return {"status": "ok"}
+
+    @app.on_event("shutdown")
+    def shutdown():
+        service.pool.flush()
+        service.executor.shutdown(wait=False)
+
+    return app
+
+
+def main():
+    import uvicorn
+    parser = argparse.ArgumentParser(description="Serve the tutor over HTTP.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--workers", type=int, default=1,
+                        help="Processes; only 1 is supported, since sessions live in the serving process")
+    args = parser.parse_args()
+    if args.workers != 1:
+        # Another worker would answer 404 for sessions it didn't create; scale with SERVICE_MAX_CONCURRENCY instead
+        parser.error("--workers must be 1: sessions are held in process memory")
+    uvicorn.run("service:create_app", factory=True, host=args.host, port=args.port, workers=args.workers)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,43 @@
+import json
+import sqlite3
+import threading
+import time
+from typing import Dict, Any, Optional
+from config import LEARNER_STATE_PATH
+
+
+class UserStateStore:
+    """
+    One JSON state row per user_id in a SQLite (WAL) table. Saving a user
+    rewrites only that user's row, so the cost doesn't grow with the number of learners.
+    """
+
+    def __init__(self, table: str, path: str = LEARNER_STATE_PATH):
+        self.table = table
+        self.path = path
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.lock = threading.Lock()
+        with self.lock, self.conn:
+            self.conn.execute("PRAGMA journal_mode=WAL")
+            self.conn.execute(f"""
+                CREATE TABLE IF NOT EXISTS {table} (
+                    user_id TEXT PRIMARY KEY,
+                    state TEXT NOT NULL,
+                    updated_at REAL NOT NULL
+                )
+            """)
+
+    def save(self, user_id: str, state: Dict[str, Any]) -> None:
+        with self.lock, self.conn:
+            self.conn.execute(
+                f"INSERT OR REPLACE INTO {self.table} (user_id, state, updated_at) VALUES (?, ?, ?)",
+                (user_id, json.dumps(state, ensure_ascii=False), time.time())
+            )
+
+    def load(self, user_id: str) -> Optional[Dict[str, Any]]:
+        with self.lock:
+            row = self.conn.execute(f"SELECT state FROM {self.table} WHERE user_id = ?", (user_id,)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def close(self) -> None:
+        self.conn.close()
@@ -0,0 +1,95 @@
+import threading
+import time
+from collections import deque
+from typing import Callable, Dict, Any
+from langchain_core.callbacks import BaseCallbackHandler
+from config import STREAM_FLUSH_SECONDS, STREAM_FLUSH_CHARS
+
+
+class TokenStreamCallback(BaseCallbackHandler):
+    """
+    Passes each streamed LLM token to `on_token` and times the first one.
+    Create one per request: it holds that request's timings, and the shared LLM
+    never sees it outside the request's own callbacks config.
+    """
+
+    def __init__(self, on_token: Callable[[str], None]):
+        self.on_token = on_token
+        self.started = time.perf_counter()
+        self.first_token_at = None
+        self.tokens = 0
+
+    def on_llm_new_token(self, token: str, **kwargs) -> None:
+        # Function-call steps of the agent stream empty content; only text counts
+        if not token:
+            return
+        if self.first_token_at is None:
+            self.first_token_at = time.perf_counter()
+        self.tokens += 1
+        self.on_token(token)
+
+    @property
+    def ttft(self) -> float:
+        """Seconds from the request to its first token, or None if nothing streamed."""
+        return None if self.first_token_at is None else self.first_token_at - self.started
+
+
+class ThrottledRenderer:
+    """
+    Collects streamed tokens and calls `render(text so far)` at most every
+    `flush_seconds`, or sooner once `flush_chars` are waiting, instead of on
+    every token. Call flush() when the stream ends.
+    """
+
+    def __init__(self, render: Callable[[str], None], flush_seconds: float = STREAM_FLUSH_SECONDS,
+                 flush_chars: int = STREAM_FLUSH_CHARS):
+        self.render = render
+        self.flush_seconds = flush_seconds
+        self.flush_chars = flush_chars
+        self.shown = ""
+        self.pending = []
+        self.pending_chars = 0
+        self.flushes = 0
+        self.last_flush = time.perf_counter()
+
+    def add(self, token: str) -> None:
+        self.pending.append(token)
+        self.pending_chars += len(token)
+        if self.pending_chars >= self.flush_chars or time.perf_counter() - self.last_flush >= self.flush_seconds:
+            self.flush()
+
+    def flush(self) -> None:
+        if not self.pending:
+            return
+        self.shown += "".join(self.pending)
+        self.pending = []
+        self.pending_chars = 0
+        self.render(self.shown)
+        self.last_flush = time.perf_counter()
+        self.flushes += 1
+
+
+class StreamLatencyStats:
+    """Time to first token and total time of recent streamed responses."""
+
+    def __init__(self, maxlen: int = 500):
+        self.lock = threading.Lock()
+        # (ttft seconds or None, total seconds, tokens)
+        self.recent = deque(maxlen=maxlen)
+
+    def record(self, callback: TokenStreamCallback) -> None:
+        with self.lock:
+            self.recent.append((callback.ttft, time.perf_counter() - callback.started, callback.tokens))
+
+    def report(self) -> Dict[str, Any]:
+        with self.lock:
+            recent = list(self.recent)
+        ttfts = sorted(entry[0] for entry in recent if entry[0] is not None)
+        totals = sorted(entry[1] for entry in recent)
+        return {
+            "responses": len(recent),
+            "ttft_s_avg": round(sum(ttfts) / len(ttfts), 3) if ttfts else None,
+            "ttft_s_p95": round(ttfts[int(0.95 * (len(ttfts) - 1))], 3) if ttfts else None,
+            "total_s_avg": round(sum(totals) / len(totals), 3) if totals else None,
+            "tokens_avg": round(sum(entry[2] for entry in recent) / len(recent), 1) if recent else None,
+        }
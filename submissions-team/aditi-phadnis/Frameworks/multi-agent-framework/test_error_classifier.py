@@ -0,0 +1,21 @@
+from error_classifier import classify_answer, classify_bulk, weaknesses_from_categories
+
+# Sample user answers paired with the correct answers (no LLM needed)
+answer_pairs = [
+    ("comó", "comí"),                       # ending / person
+    ("comemos", "comimos"),                 # ending (tense vowel)
+    ("resolvio", "resolvió"),               # accent
+    ("bonito", "bonita"),                   # gender agreement
+    ("fuemos", "fuimos"),                   # stem
+    ("escribsite", "escribiste"),           # typo
+    ("el casa roja", "la casa roja"),       # article agreement
+]
+
+# Tag each answer
+for user_answer, correct_answer in answer_pairs:
+    print(f"{user_answer!r} vs {correct_answer!r}:", classify_answer(user_answer, correct_answer))
+
+# Classify in bulk and derive profile weaknesses
+categories = classify_bulk(answer_pairs)
+print("\n🔹 Categories:", categories)
+print("🔹 Weaknesses:", weaknesses_from_categories(categories))
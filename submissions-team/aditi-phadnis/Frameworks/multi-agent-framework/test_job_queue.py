@@ -0,0 +1,69 @@
+import os
+import tempfile
+import time
+from job_queue import JobQueue
+
+
+def make_queue() -> JobQueue:
+    return JobQueue(os.path.join(tempfile.mkdtemp(), "jobs.db"))
+
+
+def test_claim_dedup_and_complete():
+    queue = make_queue()
+    job_id = queue.submit("exercises", {"user_id": "u1"}, dedup_key="u1")
+    # An identical job while the first is unfinished shares its id
+    assert queue.submit("exercises", {"user_id": "u1"}, dedup_key="u1") == job_id
+
+    job = queue.claim(["exercises"])
+    assert job["id"] == job_id and job["attempts"] == 1 and job["status"] == "running"
+    assert queue.claim(["exercises"]) is None
+    assert queue.complete(job_id, job["attempts"], {"exercises": []})
+    assert queue.poll(job_id)["status"] == "done"
+
+
+def test_retry_then_dead_letter():
+    queue = make_queue()
+    job_id = queue.submit("exercises", {}, max_attempts=2)
+
+    job = queue.claim(["exercises"])
+    assert queue.fail(job_id, job["attempts"], "boom", retry_base=0.0) == "queued"
+    job = queue.claim(["exercises"])
+    assert job["attempts"] == 2
+    assert queue.fail(job_id, job["attempts"], "boom again", retry_base=0.0) == "dead"
+    assert [dead["id"] for dead in queue.dead_letters()] == [job_id]
+
+    queue.requeue(job_id)
+    assert queue.claim(["exercises"])["attempts"] == 1
+
+
+def test_expired_lease_is_reclaimed_and_stale_worker_loses_ownership():
+    queue = make_queue()
+    job_id = queue.submit("exercises", {})
+
+    stale = queue.claim(["exercises"], lease_seconds=0.0)
+    time.sleep(0.01)
+    fresh = queue.claim(["exercises"])
+    assert fresh["id"] == job_id and fresh["attempts"] == 2
+
+    # The first worker finishing late can't overwrite or fail the reclaimed job
+    assert not queue.complete(job_id, stale["attempts"], "late result")
+    assert queue.fail(job_id, stale["attempts"], "late error") == "lost"
+    assert queue.complete(job_id, fresh["attempts"], "result")
+    assert queue.poll(job_id)["result"] == "result"
+
+
+def test_expired_lease_on_last_attempt_is_dead_lettered():
+    queue = make_queue()
+    job_id = queue.submit("exercises", {}, max_attempts=1)
+
+    queue.claim(["exercises"], lease_seconds=0.0)
+    time.sleep(0.01)
+    assert queue.claim(["exercises"]) is None
+    assert queue.poll(job_id)["status"] == "dead"
+
+
+if __name__ == "__main__":
+    for name, test in list(globals().items()):
+        if name.startswith("test_"):
+            test()
+            print(f"✅ {name}")
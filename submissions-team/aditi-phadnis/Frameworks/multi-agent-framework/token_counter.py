@@ -0,0 +1,45 @@
+from functools import lru_cache
+from typing import Any, Iterable
+
+try:
+    import tiktoken
+except ImportError:  # Falls back to a character estimate
+    tiktoken = None
+
+# Chat formatting overhead per message (role markers etc.), as used by OpenAI's counting guide
+MESSAGE_OVERHEAD_TOKENS = 4
+_ENCODING_NAME = "cl100k_base"
+
+
+@lru_cache(maxsize=1)
+def _encoding():
+    """Loads the local BPE tokenizer once; None if it isn't available."""
+    if tiktoken is None:
+        return None
+    try:
+        return tiktoken.get_encoding(_ENCODING_NAME)
+    except Exception:
+        # The encoding file could not be loaded (e.g. offline without a cache)
+        return None
+
+
+def count_tokens(text: str) -> int:
+    """Counts tokens in a string with the local tokenizer (≈ 4 characters/token fallback)."""
+    if not text:
+        return 0
+    encoding = _encoding()
+    if encoding is None:
+        return max(1, len(text) // 4)
+    return len(encoding.encode(text, disallowed_special=()))
+
+
+def count_message_tokens(message: Any) -> int:
+    """Counts tokens in a chat message (anything with `.content`, or a plain string)."""
+    content = message.content if hasattr(message, "content") else message
+    if not isinstance(content, str):
+        content = str(content)
+    return count_tokens(content) + MESSAGE_OVERHEAD_TOKENS
+
+
+def count_messages_tokens(messages: Iterable[Any]) -> int:
+    return sum(count_message_tokens(message) for message in messages)
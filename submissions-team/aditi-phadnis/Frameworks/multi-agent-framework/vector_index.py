@@ -0,0 +1,147 @@
+import base64
+import math
+import re
+import zlib
+from functools import lru_cache
+from typing import List, Tuple
+import numpy as np
+from error_classifier import strip_accents
+from config import RETRIEVAL_EMBED_DIM, RETRIEVAL_EXACT_ROWS, RETRIEVAL_PROBES
+
+_WORD_RE = re.compile(r"\w+")
+# Character n-grams make the embedding robust to inflections and typos (hablo/hablamos)
+CHAR_NGRAM = 3
+NGRAM_WEIGHT = 0.5
+
+
+@lru_cache(maxsize=100000)
+def _feature(token: str, dim: int) -> Tuple[int, float]:
+    """Hashes a token to a (dimension, ±1) pair; signed hashing keeps collisions unbiased."""
+    h = zlib.crc32(token.encode("utf-8"))
+    return h % dim, 1.0 if (h >> 31) & 1 else -1.0
+
+
+class HashingEmbedder:
+    """
+    Local, dependency-free text embedding: words and character trigrams are
+    hashed into a fixed-size vector and L2-normalised, so cosine similarity is
+    a dot product. No model download and no API call per turn.
+    """
+
+    def __init__(self, dim: int = RETRIEVAL_EMBED_DIM):
+        self.dim = dim
+
+    def embed(self, text: str) -> np.ndarray:
+        indices: List[int] = []
+        weights: List[float] = []
+        for word in _WORD_RE.findall(strip_accents(text.lower())):
+            index, sign = _feature(word, self.dim)
+            indices.append(index)
+            weights.append(sign)
+            padded = f"#{word}#"
+            for start in range(len(padded) - CHAR_NGRAM + 1):
+                index, sign = _feature(padded[start:start + CHAR_NGRAM], self.dim)
+                indices.append(index)
+                weights.append(sign * NGRAM_WEIGHT)
+
+        vector = np.bincount(indices, weights, self.dim).astype(np.float32) if indices \
+            else np.zeros(self.dim, dtype=np.float32)
+        norm = float(np.linalg.norm(vector))
+        return vector / norm if norm else vector
+
+
+class VectorIndex:
+    """
+    Inner-product index over a contiguous float32 matrix, with amortised O(1)
+    appends. Up to `exact_rows` rows a search scans everything. Beyond that the
+    rows are bucketed by their nearest of ~sqrt(n) k-means centroids (an IVF
+    index) and a search only scans the `probes` buckets closest to the query,
+    so latency stays flat as a learner's history grows.
+    """
+
+    def __init__(self, dim: int = RETRIEVAL_EMBED_DIM, capacity: int = 64,
+                 exact_rows: int = RETRIEVAL_EXACT_ROWS, probes: int = RETRIEVAL_PROBES):
+        self.dim = dim
+        self.vectors = np.zeros((capacity, dim), dtype=np.float32)
+        self.size = 0
+        self.exact_rows = exact_rows
+        self.probes = probes
+        self.centroids = None
+        # Row ids per centroid; plain lists so adding a row is an append
+        self.buckets: List[List[int]] = []
+        # Retrain once the index has grown this large
+        self.trained_size = 0
+
+    def __len__(self) -> int:
+        return self.size
+
+    def add(self, vector: np.ndarray) -> int:
+        if self.size == len(self.vectors):
+            grown = np.zeros((2 * len(self.vectors), self.dim), dtype=np.float32)
+            grown[:self.size] = self.vectors[:self.size]
+            self.vectors = grown
+        row = self.size
+        self.vectors[row] = vector
+        self.size += 1
+
+        if self.size >= self.exact_rows and self.size >= 2 * self.trained_size:
+            self.train()
+        elif self.centroids is not None:
+            self.buckets[int(np.argmax(self.centroids @ vector))].append(row)
+        return row
+
+    def train(self, iterations: int = 8, seed: int = 0) -> None:
+        """Fits spherical k-means centroids on a sample and re-buckets every row."""
+        rng = np.random.default_rng(seed)
+        n_lists = max(1, int(math.sqrt(self.size)))
+        vectors = self.vectors[:self.size]
+        sample = vectors[rng.choice(self.size, min(self.size, 32 * n_lists), replace=False)]
+        centroids = sample[rng.choice(len(sample), n_lists, replace=False)].copy()
+        for _ in range(iterations):
+            assignment = np.argmax(sample @ centroids.T, axis=1)
+            sums = np.zeros_like(centroids)
+            np.add.at(sums, assignment, sample)
+            norms = np.linalg.norm(sums, axis=1, keepdims=True)
+            # Empty clusters keep their previous centroid
+            centroids = np.where(norms > 0, sums / np.maximum(norms, 1e-12), centroids)
+
+        assignment = np.concatenate([np.argmax(vectors[start:start + 8192] @ centroids.T, axis=1)
+                                     for start in range(0, self.size, 8192)])
+        order = np.argsort(assignment, kind="stable")
+        bounds = np.searchsorted(assignment[order], np.arange(n_lists + 1))
+        self.buckets = [order[bounds[i]:bounds[i + 1]].tolist() for i in range(n_lists)]
+        self.centroids = centroids
+        self.trained_size = self.size
+
+    def search(self, query: np.ndarray, k: int, limit: int = None, min_score: float = None) -> List[Tuple[int, float]]:
+        """Returns up to `k` (row, score) pairs, best first, among the first `limit` rows."""
+        n = self.size if limit is None else max(0, min(limit, self.size))
+        if n == 0 or k <= 0:
+            return []
+        if self.centroids is None or n < self.exact_rows:
+            rows = np.arange(n)
+            scores = self.vectors[:n] @ query
+        else:
+            nearest = np.argsort(-(self.centroids @ query))[:self.probes]
+            rows = np.concatenate([np.asarray(self.buckets[bucket], dtype=np.int64) for bucket in nearest])
+            if n < self.size:
+                rows = rows[rows < n]
+            if len(rows) == 0:
+                return []
+            scores = self.vectors[rows] @ query
+        top = np.argpartition(-scores, k)[:k] if len(rows) > k else np.arange(len(rows))
+        top = top[np.argsort(-scores[top], kind="stable")]
+        return [(int(rows[i]), float(scores[i])) for i in top if min_score is None or scores[i] >= min_score]
+
+    def to_base64(self) -> str:
+        return base64.b64encode(self.vectors[:self.size].tobytes()).decode("ascii")
+
+    @classmethod
+    def from_base64(cls, data: str, dim: int = RETRIEVAL_EMBED_DIM) -> "VectorIndex":
+        vectors = np.frombuffer(base64.b64decode(data), dtype=np.float32).reshape(-1, dim)
+        index = cls(dim, capacity=max(64, len(vectors)))
+        index.vectors[:len(vectors)] = vectors
+        index.size = len(vectors)
+        if index.size >= index.exact_rows:
+            index.train()
+        return index
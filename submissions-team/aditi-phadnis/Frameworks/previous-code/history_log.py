@@ -0,0 +1,209 @@
+"""
+Compact profile histories for multi-agent.py.
+
+Entries are __slots__ records with interned labels, held in an append-only
+HistoryLog whose slices are views rather than copies. Run this file to compare
+memory, serialization and tail reads against the plain list-of-dicts histories
+it replaced.
+"""
+import argparse
+import sys
+import time
+import tracemalloc
+from typing import Any, Dict, List
+
+
+class HistoryRecord:
+    """
+    Base for compact history entries: fixed slots instead of a per-entry dict,
+    with dict-style reads (`entry["user"]`, `"user" in entry`) kept for callers.
+    """
+    __slots__ = ()
+
+    def __getitem__(self, key: str):
+        try:
+            return getattr(self, key)
+        except AttributeError:
+            raise KeyError(key) from None
+
+    def __contains__(self, key: str) -> bool:
+        return key in self.__slots__
+
+    def get(self, key: str, default=None):
+        return getattr(self, key, default)
+
+    def to_dict(self) -> Dict:
+        return {key: getattr(self, key) for key in self.__slots__}
+
+
+class ConversationTurn(HistoryRecord):
+    __slots__ = ("user", "agent", "language")
+
+    def __init__(self, user: str, agent: str, language: str):
+        self.user = user
+        self.agent = agent
+        # Repeated labels share one string object across all records
+        self.language = sys.intern(language)
+
+
+class ExerciseRecord(HistoryRecord):
+    __slots__ = ("exercise_type", "language", "difficulty", "content")
+
+    def __init__(self, exercise_type: str, content: Any, language: str, difficulty: str):
+        self.exercise_type = sys.intern(exercise_type)
+        self.language = sys.intern(language)
+        self.difficulty = sys.intern(difficulty)
+        self.content = content
+
+
+class FeedbackRecord(HistoryRecord):
+    __slots__ = ("user_input", "agent_response", "feedback", "language")
+
+    def __init__(self, user_input: str, agent_response: str, feedback: Any, language: str):
+        self.user_input = user_input
+        self.agent_response = agent_response
+        self.feedback = feedback
+        self.language = sys.intern(language)
+
+
+class HistoryView:
+    """Read-only window onto a HistoryLog; slicing never copies the records."""
+    __slots__ = ("records", "start", "stop")
+
+    def __init__(self, records: list, start: int, stop: int):
+        self.records = records
+        self.start = start
+        self.stop = max(start, stop)
+
+    def __len__(self) -> int:
+        return self.stop - self.start
+
+    def __bool__(self) -> bool:
+        return self.stop > self.start
+
+    def __iter__(self):
+        return map(self.records.__getitem__, range(self.start, self.stop))
+
+    def __getitem__(self, index: int):
+        if isinstance(index, slice):
+            start, stop, step = index.indices(len(self))
+            if step != 1:
+                return [self[i] for i in range(start, stop, step)]
+            return HistoryView(self.records, self.start + start, self.start + stop)
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError("history index out of range")
+        return self.records[self.start + index]
+
+
+class HistoryLog:
+    """Append-only history of HistoryRecords; `log[-n:]` returns a HistoryView."""
+    __slots__ = ("records",)
+
+    def __init__(self, records: list = None):
+        self.records = list(records or [])
+
+    def append(self, record: HistoryRecord) -> None:
+        self.records.append(record)
+
+    def __len__(self) -> int:
+        return len(self.records)
+
+    def __bool__(self) -> bool:
+        return bool(self.records)
+
+    def __iter__(self):
+        return iter(self.records)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return HistoryView(self.records, 0, len(self.records))[index]
+        return self.records[index]
+
+    def recent(self, n: int) -> HistoryView:
+        return HistoryView(self.records, max(0, len(self.records) - n), len(self.records))
+
+    def to_list(self) -> List[Dict]:
+        return [record.to_dict() for record in self.records]
+
+
+HISTORY_FIELDS = ["conversation_history", "exercise_history", "feedback_history"]
+
+
+def _legacy_entries(n: int) -> Dict[str, List[Dict]]:
+    """The List[Dict] histories the records replaced."""
+    return {
+        "conversation_history": [{"user": f"¿Qué significa 'sobremesa'? ({i})", "agent": f"Es la charla después de comer. ({i})",
+                                  "language": "Spanish"} for i in range(n)],
+        "exercise_history": [{"type": "vocabulary", "content": f"Ejercicio {i}", "language": "Spanish",
+                              "difficulty": "Beginner"} for i in range(n)],
+        "feedback_history": [{"user_input": f"Yo comí ({i})", "agent_response": f"¡Bien! ({i})",
+                              "feedback": f"Correct use of the preterite ({i})", "language": "Spanish"} for i in range(n)],
+    }
+
+
+def _compact_entries(n: int) -> Dict[str, HistoryLog]:
+    histories = {field: HistoryLog() for field in HISTORY_FIELDS}
+    for i in range(n):
+        histories["conversation_history"].append(ConversationTurn(
+            f"¿Qué significa 'sobremesa'? ({i})", f"Es la charla después de comer. ({i})", "Spanish"))
+        histories["exercise_history"].append(ExerciseRecord("vocabulary", f"Ejercicio {i}", "Spanish", "Beginner"))
+        histories["feedback_history"].append(FeedbackRecord(
+            f"Yo comí ({i})", f"¡Bien! ({i})", f"Correct use of the preterite ({i})", "Spanish"))
+    return histories
+
+
+def _measure(build, serialize, tail, n: int, repeat: int) -> Dict[str, float]:
+    tracemalloc.start()
+    histories = build(n)
+    memory_mb = tracemalloc.get_traced_memory()[0] / 1e6
+    tracemalloc.stop()
+
+    started = time.perf_counter()
+    for _ in range(repeat):
+        serialize(histories)
+    serialize_ms = (time.perf_counter() - started) * 1000 / repeat
+
+    started = time.perf_counter()
+    for _ in range(repeat * 100):
+        tail(histories)
+    tail_us = (time.perf_counter() - started) * 1e6 / (repeat * 100)
+    return {"memory_mb": round(memory_mb, 2), "serialize_ms": round(serialize_ms, 3), "tail_us": round(tail_us, 3)}
+
+
+def benchmark(entries: int = 10000, repeat: int = 20) -> Dict[str, Dict[str, float]]:
+    """
+    Memory of three histories of `entries` each, the cost of serializing them
+    to the same list of dicts (what pydantic's .dict() produced), and of
+    reading the last three conversation turns as dicts. The summary() row is
+    the profile serialization that only counts the histories.
+    """
+    compact_tail = lambda histories: [entry.to_dict() for entry in histories["conversation_history"].recent(3)]
+    return {
+        "list_of_dicts": _measure(
+            _legacy_entries,
+            lambda histories: {field: [dict(entry) for entry in entries] for field, entries in histories.items()},
+            lambda histories: [dict(entry) for entry in histories["conversation_history"][-3:]],
+            entries, repeat),
+        "history_log": _measure(
+            _compact_entries,
+            lambda histories: {field: log.to_list() for field, log in histories.items()},
+            compact_tail, entries, repeat),
+        "history_log_summary": _measure(
+            _compact_entries,
+            lambda histories: {f"{field}_size": len(log) for field, log in histories.items()},
+            compact_tail, entries, repeat),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare compact history records with list-of-dicts histories.")
+    parser.add_argument("--entries", type=int, default=10000, help="Entries in each of the three histories")
+    args = parser.parse_args()
+    for name, figures in benchmark(args.entries).items():
+        print(f"{name:<20} {figures}")
+
+
+if __name__ == "__main__":
+    main()
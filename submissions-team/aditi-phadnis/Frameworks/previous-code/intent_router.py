@@ -0,0 +1,361 @@
+"""
+Local intent router for multi-agent.py.
+
+Keyword rules catch the unambiguous requests; everything else goes through
+small softmax classifiers over hashed character n-grams, trained in a few
+milliseconds on the examples below when the router is created. A route is
+only returned when it is confident, so the caller can fall back to the LLM
+router for the rest. Run this file to score the router on EVAL_SET.
+"""
+import re
+import time
+import zlib
+from typing import Dict, List, Optional, Tuple
+import numpy as np
+
+AGENTS = ["conversation", "exercise", "idioms", "feedback"]
+EXERCISE_TYPES = ["vocabulary", "grammar", "conversation", "reading_comprehension", "listening_comprehension"]
+IDIOM_REQUEST_TYPES = ["explain_idiom", "detect_idioms", "suggest_idioms", "explain_sarcasm"]
+
+# Below this probability the local route is not trusted
+MIN_CONFIDENCE = 0.6
+# Shorter (stripped) input carries no intent and is not routed
+MIN_INPUT_CHARS = 2
+N_FEATURES = 2 ** 14
+NGRAM_SIZES = (2, 3, 4)
+
+# (pattern, agent, sub-type); a message matching rules of exactly one agent is routed without the model
+KEYWORD_RULES = [
+    (r"\b(quiz|exercises?|drills?|worksheet|test me|practice questions?)\b", "exercise", None),
+    (r"\b(idioms?|sayings?|proverbs?|colloquial\w*|slang|sarcas\w*|figures? of speech)\b", "idioms", None),
+    (r"\b(my progress|how am i doing|how i'?m doing|feedback on my|my weak\w*|my strengths?|"
+     r"what should i (study|focus on|learn) next|next steps)\b", "feedback", None),
+]
+SUB_TYPE_RULES = {
+    "exercise": [
+        (r"\b(vocab\w*|words?|flashcards?)\b", "vocabulary"),
+        (r"\b(grammar|conjugat\w*|tenses?|subjunctive|articles?|verbs?)\b", "grammar"),
+        (r"\b(role[- ]?play|dialog(ue)?s?|conversation)\b", "conversation"),
+        (r"\b(reading|read|texts?|passages?|articles? to read)\b", "reading_comprehension"),
+        (r"\b(listening|listen|audio|hear)\b", "listening_comprehension"),
+    ],
+    "idioms": [
+        (r"\bsarcas\w*|\bironic\w*|\birony\b", "explain_sarcasm"),
+        (r"\b(any|are there|which|find|spot|detect)\b.*\b(idioms?|expressions?)\b.*\b(in|used)\b", "detect_idioms"),
+        (r"\b(suggest|give me|teach me|list|some|useful)\b.*\b(idioms?|expressions?|sayings?)\b", "suggest_idioms"),
+        (r"\b(what does|meaning|mean|explain)\b", "explain_idiom"),
+    ],
+}
+
+TRAINING_EXAMPLES: List[Tuple[str, str, Optional[str]]] = [
+    ("Hola, ¿cómo estás hoy?", "conversation", None),
+    ("Can we talk about my weekend in Spanish?", "conversation", None),
+    ("How do you say 'I am hungry' in French?", "conversation", None),
+    ("Let's chat about food", "conversation", None),
+    ("What's the difference between ser and estar?", "conversation", None),
+    ("Tell me about Paris", "conversation", None),
+    ("Je voudrais parler de mon travail", "conversation", None),
+    ("Can you correct this sentence: yo es estudiante", "conversation", None),
+    ("I went to the market yesterday and bought apples", "conversation", None),
+    ("Translate 'good morning' please", "conversation", None),
+    ("What does 'gracias' mean?", "conversation", None),
+    ("Ich möchte über Musik sprechen", "conversation", None),
+    ("Why is it 'la mano' and not 'el mano'?", "conversation", None),
+    ("Good evening! I'd like to practice speaking", "conversation", None),
+    ("Me gusta mucho el fútbol, ¿y a ti?", "conversation", None),
+    ("How would I order a coffee politely?", "conversation", None),
+    ("My name is Ana and I live in Madrid", "conversation", None),
+    ("Yesterday I cooked dinner for my friends", "conversation", None),
+    ("¿Puedes hablar más despacio?", "conversation", None),
+    ("What is the plural of 'lápiz'?", "conversation", None),
+    ("Can you explain when to use the accent on 'sí'?", "conversation", None),
+    ("Bonjour, je m'appelle Marc", "conversation", None),
+    ("I don't understand your last answer", "conversation", None),
+    ("Tell me a short story in Italian", "conversation", None),
+    ("How do you pronounce 'ciudad'?", "conversation", None),
+    ("Is this sentence correct: nosotros vamos a la playa mañana", "conversation", None),
+    ("Give me a vocabulary quiz about food", "exercise", "vocabulary"),
+    ("I want to practice new words for travel", "exercise", "vocabulary"),
+    ("Make me some flashcards on colors", "exercise", "vocabulary"),
+    ("Can I get a grammar exercise on the past tense?", "exercise", "grammar"),
+    ("Test me on verb conjugation", "exercise", "grammar"),
+    ("Drill me on the subjunctive", "exercise", "grammar"),
+    ("I need practice with articles and gender", "exercise", "grammar"),
+    ("Create a role-play at a restaurant", "exercise", "conversation"),
+    ("Give me a dialogue to practice ordering at a hotel", "exercise", "conversation"),
+    ("Let me practise a conversation scenario at the airport", "exercise", "conversation"),
+    ("Give me a short text to read and questions about it", "exercise", "reading_comprehension"),
+    ("I want a reading comprehension exercise", "exercise", "reading_comprehension"),
+    ("Can I read a passage and answer questions?", "exercise", "reading_comprehension"),
+    ("Listening practice please", "exercise", "listening_comprehension"),
+    ("I want to improve my listening with an audio exercise", "exercise", "listening_comprehension"),
+    ("Play something for me to hear and answer", "exercise", "listening_comprehension"),
+    ("Quiz me", "exercise", "vocabulary"),
+    ("Give me some practice questions", "exercise", "vocabulary"),
+    ("What does 'tomar el pelo' mean?", "idioms", "explain_idiom"),
+    ("Explain the expression 'costar un ojo de la cara'", "idioms", "explain_idiom"),
+    ("What is the meaning of 'avoir le cafard'?", "idioms", "explain_idiom"),
+    ("Explain the idiom 'estar en las nubes'", "idioms", "explain_idiom"),
+    ("Are there any idioms in this sentence: me tomas el pelo", "idioms", "detect_idioms"),
+    ("Find the expressions used in this text", "idioms", "detect_idioms"),
+    ("Which idioms are in: llueve a cántaros", "idioms", "detect_idioms"),
+    ("Suggest some idioms about the weather", "idioms", "suggest_idioms"),
+    ("Teach me useful sayings for work", "idioms", "suggest_idioms"),
+    ("Give me common expressions about money", "idioms", "suggest_idioms"),
+    ("List a few proverbs about friendship", "idioms", "suggest_idioms"),
+    ("Is 'qué bonito' sarcastic here?", "idioms", "explain_sarcasm"),
+    ("How do French people use sarcasm?", "idioms", "explain_sarcasm"),
+    ("Was he being ironic when he said 'genial'?", "idioms", "explain_sarcasm"),
+    ("How am I doing?", "feedback", None),
+    ("Show me my progress", "feedback", None),
+    ("What are my weaknesses?", "feedback", None),
+    ("What should I focus on next?", "feedback", None),
+    ("Give me feedback on my learning so far", "feedback", None),
+    ("Am I improving?", "feedback", None),
+    ("Recommend what to study next", "feedback", None),
+    ("Analyze my learning history", "feedback", None),
+    ("What are my strengths in Spanish?", "feedback", None),
+    ("How much have I learned this week?", "feedback", None),
+    ("Where do I keep making mistakes?", "feedback", None),
+    ("Which areas do I need to work on?", "feedback", None),
+    ("Am I ready for the intermediate level?", "feedback", None),
+]
+
+EVAL_SET: List[Tuple[str, str, Optional[str]]] = [
+    ("¿Qué tal tu día?", "conversation", None),
+    ("Can you help me say 'where is the station' in German?", "conversation", None),
+    ("I visited my grandmother last Sunday", "conversation", None),
+    ("Parlons de cinéma", "conversation", None),
+    ("Is it 'por' or 'para' in this sentence?", "conversation", None),
+    ("Correct me: ella tiene veinte años y es alto", "conversation", None),
+    ("How do I greet someone formally?", "conversation", None),
+    ("Let's talk about the weather", "conversation", None),
+    ("Give me a quiz on animals vocabulary", "exercise", "vocabulary"),
+    ("I'd like an exercise to learn kitchen words", "exercise", "vocabulary"),
+    ("Practice questions on irregular verbs please", "exercise", "grammar"),
+    ("Drill me on the future tense", "exercise", "grammar"),
+    ("Make a role-play exercise about buying a train ticket", "exercise", "conversation"),
+    ("A reading exercise about Spanish history please", "exercise", "reading_comprehension"),
+    ("Give me a listening exercise", "exercise", "listening_comprehension"),
+    ("Test me on numbers words", "exercise", "vocabulary"),
+    ("What does 'echar una mano' mean?", "idioms", "explain_idiom"),
+    ("Explain the saying 'más vale tarde que nunca'", "idioms", "explain_idiom"),
+    ("Are there idioms in 'está lloviendo a cántaros'?", "idioms", "detect_idioms"),
+    ("Suggest idioms for a job interview", "idioms", "suggest_idioms"),
+    ("Teach me some slang expressions about friends", "idioms", "suggest_idioms"),
+    ("Is 'oh, qué sorpresa' sarcastic?", "idioms", "explain_sarcasm"),
+    ("How is my progress looking?", "feedback", None),
+    ("What should I study next?", "feedback", None),
+    ("Give me feedback on my weak areas", "feedback", None),
+    ("Which topics am I weakest at?", "feedback", None),
+    ("Have I improved since last week?", "feedback", None),
+    ("What are my next steps?", "feedback", None),
+    ("Buenos días, ¿qué hiciste ayer?", "conversation", None),
+    ("I just moved to Lyon and I'm a bit nervous", "conversation", None),
+    ("How do I ask for the bill at a restaurant?", "conversation", None),
+    ("Why do you say 'el agua' if agua is feminine?", "conversation", None),
+    ("Can you repeat that more slowly?", "conversation", None),
+    ("Mi hermano trabaja en un hospital", "conversation", None),
+    ("What's the word for 'umbrella' in Italian?", "conversation", None),
+    ("Let's discuss your favourite books", "conversation", None),
+    ("Is 'tú' or 'usted' better with my boss?", "conversation", None),
+    ("Tengo un perro que se llama Toby", "conversation", None),
+    ("How should I start an email to a colleague in German?", "conversation", None),
+    ("What time is it in Spanish, how do I say it?", "conversation", None),
+    ("Je suis allé au musée samedi", "conversation", None),
+    ("Could you describe a typical breakfast in Mexico?", "conversation", None),
+    ("I think I made a mistake: 'yo sabo'", "conversation", None),
+    ("Thanks, that was really helpful!", "conversation", None),
+    ("What's the opposite of 'caliente'?", "conversation", None),
+    ("Wie geht es dir heute?", "conversation", None),
+    ("Tell me how people celebrate Christmas in Spain", "conversation", None),
+    ("Can we keep chatting about travel?", "conversation", None),
+    ("Do Italians really eat pasta every day?", "conversation", None),
+    ("Help me write a message to my landlord", "conversation", None),
+    ("I'd like a vocabulary exercise about clothes", "exercise", "vocabulary"),
+    ("Quiz me on body parts", "exercise", "vocabulary"),
+    ("Flashcards for weather words please", "exercise", "vocabulary"),
+    ("Give me an exercise with words for the office", "exercise", "vocabulary"),
+    ("Test me on family member words", "exercise", "vocabulary"),
+    ("An exercise on reflexive verbs please", "exercise", "grammar"),
+    ("Quiz me on the imperfect versus the preterite", "exercise", "grammar"),
+    ("I want a grammar drill on object pronouns", "exercise", "grammar"),
+    ("Exercises on definite articles", "exercise", "grammar"),
+    ("Test me on conjugating 'tener'", "exercise", "grammar"),
+    ("Give me a drill on the conditional tense", "exercise", "grammar"),
+    ("A role-play exercise at the doctor's office", "exercise", "conversation"),
+    ("Practice dialogue for checking into a hostel", "exercise", "conversation"),
+    ("Give me a conversation exercise about making plans with friends", "exercise", "conversation"),
+    ("Let's do a roleplay where I rent a car", "exercise", "conversation"),
+    ("I'd like a short passage about Barcelona with questions", "exercise", "reading_comprehension"),
+    ("Reading practice on a news article please", "exercise", "reading_comprehension"),
+    ("Give me a text to read about healthy eating and quiz me", "exercise", "reading_comprehension"),
+    ("A listening exercise about ordering food", "exercise", "listening_comprehension"),
+    ("I want to practice listening to numbers", "exercise", "listening_comprehension"),
+    ("Audio exercise on directions please", "exercise", "listening_comprehension"),
+    ("What does 'ponerse las pilas' mean?", "idioms", "explain_idiom"),
+    ("Explain 'no tener pelos en la lengua'", "idioms", "explain_idiom"),
+    ("What is the meaning of the idiom 'poner los cuernos'?", "idioms", "explain_idiom"),
+    ("What does the expression 'il pleut des cordes' mean?", "idioms", "explain_idiom"),
+    ("Explain the proverb 'a caballo regalado no se le mira el diente'", "idioms", "explain_idiom"),
+    ("Are there any idioms used in this paragraph?", "idioms", "detect_idioms"),
+    ("Spot the expressions in: me costó un ojo de la cara", "idioms", "detect_idioms"),
+    ("Which idioms are used in this song lyric?", "idioms", "detect_idioms"),
+    ("Find the idioms in this email", "idioms", "detect_idioms"),
+    ("Suggest some expressions about love", "idioms", "suggest_idioms"),
+    ("Give me useful idioms for travelling", "idioms", "suggest_idioms"),
+    ("Teach me some sayings about time", "idioms", "suggest_idioms"),
+    ("List idioms about food in French", "idioms", "suggest_idioms"),
+    ("Some colloquial phrases teenagers use in Madrid?", "idioms", "suggest_idioms"),
+    ("Was she being sarcastic when she said 'qué listo'?", "idioms", "explain_sarcasm"),
+    ("How do Germans express irony?", "idioms", "explain_sarcasm"),
+    ("Is 'muy bonito, eh' ironic here?", "idioms", "explain_sarcasm"),
+    ("Explain the sarcasm in 'claro, como siempre'", "idioms", "explain_sarcasm"),
+    ("How am I doing with verbs?", "feedback", None),
+    ("Show me how much I've progressed", "feedback", None),
+    ("What are my strengths so far?", "feedback", None),
+    ("What should I focus on next week?", "feedback", None),
+    ("Any feedback on my recent answers?", "feedback", None),
+    ("Am I getting better at listening?", "feedback", None),
+    ("Which mistakes do I repeat most?", "feedback", None),
+    ("Can you analyze my progress this month?", "feedback", None),
+    ("Am I ready to move up a level?", "feedback", None),
+    ("Recommend my next steps", "feedback", None),
+]
+
+
+def _features(text: str) -> List[int]:
+    """Hashed character n-grams of the lower-cased, space-padded text."""
+    text = f" {' '.join(text.lower().split())} "
+    return sorted({zlib.crc32(text[i:i + n].encode("utf-8")) % N_FEATURES
+                   for n in NGRAM_SIZES for i in range(len(text) - n + 1)})
+
+
+class CharNgramClassifier:
+    """Multinomial logistic regression over hashed character n-grams."""
+
+    def __init__(self, labels: List[str]):
+        self.labels = labels
+        self.weights = np.zeros((N_FEATURES, len(labels)), dtype=np.float32)
+        self.bias = np.zeros(len(labels), dtype=np.float32)
+
+    def fit(self, texts: List[str], labels: List[str], epochs: int = 300, lr: float = 2.0, l2: float = 1e-4):
+        """Full-batch gradient descent; the training sets here are tiny."""
+        rows = [_features(text) for text in texts]
+        x = np.zeros((len(texts), N_FEATURES), dtype=np.float32)
+        for i, features in enumerate(rows):
+            x[i, features] = 1.0 / np.sqrt(len(features))
+        y = np.zeros((len(texts), len(self.labels)), dtype=np.float32)
+        y[np.arange(len(texts)), [self.labels.index(label) for label in labels]] = 1.0
+
+        # Only features that occur in training can get weight, so train on those columns
+        used = np.flatnonzero(x.any(axis=0))
+        x_used = x[:, used]
+        w = np.zeros((len(used), len(self.labels)), dtype=np.float32)
+        b = np.zeros(len(self.labels), dtype=np.float32)
+        for _ in range(epochs):
+            logits = x_used @ w + b
+            logits -= logits.max(axis=1, keepdims=True)
+            p = np.exp(logits)
+            p /= p.sum(axis=1, keepdims=True)
+            grad = (p - y) / len(texts)
+            w -= lr * (x_used.T @ grad + l2 * w)
+            b -= lr * grad.sum(axis=0)
+        self.weights[used] = w
+        self.bias = b
+        return self
+
+    def predict(self, text: str) -> Tuple[str, float]:
+        """Returns the most likely label and its probability."""
+        features = _features(text)
+        logits = self.weights[features].sum(axis=0) / np.sqrt(max(len(features), 1)) + self.bias
+        logits -= logits.max()
+        p = np.exp(logits)
+        p /= p.sum()
+        best = int(p.argmax())
+        return self.labels[best], float(p[best])
+
+
+class IntentRouter:
+    """Resolves the agent (and exercise / idiom request type) locally when it is confident."""
+
+    def __init__(self, min_confidence: float = MIN_CONFIDENCE):
+        self.min_confidence = min_confidence
+        self.rules = [(re.compile(pattern, re.IGNORECASE), agent, sub_type)
+                      for pattern, agent, sub_type in KEYWORD_RULES]
+        self.sub_type_rules = {agent: [(re.compile(pattern, re.IGNORECASE), sub_type) for pattern, sub_type in rules]
+                               for agent, rules in SUB_TYPE_RULES.items()}
+        self.agent_model = CharNgramClassifier(AGENTS).fit(
+            [text for text, _, _ in TRAINING_EXAMPLES], [agent for _, agent, _ in TRAINING_EXAMPLES])
+        self.sub_type_models = {}
+        for agent, labels in (("exercise", EXERCISE_TYPES), ("idioms", IDIOM_REQUEST_TYPES)):
+            examples = [(text, sub_type) for text, example_agent, sub_type in TRAINING_EXAMPLES
+                        if example_agent == agent]
+            self.sub_type_models[agent] = CharNgramClassifier(labels).fit(
+                [text for text, _ in examples], [sub_type for _, sub_type in examples])
+        self.stats = {"local": 0, "fallback": 0, "too_short": 0}
+
+    def _sub_type(self, agent: str, text: str) -> Tuple[Optional[str], float]:
+        if agent not in self.sub_type_models:
+            return None, 1.0
+        for pattern, sub_type in self.sub_type_rules[agent]:
+            if pattern.search(text):
+                return sub_type, 1.0
+        return self.sub_type_models[agent].predict(text)
+
+    def route(self, text: str) -> Optional[Dict]:
+        """
+        Returns {"agent", "sub_type", "confidence", "source"}, or None when the
+        caller should ask the LLM router instead. Input shorter than
+        MIN_INPUT_CHARS is never routed locally.
+        """
+        if len(text.strip()) < MIN_INPUT_CHARS:
+            self.stats["too_short"] += 1
+            return None
+        matched = {agent for pattern, agent, _ in self.rules if pattern.search(text)}
+        if len(matched) == 1:
+            agent, confidence, source = matched.pop(), 1.0, "rules"
+        else:
+            agent, confidence = self.agent_model.predict(text)
+            source = "model"
+
+        sub_type, sub_confidence = self._sub_type(agent, text)
+        confidence = min(confidence, sub_confidence)
+        if confidence < self.min_confidence:
+            self.stats["fallback"] += 1
+            return None
+        self.stats["local"] += 1
+        return {"agent": agent, "sub_type": sub_type, "confidence": round(confidence, 3), "source": source}
+
+
+def evaluate(router: IntentRouter = None, eval_set=EVAL_SET) -> Dict:
+    """Accuracy, local coverage and latency of the router on the labeled eval set."""
+    router = router or IntentRouter()
+    # Scoring on training phrasings would only measure memorisation
+    training = {text for text, _, _ in TRAINING_EXAMPLES}
+    eval_set = [example for example in eval_set if example[0] not in training]
+    latencies = []
+    resolved = correct_agent = correct_both = 0
+    for text, agent, sub_type in eval_set:
+        started = time.perf_counter()
+        decision = router.route(text)
+        latencies.append((time.perf_counter() - started) * 1e6)
+        if decision is None:
+            continue
+        resolved += 1
+        correct_agent += decision["agent"] == agent
+        correct_both += decision["agent"] == agent and decision["sub_type"] == sub_type
+
+    latencies.sort()
+    return {
+        "examples": len(eval_set),
+        "resolved_locally": resolved,
+        "agent_accuracy": round(correct_agent / resolved, 3) if resolved else None,
+        "agent_and_sub_type_accuracy": round(correct_both / resolved, 3) if resolved else None,
+        "latency_us_p50": round(latencies[len(latencies) // 2], 1),
+        "latency_us_p95": round(latencies[int(0.95 * (len(latencies) - 1))], 1),
+    }
+
+
+if __name__ == "__main__":
+    print(evaluate())
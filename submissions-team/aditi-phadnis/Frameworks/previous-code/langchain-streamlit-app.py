@@ -14,22 +14,12 @@ from pydantic import BaseModel
 from langchain_community.llms import OpenAI
 from langchain.prompts import MessagesPlaceholder
 from langchain.schema import SystemMessage
-from langchain.callbacks.base import BaseCallbackHandler
+from stream_handler import StreamHandler
 
 # Load environment variables
 load_dotenv()
 OPENAI_API_KEY = os.environ["OPENAI_API_KEY"]
 
-# Custom Callback Handler for Streaming
-class StreamHandler(BaseCallbackHandler):
-    def __init__(self, container, initial_text=""):
-        self.container = container
-        self.text = initial_text
-
-    def on_llm_new_token(self, token: str, **kwargs):
-        self.text += token
-        self.container.markdown(self.text)
-
 # Initialize LLM (OpenAI)
 llm = ChatOpenAI(temperature=0, model_name="gpt-4-turbo", streaming=True)
 
@@ -190,6 +180,9 @@ if st.button("Process"):
 
             st.write("## Output")
             st.write(result['output'])
+            stats = stream_handler.stats()
+            st.caption(f"Streamed {stats['tokens']} tokens in {stats['flushes']} redraws "
+                       f"({stats['flushes_per_second']}/s)")
         except Exception as e:
             st.error(f"An error occurred: {e}")
         finally:
@@ -1,14 +1,20 @@
+import json
 import os
+import sys
 import streamlit as st
 import speech_recognition as sr
 from pydub import AudioSegment
 from pydub.playback import play
 import tempfile
+import threading
+import time
 import uuid
-from typing import Dict, Any, List, Optional, Tuple
+from collections import Counter, deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Any, List, Literal, Optional, Tuple
 from langchain.memory.chat_memory import BaseChatMemory
 
-from pydantic import BaseModel, Field
+from pydantic import BaseModel, ConfigDict, Field
 from langchain.agents import AgentType, AgentExecutor, create_openai_functions_agent
 from langchain.memory import ConversationBufferMemory
 from langchain.memory.chat_memory import BaseChatMemory
@@ -21,6 +27,11 @@ from langchain.chains import LLMChain
 from langchain_openai import ChatOpenAI
 from langchain_core.tools import tool
 from dotenv import load_dotenv
+from intent_router import IntentRouter, EXERCISE_TYPES, IDIOM_REQUEST_TYPES
+from turn_graph import TurnGraph, CheckpointStore, START, END
+from tracing import TRACER, TRACE_CALLBACK, propagate
+from resilience import CircuitBreaker, BreakerCallback, ResponseCache, DegradationLog
+from history_log import HistoryLog, ConversationTurn, ExerciseRecord, FeedbackRecord, HISTORY_FIELDS
 
 # Load environment variables
 load_dotenv()
@@ -29,11 +40,41 @@ OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
 # Constants
 DEFAULT_LANGUAGE = "Spanish"
 DIFFICULTY_LEVELS = ["Beginner", "Intermediate", "Advanced"]
+# Background threads analysing conversation turns off the chat path
+FEEDBACK_WORKERS = 2
+# Start the conversation reply while the LLM router is still deciding
+SPECULATIVE_CONVERSATION = False
+# Skip speculation when a draft's estimated prompt is larger than this
+SPECULATION_MAX_TOKENS = 3000
+# Finished nodes of each turn, so a crashed turn resumes without repeating LLM calls
+TURN_CHECKPOINT_PATH = "turn_checkpoints.db"
+# Interrupted turns older than this are dropped instead of resumed
+TURN_CHECKPOINT_RETENTION_SECONDS = 24 * 3600
+ROUTE_TIMEOUT_SECONDS = 20
+NODE_TIMEOUT_SECONDS = 120
+# Latency budgets for idiom and exercise requests; past them cached/banked content is served
+IDIOMS_BUDGET_SECONDS = 20
+EXERCISE_BUDGET_SECONDS = 30
+# LLM circuit breaker: opens after this many consecutive failed or slow calls, retries after the reset delay
+BREAKER_FAILURE_THRESHOLD = 3
+BREAKER_RESET_SECONDS = 30
+BREAKER_SLOW_CALL_SECONDS = 20
+RESPONSE_CACHE_SIZE = 1000
+# Agent nodes run for each route; several nodes run in parallel
+TURN_ROUTES = {
+    "conversation": ["conversation"],
+    "exercise": ["exercise"],
+    "idioms": ["idioms"],
+    "feedback": ["progress", "recommendations"],
+}
+
+LLM_BREAKER = CircuitBreaker(BREAKER_FAILURE_THRESHOLD, BREAKER_RESET_SECONDS, BREAKER_SLOW_CALL_SECONDS)
 
 # Initialize OpenAI Model
 llm = ChatOpenAI(temperature=0.2, 
                  model="gpt-4-turbo", 
-                 streaming=True)
+                 streaming=True,
+                 callbacks=[TRACE_CALLBACK, BreakerCallback(LLM_BREAKER)])
 
 # Data Models
 class UserProfile(BaseModel):
@@ -43,9 +84,18 @@ class UserProfile(BaseModel):
     learning_focus: List[str] = ["Conversation", "Grammar", "Vocabulary"]
     strengths: List[str] = []
     weaknesses: List[str] = []
-    conversation_history: List[Dict] = []
-    exercise_history: List[Dict] = []
-    feedback_history: List[Dict] = []
+    conversation_history: HistoryLog = Field(default_factory=HistoryLog)
+    exercise_history: HistoryLog = Field(default_factory=HistoryLog)
+    feedback_history: HistoryLog = Field(default_factory=HistoryLog)
+
+    model_config = ConfigDict(arbitrary_types_allowed=True)
+
+    def summary(self) -> Dict:
+        """Profile fields plus history sizes, without touching the history records."""
+        summary = self.model_dump(exclude=set(HISTORY_FIELDS))
+        for field in HISTORY_FIELDS:
+            summary[f"{field}_size"] = len(getattr(self, field))
+        return summary
 
 
 class MultiInputMemory(BaseChatMemory):
@@ -105,6 +155,7 @@ class ConversationAgent:
     def __init__(self, llm):
         include_keys = ["target_language", "difficulty_level"]
         self.llm = llm
+        self.translations = ResponseCache(RESPONSE_CACHE_SIZE)
         self.memory = MultiInputMemory(memory_key="chat_history",     
                                         primary_input_key="input",
                                         include_keys= include_keys,  # Optional
@@ -136,13 +187,17 @@ class ConversationAgent:
         ]
         
         # Define prompt template
+        # Shared instructions first and per-user values after them, so every
+        # request starts with the same cacheable prefix
         self.prompt = ChatPromptTemplate.from_messages([
-            ("system", """You are a friendly and patient language tutor specialized in teaching {target_language}. 
-            Adjust your responses to the user's {difficulty_level} level.
+            ("system", """You are a friendly and patient language tutor.
+            Adjust your responses to the user's level.
             Engage the user in natural conversation, gently correct errors, and provide explanations when needed.
-            If the user speaks in English, respond with both {target_language} and English.
-            If the user speaks in {target_language}, respond in {target_language} with English translations.
-            Focus on their learning goals: {learning_focus}."""),
+            If the user speaks in English, respond with both the target language and English.
+            If the user speaks in the target language, respond in it with English translations."""),
+            ("system", """Target language: {target_language}
+            Level: {difficulty_level}
+            Learning goals: {learning_focus}"""),
             MessagesPlaceholder(variable_name="chat_history"),
             ("user", "{input}"),
             ("assistant", "{agent_scratchpad}")
@@ -150,21 +205,34 @@ class ConversationAgent:
         
         # Create agent
         self.agent = create_openai_functions_agent(llm, self.tools, self.prompt)
+        # Memory is saved in commit(), so a speculative draft can be discarded
+        # without leaving a turn in it
         self.agent_executor = AgentExecutor(
             agent=self.agent, 
             tools=self.tools, 
-            memory=self.memory,
             verbose=True
         )
     
     def translate_text(self, text: str, source_lang: str, target_lang: str) -> str:
-        """Translates text between languages"""
-        prompt = PromptTemplate.from_template(
-            "Translate the following {source_lang} text to {target_lang}: {text}\n\nTranslation:"
-        )
-        chain = prompt | self.llm
-        result = chain.invoke({"source_lang": source_lang, "target_lang": target_lang, "text": text})
-        return result.content if hasattr(result, "content") else str(result)
+        """
+        Translates text between languages. Repeats are served from the translation
+        cache; while the LLM breaker is open, uncached text is refused without a call.
+        """
+        key = ResponseCache.key(text, source_lang, target_lang)
+        cached = self.translations.get(key)
+        if cached is not None:
+            return cached
+        with LLM_BREAKER.attempt() as allowed:
+            if not allowed:
+                return "Translation is unavailable right now; please try again in a moment."
+            prompt = PromptTemplate.from_template(
+                "Translate the following {source_lang} text to {target_lang}: {text}\n\nTranslation:"
+            )
+            chain = prompt | self.llm
+            result = chain.invoke({"source_lang": source_lang, "target_lang": target_lang, "text": text})
+        translation = result.content if hasattr(result, "content") else str(result)
+        self.translations.put(key, translation)
+        return translation
     
     def detect_language(self, text: str) -> str:
         """Detects the language of given text"""
@@ -209,28 +277,41 @@ class ConversationAgent:
             except:
                 return "Sorry, I couldn't understand the audio."
     
-    def respond(self, user_input: str, user_profile: UserProfile) -> str:
-        """Generate a response to user input"""
-
+    def build_inputs(self, user_input: str, user_profile: UserProfile) -> Dict[str, Any]:
+        """Agent inputs for one turn, without the chat history"""
         # Create a combined input for memory purposes
         combined_input = f"User input: {user_input} (Target language: {user_profile.target_language}, " \
                          f"Difficulty: {user_profile.difficulty_level}, " \
                          f"Focus: {', '.join(user_profile.learning_focus)})"
-
-        response = self.agent_executor.invoke({
+        return {
             "input": combined_input,
             "target_language": user_profile.target_language,
             "difficulty_level": user_profile.difficulty_level,
             "learning_focus": ", ".join(user_profile.learning_focus)
-        })
-        
-        # Add to conversation history
-        user_profile.conversation_history.append({
-            "user": user_input,
-            "agent": response["output"]
-        })
-        
-        return response["output"]
+        }
+    
+    def estimate_prompt_tokens(self, user_input: str, user_profile: UserProfile) -> int:
+        """Rough size of the next prompt (about 4 characters per token)"""
+        history_chars = sum(len(str(message.content)) for message in self.memory.chat_memory.messages)
+        return (len(self.prompt.messages[0].prompt.template) + history_chars + len(user_input)) // 4
+    
+    def draft(self, user_input: str, user_profile: UserProfile) -> str:
+        """Generates a reply without recording it in memory or history"""
+        inputs = self.build_inputs(user_input, user_profile)
+        inputs.update(self.memory.load_memory_variables(inputs))
+        return self.agent_executor.invoke(inputs, config={"callbacks": [TRACE_CALLBACK]})["output"]
+    
+    def commit(self, user_input: str, user_profile: UserProfile, output: str) -> str:
+        """Records a reply in the agent memory and the user's conversation history"""
+        self.memory.save_context(self.build_inputs(user_input, user_profile), {"output": output})
+        user_profile.conversation_history.append(
+            ConversationTurn(user_input, output, user_profile.target_language)
+        )
+        return output
+    
+    def respond(self, user_input: str, user_profile: UserProfile) -> str:
+        """Generate a response to user input"""
+        return self.commit(user_input, user_profile, self.draft(user_input, user_profile))
 
 # Exercise Generator Agent
 class ExerciseGeneratorAgent:
@@ -263,12 +344,16 @@ class ExerciseGeneratorAgent:
         
         # Define prompt
         self.prompt = ChatPromptTemplate.from_messages([
-            ("system", """You are an expert language exercise creator specialized in {target_language}.
-            Create engaging, relevant exercises at {difficulty_level} level.
-            Focus on the user's learning needs: {learning_focus}.
-            Address their specific weaknesses: {weaknesses}.
-            Build on their established strengths: {strengths}.
+            ("system", """You are an expert language exercise creator.
+            Create engaging, relevant exercises at the learner's level.
+            Focus on the user's learning needs, address their specific weaknesses
+            and build on their established strengths.
             Reference recent conversation topics when relevant."""),
+            ("system", """Target language: {target_language}
+            Level: {difficulty_level}
+            Learning needs: {learning_focus}
+            Weaknesses: {weaknesses}
+            Strengths: {strengths}"""),
             ("user", "{input}"),
             ("assistant", "{agent_scratchpad}")
         ])
@@ -392,11 +477,13 @@ class ExerciseGeneratorAgent:
         if context:
             input_data["input"] += f" based on their recent conversation about {context.get('topic', 'general topics')}"
         
-        response = self.agent_executor.invoke(input_data)
+        response = self.agent_executor.invoke(input_data, config={"callbacks": [TRACE_CALLBACK]})
         
         # Add to exercise history
         exercise = response["output"]
-        user_profile.exercise_history.append(exercise)
+        user_profile.exercise_history.append(
+            ExerciseRecord(exercise_type, exercise, user_profile.target_language, user_profile.difficulty_level)
+        )
         
         return exercise
 
@@ -405,12 +492,29 @@ class FeedbackContextAgent:
     def __init__(self, llm):
         self.llm = llm
         
-        # Define tools
-        self.tools = [
+        # Define prompt
+        self.prompt = ChatPromptTemplate.from_messages([
+            ("system", """You are a thoughtful learning analytics system specialized in language learning.
+            Analyze user interactions, provide constructive feedback, and maintain learning context.
+            Identify patterns in the user's learning journey, track progress at their level
+            and focus on their stated learning goals."""),
+            ("system", """Target language: {target_language}
+            Level: {difficulty_level}
+            Learning goals: {learning_focus}"""),
+            ("user", "{input}"),
+            ("assistant", "{agent_scratchpad}")
+        ])
+        
+    def build_executor(self, user_profile: UserProfile, observations: Dict) -> AgentExecutor:
+        """
+        Agent whose profile tools are bound to this learner; the LLM only supplies
+        text arguments. Profile updates are collected into `observations`, not applied.
+        """
+        tools = [
             Tool(
                 name="AnalyzeProgress",
-                func=self.analyze_user_progress,
-                description="Analyzes user progress and patterns based on history"
+                func=lambda _query="": self.analyze_user_progress(user_profile)["content"],
+                description="Analyzes the current user's progress and patterns based on history"
             ),
             Tool(
                 name="GenerateFeedback",
@@ -419,68 +523,43 @@ class FeedbackContextAgent:
             ),
             Tool(
                 name="UpdateUserProfile",
-                func=self.update_user_profile,
-                description="Updates user profile based on observed patterns"
+                func=lambda update: self.record_observations(update, observations),
+                description="Updates user profile based on observed patterns. Input: JSON with optional "
+                            "'strengths' and 'weaknesses' lists and a 'difficulty_adjustment' level"
             ),
             Tool(
                 name="RecommendNextSteps",
-                func=self.recommend_next_steps,
-                description="Recommends next learning steps or focus areas"
+                func=lambda _query="": self.recommend_next_steps(user_profile)["content"],
+                description="Recommends next learning steps or focus areas for the current user"
             )
         ]
-        
-        # Define prompt
-        self.prompt = ChatPromptTemplate.from_messages([
-            ("system", """You are a thoughtful learning analytics system specialized in language learning.
-            Analyze user interactions, provide constructive feedback, and maintain learning context.
-            Identify patterns in the user's {target_language} learning journey.
-            Track progress at their {difficulty_level} level.
-            Focus on their stated learning goals: {learning_focus}."""),
-            ("user", "{input}"),
-            ("assistant", "{agent_scratchpad}")
-        ])
-        
-        # Create agent
-        self.agent = create_openai_functions_agent(llm, self.tools, self.prompt)
-        self.agent_executor = AgentExecutor(
-            agent=self.agent,
-            tools=self.tools,
-            verbose=True
-        )
+        agent = create_openai_functions_agent(self.llm, tools, self.prompt)
+        return AgentExecutor(agent=agent, tools=tools, verbose=True)
     
-    def analyze_user_progress(self, user_profile: Dict) -> Dict:
-        """Analyzes user progress patterns based on history"""
-        # Convert the user profile to a string representation for the LLM
-        profile_str = f"""
-        Target Language: {user_profile.get('target_language')}
-        Difficulty Level: {user_profile.get('difficulty_level')}
-        Learning Focus: {', '.join(user_profile.get('learning_focus', []))}
-        Strengths: {', '.join(user_profile.get('strengths', []))}
-        Weaknesses: {', '.join(user_profile.get('weaknesses', []))}
-        Conversation History Size: {len(user_profile.get('conversation_history', []))} entries
-        Exercise History Size: {len(user_profile.get('exercise_history', []))} exercises
-        """
-        
-        prompt = PromptTemplate.from_template(
-            """Analyze the following user language learning profile and identify progress patterns:
-            
-            {profile}
-            
-            Provide insights on:
-            1. Learning patterns and trends
-            2. Areas of improvement
-            3. Areas that need more focus
-            4. Overall progress assessment
-            
-            Format your analysis as a structured report:"""
-        )
-        chain = prompt | self.llm
-        result = chain.invoke({"profile": profile_str})
-        
-        content = result.content if hasattr(result, "content") else str(result)
+    def analyze_user_progress(self, user_profile: UserProfile) -> Dict:
+        """Summarises progress from counts kept on the profile, without an LLM call"""
+        stats = user_profile.summary()
+        exercise_counts = Counter(record.exercise_type for record in user_profile.exercise_history)
+        stats["exercises_by_type"] = dict(exercise_counts)
+
+        lines = [
+            f"**Level:** {user_profile.difficulty_level} {user_profile.target_language}",
+            f"**Conversation turns:** {stats['conversation_history_size']}",
+            f"**Exercises:** {stats['exercise_history_size']}"
+            + (" (" + ", ".join(f"{count} {kind}" for kind, count in exercise_counts.most_common()) + ")"
+               if exercise_counts else ""),
+            f"**Interactions reviewed:** {stats['feedback_history_size']}",
+            f"**Strengths:** {', '.join(user_profile.strengths) or 'none recorded yet'}",
+            f"**Needs work:** {', '.join(user_profile.weaknesses) or 'none recorded yet'}",
+        ]
+        focus_gaps = [focus for focus in user_profile.learning_focus
+                      if not any(focus.lower() in kind.lower() for kind in exercise_counts)]
+        if focus_gaps:
+            lines.append(f"**Not practised yet:** {', '.join(focus_gaps)}")
         return {
             "type": "progress_analysis",
-            "content": content
+            "stats": stats,
+            "content": "\n\n".join(lines)
         }
     
     def generate_feedback(self, user_input: str, agent_response: str, language: str) -> Dict:
@@ -513,11 +592,23 @@ class FeedbackContextAgent:
             "content": content
         }
     
+    def record_observations(self, update: str, observations: Dict) -> str:
+        """Merges the agent's JSON profile update into `observations` for the UI thread to apply"""
+        try:
+            parsed = json.loads(update)
+        except (TypeError, ValueError):
+            return "Profile update ignored: expected a JSON object"
+        if not isinstance(parsed, dict):
+            return "Profile update ignored: expected a JSON object"
+        for key in ("strengths", "weaknesses"):
+            if isinstance(parsed.get(key), list):
+                observations.setdefault(key, []).extend(str(item) for item in parsed[key])
+        if parsed.get("difficulty_adjustment") in DIFFICULTY_LEVELS:
+            observations["difficulty_adjustment"] = parsed["difficulty_adjustment"]
+        return "Profile update recorded"
+    
     def update_user_profile(self, user_profile: UserProfile, new_observations: Dict) -> Dict:
-        """Updates user profile based on new observations"""
-        # This function would actually modify the user profile object
-        # Here we'll simulate the process
-        
+        """Applies observations to the profile; call from the thread that owns the profile"""
         if "strengths" in new_observations and new_observations["strengths"]:
             for strength in new_observations["strengths"]:
                 if strength not in user_profile.strengths:
@@ -534,7 +625,7 @@ class FeedbackContextAgent:
         
         return {
             "type": "profile_update",
-            "updated_profile": user_profile.dict()
+            "updated_profile": user_profile.summary()
         }
     
     def recommend_next_steps(self, user_profile: UserProfile) -> Dict:
@@ -571,28 +662,35 @@ class FeedbackContextAgent:
         }
     
     def process_interaction(self, user_input: str, agent_response: str, user_profile: UserProfile) -> Dict:
-        """Process an interaction and provide feedback/updates"""
-        response = self.agent_executor.invoke({
+        """
+        Analyzes an interaction without modifying the profile. Returns the feedback
+        and the profile observations; apply them with apply_interaction.
+        """
+        observations = {}
+        response = self.build_executor(user_profile, observations).invoke({
             "input": f"Analyze this interaction: User: '{user_input}' Agent: '{agent_response}'",
             "target_language": user_profile.target_language,
             "difficulty_level": user_profile.difficulty_level,
             "learning_focus": ", ".join(user_profile.learning_focus)
-        })
+        }, config={"callbacks": [TRACE_CALLBACK]})
         
-        # Add to feedback history
-        feedback = response["output"]
-        user_profile.feedback_history.append({
-            "user_input": user_input,
-            "agent_response": agent_response,
-            "feedback": feedback
-        })
-        
-        return feedback
+        return {"feedback": response["output"], "observations": observations}
+    
+    def apply_interaction(self, user_input: str, agent_response: str, result: Dict,
+                          user_profile: UserProfile) -> None:
+        """Writes a process_interaction result into the profile"""
+        user_profile.feedback_history.append(
+            FeedbackRecord(user_input, agent_response, result["feedback"], user_profile.target_language)
+        )
+        if result["observations"]:
+            self.update_user_profile(user_profile, result["observations"])
 
 # Idioms Agent
 class IdiomsAgent:
     def __init__(self, llm):
         self.llm = llm
+        # Past answers, served when the LLM is slow or the breaker is open
+        self.cache = ResponseCache(RESPONSE_CACHE_SIZE)
         
         # Define tools
         self.tools = [
@@ -620,10 +718,12 @@ class IdiomsAgent:
         
         # Define prompt
         self.prompt = ChatPromptTemplate.from_messages([
-            ("system", """You are an expert in {target_language} idioms, expressions, and cultural nuances.
-            Help users understand and use idioms, colloquialisms, and sarcasm appropriate to their {difficulty_level} level.
+            ("system", """You are an expert in idioms, expressions, and cultural nuances of the target language.
+            Help users understand and use idioms, colloquialisms, and sarcasm appropriate to their level.
             Explain cultural context and usage when introducing new expressions.
             Provide examples that illustrate when and how to use each expression."""),
+            ("system", """Target language: {target_language}
+            Level: {difficulty_level}"""),
             ("user", "{input}"),
             ("assistant", "{agent_scratchpad}")
         ])
@@ -755,13 +855,139 @@ class IdiomsAgent:
             "input": input_text,
             "target_language": user_profile.target_language,
             "difficulty_level": user_profile.difficulty_level
-        })
+        }, config={"callbacks": [TRACE_CALLBACK]})
         
+        self.cache.put(ResponseCache.key(request_type, content, user_profile.target_language), response["output"])
         return response["output"]
+    
+    def cached_response(self, request_type: str, content: str, user_profile: UserProfile):
+        """A previous answer to the same request, or None"""
+        return self.cache.get(ResponseCache.key(request_type, content, user_profile.target_language))
+
+class RoutingDecision(BaseModel):
+    """Structured output of the LLM router: the agent plus its sub-task, from a single call"""
+    agent: Literal["conversation", "exercise", "idioms", "feedback"] = Field(
+        description="The agent that should handle the request")
+    exercise_type: Optional[Literal[tuple(EXERCISE_TYPES)]] = Field(
+        default=None, description="Type of exercise, when agent is 'exercise'")
+    idiom_request_type: Optional[Literal[tuple(IDIOM_REQUEST_TYPES)]] = Field(
+        default=None, description="Kind of idiom help, when agent is 'idioms'")
+    extracted_args: Dict[str, str] = Field(
+        default_factory=dict, description="Arguments taken from the request, e.g. topic, idiom or text")
+
+class FeedbackWorker:
+    """
+    Runs FeedbackContextAgent.process_interaction on a background thread pool so a
+    conversation reply is returned as soon as it is generated. Workers only read a
+    snapshot of the profile; finished results are queued until the UI thread
+    collects them and applies them to the live profile.
+    """
+
+    def __init__(self, feedback_agent: FeedbackContextAgent, max_workers: int = FEEDBACK_WORKERS):
+        self.feedback_agent = feedback_agent
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="feedback")
+        self.lock = threading.Lock()
+        self.ready = deque()
+        self.pending = 0
+        self.completed = 0
+        self.failed = 0
+        # Seconds from a turn being queued to its feedback being written
+        self.lag_seconds = deque(maxlen=1000)
+
+    def submit(self, user_input: str, agent_response: str, user_profile: UserProfile) -> None:
+        """Queues analysis of one conversation turn"""
+        with self.lock:
+            self.pending += 1
+        # The UI thread keeps changing the live profile's lists while the analysis runs
+        snapshot = user_profile.model_copy(update={field: list(getattr(user_profile, field))
+                                                   for field in ("learning_focus", "strengths", "weaknesses")})
+        self.executor.submit(propagate(self._run), user_input, agent_response, snapshot, time.perf_counter())
+
+    def _run(self, user_input: str, agent_response: str, user_profile: UserProfile, queued_at: float) -> None:
+        try:
+            with TRACER.span("agent.feedback.process_interaction",
+                             queued_ms=round((time.perf_counter() - queued_at) * 1000, 1)):
+                result = self.feedback_agent.process_interaction(user_input, agent_response, user_profile)
+        except Exception as e:
+            print(f"Interaction analysis failed: {e}")
+            with self.lock:
+                self.pending -= 1
+                self.failed += 1
+            return
+        
+        with self.lock:
+            self.pending -= 1
+            self.completed += 1
+            self.lag_seconds.append(time.perf_counter() - queued_at)
+            self.ready.append({"user_input": user_input, "agent_response": agent_response, "result": result})
+
+    def collect(self, user_profile: UserProfile) -> List[Dict]:
+        """
+        Applies the feedback finished since the last call to `user_profile` and
+        returns it as {"user_input", "feedback"}. Call from the UI thread.
+        """
+        with self.lock:
+            ready = list(self.ready)
+            self.ready.clear()
+        for entry in ready:
+            self.feedback_agent.apply_interaction(entry["user_input"], entry["agent_response"], entry["result"],
+                                                  user_profile)
+        return [{"user_input": entry["user_input"], "feedback": entry["result"]["feedback"]} for entry in ready]
+
+    def metrics(self) -> Dict:
+        """Queue depth and queue-to-result lag"""
+        with self.lock:
+            lag_ms = sorted(seconds * 1000 for seconds in self.lag_seconds)
+            return {
+                "queue_depth": self.pending,
+                "completed": self.completed,
+                "failed": self.failed,
+                "lag_ms_avg": round(sum(lag_ms) / len(lag_ms), 1) if lag_ms else None,
+                "lag_ms_p95": round(lag_ms[int(0.95 * (len(lag_ms) - 1))], 1) if lag_ms else None,
+                "lag_ms_max": round(lag_ms[-1], 1) if lag_ms else None,
+            }
+
+    def shutdown(self, wait: bool = True) -> None:
+        self.executor.shutdown(wait=wait)
+
+class SpeculationStats:
+    """Outcome of speculative conversation drafts: latency saved on hits, tokens wasted on misses"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.attempts = 0
+        self.hits = 0
+        self.misses = 0
+        self.skipped = 0
+        self.failed = 0
+        self.saved_seconds = 0.0
+        # Estimated prompt + reply tokens of drafts that were thrown away
+        self.wasted_tokens = 0
+
+    def record(self, **counts) -> None:
+        with self.lock:
+            for name, value in counts.items():
+                setattr(self, name, getattr(self, name) + value)
+
+    def report(self) -> Dict:
+        with self.lock:
+            decided = self.hits + self.misses
+            return {
+                "attempts": self.attempts,
+                "hits": self.hits,
+                "misses": self.misses,
+                "skipped_over_ceiling": self.skipped,
+                "failed": self.failed,
+                "hit_rate": round(self.hits / decided, 3) if decided else None,
+                "latency_saved_ms": round(self.saved_seconds * 1000),
+                "latency_saved_ms_per_hit": round(self.saved_seconds * 1000 / self.hits) if self.hits else None,
+                "tokens_wasted": self.wasted_tokens,
+            }
 
 # Orchestrator
 class Orchestrator:
-    def __init__(self, llm):
+    def __init__(self, llm, speculative: bool = SPECULATIVE_CONVERSATION,
+                 speculation_max_tokens: int = SPECULATION_MAX_TOKENS):
         self.llm = llm
         
         # Initialize agents
@@ -770,147 +996,299 @@ class Orchestrator:
         self.feedback_agent = FeedbackContextAgent(llm)
         self.idioms_agent = IdiomsAgent(llm)
         
-        # Create a router chain to determine which agent should handle the request
+        # Interaction analysis runs in the background, not before the reply is returned
+        self.feedback_worker = FeedbackWorker(self.feedback_agent)
+        
+        # Local keyword/n-gram router; the LLM router chain only handles what it isn't sure about
+        self.intent_router = IntentRouter()
         self.router_chain = self.create_router_chain()
+        
+        # Speculative conversation drafts, run while the LLM router decides
+        self.speculative = speculative
+        self.speculation_max_tokens = speculation_max_tokens
+        self.speculation_executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix="speculation")
+        self.speculation_stats = SpeculationStats()
+        
+        # Responses served from caches/banked content instead of the LLM, by operation and reason
+        self.degradation = DegradationLog(LLM_BREAKER)
+        
+        # The turn pipeline as a graph, checkpointed to SQLite so a crashed turn can be resumed
+        self.turn_graph = self.build_turn_graph()
     
     def create_router_chain(self):
-        """Creates a chain to route requests to the appropriate agent"""
+        """Creates a chain that picks the agent and its sub-task in one function-calling request"""
         router_prompt = PromptTemplate.from_template(
-            """Determine which agent should handle this user input:
+            """Determine which agent should handle this user input, and what it should do:
             
             User Input: {input}
             User Context: {context}
             
-            Choose one of the following agents:
+            Agents:
             1. conversation - for general conversation, questions, and practice
-            2. exercise - for requests related to exercises, quizzes, or drills
-            3. idioms - for questions about idioms, expressions, or cultural language
+            2. exercise - for requests related to exercises, quizzes, or drills; also set exercise_type
+            3. idioms - for questions about idioms, expressions, or cultural language; also set idiom_request_type
             4. feedback - for requests about progress, feedback, or learning analytics
             
-            Return ONLY the name of the agent that should handle this (conversation, exercise, idioms, or feedback):"""
+            Put useful arguments from the request (e.g. topic, idiom, text) in extracted_args."""
         )
         
-        return router_prompt | self.llm
+        return router_prompt | self.llm.with_structured_output(RoutingDecision)
     
-    def extract_agent_name(self, response):
-        """Extract the agent name from the router response"""
-        if hasattr(response, "content"):
-            content = response.content.lower().strip()
-        else:
-            content = str(response).lower().strip()
+    def route_with_llm(self, user_input: str, context: Dict) -> Dict:
+        """Asks the LLM router; returns a route shaped like IntentRouter.route()"""
+        try:
+            decision = self.router_chain.invoke({
+                "input": user_input,
+                "context": str(context)
+            })
+        except Exception as e:
+            print(f"Router call failed, defaulting to conversation: {e}")
+            return {"agent": "conversation", "sub_type": None, "args": {}, "source": "default"}
         
-        # Handle variations in the response
-        if "conversation" in content:
-            return "conversation"
-        elif "exercise" in content:
-            return "exercise"
-        elif "idiom" in content:
-            return "idioms"
-        elif "feedback" in content:
-            return "feedback"
+        if decision.agent == "exercise":
+            sub_type = decision.exercise_type or "vocabulary"
+        elif decision.agent == "idioms":
+            sub_type = decision.idiom_request_type or "explain_idiom"
         else:
-            # Default to conversation agent
-            return "conversation"
+            sub_type = None
+        return {"agent": decision.agent, "sub_type": sub_type, "args": decision.extracted_args or {}, "source": "llm"}
     
-    def process_input(self, user_input: str, user_profile: UserProfile, is_voice: bool = False, audio_file=None):
-        """Process user input and route to appropriate agent"""
-        # Handle voice input if provided
-        if is_voice and audio_file:
-            user_input = self.conversation_agent.process_voice_input(audio_file)
+    def start_speculation(self, user_input: str, user_profile: UserProfile) -> Optional[Dict]:
+        """Starts a conversation draft in the background, unless its prompt is over the cost ceiling"""
+        prompt_tokens = self.conversation_agent.estimate_prompt_tokens(user_input, user_profile)
+        if prompt_tokens > self.speculation_max_tokens:
+            self.speculation_stats.record(skipped=1)
+            return None
         
-        # Create context for routing
-        context = {
-            "target_language": user_profile.target_language,
-            "difficulty_level": user_profile.difficulty_level,
-            "learning_focus": user_profile.learning_focus,
-            "recent_topics": [entry["user"] for entry in user_profile.conversation_history[-3:]] if user_profile.conversation_history else []
-        }
+        def run():
+            started = time.perf_counter()
+            with TRACER.span("agent.conversation.speculative_draft"):
+                output = self.conversation_agent.draft(user_input, user_profile)
+            return output, time.perf_counter() - started
         
-        # Determine which agent should handle the request
-        router_response = self.router_chain.invoke({
-            "input": user_input,
-            "context": str(context)
-        })
+        self.speculation_stats.record(attempts=1)
+        return {"future": self.speculation_executor.submit(propagate(run)), "prompt_tokens": prompt_tokens}
+    
+    def finish_speculation(self, speculation: Dict, user_input: str, user_profile: UserProfile,
+                           route_seconds: float) -> str:
+        """Uses the draft as the reply; falls back to a normal response if it failed"""
+        try:
+            output, draft_seconds = speculation["future"].result()
+        except Exception as e:
+            print(f"Speculative draft failed, responding normally: {e}")
+            self.speculation_stats.record(failed=1)
+            return self.conversation_agent.respond(user_input, user_profile)
         
-        agent_name = self.extract_agent_name(router_response)
+        # Run one after the other, routing and drafting would have taken route + draft
+        self.speculation_stats.record(hits=1, saved_seconds=min(route_seconds, draft_seconds))
+        return self.conversation_agent.commit(user_input, user_profile, output)
+    
+    def discard_speculation(self, speculation: Dict) -> None:
+        """Cancels a draft the router didn't choose, or lets it finish and drops its result"""
+        future = speculation["future"]
+        if future.cancel():
+            self.speculation_stats.record(misses=1)
+            return
         
-        # Route to appropriate agent
-        if agent_name == "conversation":
-            response = self.conversation_agent.respond(user_input, user_profile)
-            
-            # Get feedback on the interaction
-            feedback = self.feedback_agent.process_interaction(user_input, response, user_profile)
-            
-            return {
-                "agent": "conversation",
-                "response": response,
-                "feedback": feedback
-            }
-            
-        elif agent_name == "exercise":
-            # Determine exercise type from input
-            exercise_type_prompt = PromptTemplate.from_template(
-                """Based on this user request, what type of exercise should be generated? 
-                Choose from: vocabulary, grammar, conversation, reading_comprehension, listening_comprehension.
-                
-                User request: {input}
-                
-                Return ONLY the exercise type:"""
-            )
-            exercise_type_chain = exercise_type_prompt | self.llm
-            exercise_type_response = exercise_type_chain.invoke({"input": user_input})
-            exercise_type = exercise_type_response.content.strip() if hasattr(exercise_type_response, "content") else str(exercise_type_response).strip()
-            
-            # Generate exercise
-            exercise = self.exercise_agent.generate_exercise(exercise_type, user_profile)
-            
-            return {
-                "agent": "exercise",
-                "response": exercise
-            }
-            
-        elif agent_name == "idioms":
-            # Determine request type
-            idiom_request_prompt = PromptTemplate.from_template(
-                """Based on this user request about idioms or expressions, what type of help do they need? 
-                Choose from: explain_idiom, detect_idioms, suggest_idioms, explain_sarcasm.
-                
-                User request: {input}
-                
-                Return ONLY the request type:"""
-            )
-            idiom_request_chain = idiom_request_prompt | self.llm
-            idiom_request_response = idiom_request_chain.invoke({"input": user_input})
-            request_type = idiom_request_response.content.strip() if hasattr(idiom_request_response, "content") else str(idiom_request_response).strip()
-            
-            # Process idiom request
-            idiom_response = self.idioms_agent.process_request(request_type, user_input, user_profile)
-            
-            return {
-                "agent": "idioms",
-                "response": idiom_response
+        def account(done):
+            wasted = speculation["prompt_tokens"]
+            if done.exception() is None:
+                wasted += len(done.result()[0]) // 4
+            self.speculation_stats.record(misses=1, wasted_tokens=wasted)
+        
+        future.add_done_callback(account)
+    
+    def conversation_reply(self, user_input: str, user_profile: UserProfile, speculation: Optional[Dict],
+                           route_seconds: float) -> str:
+        """The conversation agent's reply, from the speculative draft when there is one"""
+        if speculation is not None:
+            return self.finish_speculation(speculation, user_input, user_profile, route_seconds)
+        return self.conversation_agent.respond(user_input, user_profile)
+    
+    def build_turn_graph(self) -> TurnGraph:
+        """route -> agent(s) -> feedback -> profile snapshot, checkpointed per turn"""
+        graph = TurnGraph(CheckpointStore(TURN_CHECKPOINT_PATH))
+        graph.add_node("route", self.traced("router", self.route_node), timeout=ROUTE_TIMEOUT_SECONDS,
+                       fallback=lambda state, context, reason: {"route": {"agent": "conversation", "sub_type": None,
+                                                                          "args": {}, "source": reason}})
+        graph.add_node("conversation", self.traced("agent.conversation", self.conversation_node), timeout=NODE_TIMEOUT_SECONDS)
+        # Exercise and idiom requests have a latency budget, past which banked/cached content is served
+        graph.add_node("exercise", self.traced("agent.exercise", self.exercise_node), timeout=EXERCISE_BUDGET_SECONDS,
+                       fallback=self.exercise_fallback)
+        graph.add_node("idioms", self.traced("agent.idioms", self.idioms_node), timeout=IDIOMS_BUDGET_SECONDS,
+                       fallback=self.idioms_fallback)
+        graph.add_node("progress", self.traced("agent.feedback.progress", self.progress_node), timeout=NODE_TIMEOUT_SECONDS)
+        graph.add_node("recommendations", self.traced("agent.feedback.recommendations", self.recommendations_node), timeout=NODE_TIMEOUT_SECONDS)
+        graph.add_node("interaction_feedback", self.traced("feedback.queue", self.interaction_feedback_node))
+        graph.add_node("profile_snapshot", self.traced("profile_snapshot", self.profile_snapshot_node))
+        
+        graph.add_edge(START, "route")
+        # Progress requests fan out: the analysis and the recommendations run in parallel
+        graph.add_conditional_edges("route", lambda state: TURN_ROUTES.get(state["route"]["agent"], ["conversation"]))
+        graph.add_edge("conversation", "interaction_feedback")
+        for name in ("interaction_feedback", "exercise", "idioms", "progress", "recommendations"):
+            graph.add_edge(name, "profile_snapshot")
+        graph.add_edge("profile_snapshot", END)
+        return graph
+    
+    def traced(self, span_name: str, node):
+        """Wraps a graph node in a tracing span; returns the node unchanged when tracing is off"""
+        if not TRACER.enabled:
+            return node
+        
+        def run(state: Dict, context: Dict) -> Dict:
+            with TRACER.span(span_name) as span:
+                updates = node(state, context)
+                if "route" in updates:
+                    span.set(agent=updates["route"]["agent"], source=updates["route"].get("source"))
+                return updates
+        return run
+    
+    def route_node(self, state: Dict, context: Dict) -> Dict:
+        user_input = state["user_input"]
+        user_profile = context["user_profile"]
+        # Determine which agent should handle the request: locally when the router is
+        # confident, otherwise with a single structured LLM call
+        route = self.intent_router.route(user_input)
+        route_seconds = 0.0
+        if route is None:
+            # Most messages are conversation, so optionally draft the reply while the LLM routes
+            if self.speculative:
+                context["speculation"] = self.start_speculation(user_input, user_profile)
+            routing_context = {
+                "target_language": user_profile.target_language,
+                "difficulty_level": user_profile.difficulty_level,
+                "learning_focus": user_profile.learning_focus,
+                "recent_topics": [entry.user for entry in user_profile.conversation_history.recent(3)]
             }
-            
-        elif agent_name == "feedback":
-            # Generate progress analysis and recommendations
-            progress_analysis = self.feedback_agent.analyze_user_progress(user_profile.__dict__)
-            recommendations = self.feedback_agent.recommend_next_steps(user_profile)
-            
-            return {
+            started = time.perf_counter()
+            route = self.route_with_llm(user_input, routing_context)
+            route_seconds = time.perf_counter() - started
+        return {"route": route, "route_seconds": route_seconds}
+    
+    def conversation_node(self, state: Dict, context: Dict) -> Dict:
+        speculation = context.pop("speculation", None)
+        return {"response": self.conversation_reply(state["user_input"], context["user_profile"], speculation,
+                                                    state.get("route_seconds", 0.0))}
+    
+    def exercise_node(self, state: Dict, context: Dict) -> Dict:
+        with LLM_BREAKER.attempt() as allowed:
+            if not allowed:
+                return self.exercise_fallback(state, context, "circuit_open")
+            args = state["route"].get("args") or {}
+            exercise = self.exercise_agent.generate_exercise(state["route"]["sub_type"], context["user_profile"],
+                                                             context={"topic": args["topic"]} if args.get("topic") else None)
+        return {"response": exercise}
+    
+    def exercise_fallback(self, state: Dict, context: Dict, reason: str) -> Dict:
+        """The learner's latest banked exercise of the requested type, reused while the LLM is unavailable"""
+        user_profile = context["user_profile"]
+        banked = [record for record in user_profile.exercise_history.recent(len(user_profile.exercise_history))
+                  if record.exercise_type == state["route"]["sub_type"] and record.language == user_profile.target_language]
+        if reason == "timeout":
+            # A hung call never reaches the breaker's callback, so count it here
+            LLM_BREAKER.record(0.0, failed=True)
+        self.degradation.record("exercise", reason)
+        if banked:
+            return {"response": banked[-1].content, "degraded": reason}
+        return {"response": {"content": "New exercises are unavailable right now; please try again in a moment."},
+                "degraded": reason}
+    
+    def idioms_node(self, state: Dict, context: Dict) -> Dict:
+        with LLM_BREAKER.attempt() as allowed:
+            if not allowed:
+                return self.idioms_fallback(state, context, "circuit_open")
+            return {"response": self.idioms_agent.process_request(state["route"]["sub_type"], state["user_input"],
+                                                                  context["user_profile"])}
+    
+    def idioms_fallback(self, state: Dict, context: Dict, reason: str) -> Dict:
+        """A cached explanation of the same request, while the LLM is unavailable"""
+        cached = self.idioms_agent.cached_response(state["route"]["sub_type"], state["user_input"], context["user_profile"])
+        if reason == "timeout":
+            # A hung call never reaches the breaker's callback, so count it here
+            LLM_BREAKER.record(0.0, failed=True)
+        self.degradation.record("idioms", reason)
+        return {"response": cached or "I can't look that up right now; please ask again in a moment.",
+                "degraded": reason}
+    
+    def progress_node(self, state: Dict, context: Dict) -> Dict:
+        return {"progress_analysis": self.feedback_agent.analyze_user_progress(context["user_profile"])}
+    
+    def recommendations_node(self, state: Dict, context: Dict) -> Dict:
+        return {"recommendations": self.feedback_agent.recommend_next_steps(context["user_profile"])}
+    
+    def interaction_feedback_node(self, state: Dict, context: Dict) -> Dict:
+        # Queued, not awaited: the UI applies the analysis when it collects it
+        self.feedback_worker.submit(state["user_input"], state["response"], context["user_profile"])
+        return {"feedback_pending": True}
+    
+    def profile_snapshot_node(self, state: Dict, context: Dict) -> Dict:
+        # Read-only: the agents update the profile themselves; this records it with the turn
+        return {"profile": context["user_profile"].summary()}
+    
+    def process_input(self, user_input: str, user_profile: UserProfile, is_voice: bool = False, audio_file=None,
+                      turn_id: str = None):
+        """Process user input and route to appropriate agent"""
+        # Handle voice input if provided
+        turn_id = turn_id or uuid.uuid4().hex
+        # One trace per user message
+        with TRACER.trace("turn", turn_id=turn_id) as span:
+            if is_voice and audio_file:
+                with TRACER.span("voice_transcription"):
+                    user_input = self.conversation_agent.process_voice_input(audio_file)
+            span.set(user_input=user_input)
+            return self.run_turn({"user_input": user_input}, user_profile, turn_id)
+    
+    def resume_turn(self, turn_id: str, user_profile: UserProfile):
+        """
+        Finishes a turn interrupted by a crash; checkpointed nodes are not run again.
+        Returns None if there is no unfinished turn with this id.
+        """
+        if turn_id not in self.turn_graph.pending_threads():
+            return None
+        with TRACER.trace("turn.resume", turn_id=turn_id):
+            return self.run_turn({}, user_profile, turn_id)
+    
+    def resume_pending_turns(self, user_profile: UserProfile) -> List[Dict]:
+        """Prunes stale checkpoints and finishes the turns a crash left unfinished"""
+        results = []
+        for turn_id in self.turn_graph.pending_threads(TURN_CHECKPOINT_RETENTION_SECONDS):
+            try:
+                results.append(self.resume_turn(turn_id, user_profile))
+            except Exception as e:
+                # A turn that fails again is left for pruning
+                print(f"Could not resume turn {turn_id}: {e}")
+        return results
+    
+    def run_turn(self, state: Dict, user_profile: UserProfile, turn_id: str) -> Dict:
+        context = {"user_profile": user_profile}
+        try:
+            state = self.turn_graph.run(state, context, thread_id=turn_id)
+        finally:
+            # A draft the conversation node didn't use
+            speculation = context.pop("speculation", None)
+            if speculation is not None:
+                self.discard_speculation(speculation)
+        
+        agent_name = state["route"]["agent"]
+        if agent_name == "feedback":
+            result = {
                 "agent": "feedback",
                 "response": {
-                    "progress_analysis": progress_analysis,
-                    "recommendations": recommendations
+                    "progress_analysis": state["progress_analysis"],
+                    "recommendations": state["recommendations"]
                 }
             }
-        
+        elif agent_name in ("exercise", "idioms"):
+            result = {"agent": agent_name, "response": state["response"]}
         else:
-            # Default to conversation agent
-            response = self.conversation_agent.respond(user_input, user_profile)
-            return {
-                "agent": "conversation",
-                "response": response
-            }
+            result = {"agent": "conversation", "response": state["response"],
+                      "feedback_pending": state.get("feedback_pending", False)}
+        if state.get("degraded"):
+            result["degraded"] = state["degraded"]
+        result["turn_id"] = turn_id
+        result["timings"] = self.turn_graph.last_timings
+        return result
     
     def generate_system_message(self, message_type: str, user_profile: UserProfile):
         """Generate system messages to guide the user"""
@@ -938,9 +1316,8 @@ class Orchestrator:
         elif message_type == "suggestion":
             # Get recent topics from conversation history
             recent_topics = []
-            for entry in user_profile.conversation_history[-5:]:
-                if "user" in entry:
-                    recent_topics.append(entry["user"])
+            for entry in user_profile.conversation_history.recent(5):
+                recent_topics.append(entry.user)
             
             prompt = PromptTemplate.from_template(
                 """Based on recent interactions, suggest what the user could do next in their language learning journey.
@@ -970,10 +1347,21 @@ def create_streamlit_app():
     
     if 'orchestrator' not in st.session_state:
         st.session_state.orchestrator = Orchestrator(llm)
+        resumed = st.session_state.orchestrator.resume_pending_turns(st.session_state.user_profile)
+        if resumed:
+            st.toast(f"Finished {len(resumed)} interrupted turn(s) from the last session")
     
     if 'chat_history' not in st.session_state:
         st.session_state.chat_history = []
     
+    # Surface interaction feedback that finished since the last render
+    for ready in st.session_state.orchestrator.feedback_worker.collect(st.session_state.user_profile):
+        st.session_state.chat_history.append({
+            "role": "system",
+            "content": f"Feedback on: \"{ready['user_input']}\"",
+            "feedback": {"content": ready["feedback"]}
+        })
+    
     # Sidebar for settings
     with st.sidebar:
         st.header("Settings")
@@ -1033,7 +1421,7 @@ def create_streamlit_app():
             if len(st.session_state.user_profile.conversation_history) > 3:
                 # Generate progress feedback
                 feedback_response = st.session_state.orchestrator.feedback_agent.analyze_user_progress(
-                    st.session_state.user_profile.__dict__
+                    st.session_state.user_profile
                 )
                 
                 # Add to chat history
@@ -1047,6 +1435,20 @@ def create_streamlit_app():
                     "role": "system",
                     "content": "Please interact more to receive progress feedback."
                 })
+        
+        # Speculative replies: draft with the conversation agent while routing
+        st.session_state.orchestrator.speculative = st.checkbox(
+            "Speculative replies", value=st.session_state.orchestrator.speculative
+        )
+        if st.session_state.orchestrator.speculative:
+            speculation = st.session_state.orchestrator.speculation_stats.report()
+            st.caption(f"Speculation: {speculation['hits']} hits, {speculation['misses']} misses, "
+                       f"{speculation['latency_saved_ms']} ms saved, ~{speculation['tokens_wasted']} tokens wasted")
+        
+        # Background interaction analysis
+        feedback_metrics = st.session_state.orchestrator.feedback_worker.metrics()
+        st.caption(f"Feedback queue: {feedback_metrics['queue_depth']} pending, "
+                   f"avg lag {feedback_metrics['lag_ms_avg'] or 0:.0f} ms")
     
     # Main chat interface
     st.header("Your Language Learning Assistant")
@@ -1085,6 +1487,12 @@ def create_streamlit_app():
             "content": welcome_msg
         })
     
+    # Feedback is only collected on a render, so offer one instead of waiting for the next message
+    if st.session_state.orchestrator.feedback_worker.metrics()["queue_depth"]:
+        st.info("Feedback on your last message is being prepared; it appears with your next message.")
+        if st.button("Show feedback now"):
+            st.rerun()
+    
     # Input options
     input_option = st.radio("Input Method", ["Text", "Voice"], horizontal=True)
     
@@ -1092,7 +1500,7 @@ def create_streamlit_app():
         # Text input
         user_input = st.chat_input("Type your message in any language...")
         
-        if user_input:
+        if user_input and user_input.strip():
             # Add user message to chat history
             st.session_state.chat_history.append({
                 "role": "user",
@@ -1134,6 +1542,12 @@ def create_streamlit_app():
                     "feedback": response["response"]["recommendations"]
                 })
             
+            if response.get("degraded"):
+                st.session_state.chat_history.append({
+                    "role": "system",
+                    "content": "The tutor is responding slowly, so this answer was served from earlier content."
+                })
+            
             # Force refresh
             st.rerun()
     else:
@@ -0,0 +1,162 @@
+"""
+LLM circuit breaker and fallback bookkeeping for multi-agent.py.
+
+CircuitBreaker opens after consecutive failed or slow calls, so requests fail
+fast to cached content; BreakerCallback feeds it from the LLM's callbacks.
+ResponseCache holds past answers to serve while it is open, and DegradationLog
+counts the responses that were served from fallbacks.
+
+CircuitBreaker and BreakerCallback mirror multi-agent-framework/resilience.py
+line for line; only the defaults differ, since that module reads them from the
+framework's config.py. This app can't import it, so change both together.
+"""
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import Any, Dict, Tuple
+from langchain_core.callbacks import BaseCallbackHandler
+
+
+class CircuitBreaker:
+    """
+    Tracks LLM call outcomes. After `failure_threshold` consecutive failures or
+    slow calls the breaker opens and callers fail fast; after `reset_seconds`
+    one trial request is let through (half-open) and its outcome closes or
+    re-opens the breaker. Take the trial with attempt(), which releases it if
+    the request ends without an LLM call.
+    """
+
+    def __init__(self, failure_threshold: int = 3, reset_seconds: float = 30, slow_call_seconds: float = 20):
+        self.failure_threshold = failure_threshold
+        self.reset_seconds = reset_seconds
+        self.slow_call_seconds = slow_call_seconds
+        self.lock = threading.Lock()
+        self.state = "closed"
+        self.failures = 0
+        self.opened_at = 0.0
+        self.trial_in_flight = False
+        self.opened_count = 0
+        self.rejected = 0
+        # Calls recorded so far; attempt() uses it to see whether a request reached the LLM
+        self.outcomes = 0
+
+    def allow(self) -> bool:
+        """Whether a request may call the LLM now."""
+        with self.lock:
+            if self.state == "closed":
+                return True
+            if self.state == "open" and time.monotonic() - self.opened_at >= self.reset_seconds:
+                self.state = "half_open"
+                self.trial_in_flight = False
+            if self.state == "half_open" and not self.trial_in_flight:
+                self.trial_in_flight = True
+                return True
+            self.rejected += 1
+            return False
+
+    def record(self, seconds: float, failed: bool = False) -> None:
+        """Counts one LLM call; a call slower than slow_call_seconds counts as a failure."""
+        failed = failed or seconds > self.slow_call_seconds
+        with self.lock:
+            self.outcomes += 1
+            if not failed:
+                self.failures = 0
+                self.state = "closed"
+                return
+            self.failures += 1
+            if self.state == "half_open" or self.failures >= self.failure_threshold:
+                if self.state != "open":
+                    self.opened_count += 1
+                self.state = "open"
+                self.opened_at = time.monotonic()
+
+    @contextmanager
+    def attempt(self):
+        """
+        Yields allow(). A half-open trial that records no outcome (e.g. it was
+        served from a cache, or failed before calling the LLM) is released on
+        exit, so the next request can be the trial.
+        """
+        allowed = self.allow()
+        outcomes = self.outcomes
+        try:
+            yield allowed
+        finally:
+            if allowed and self.outcomes == outcomes:
+                with self.lock:
+                    if self.state == "half_open":
+                        self.trial_in_flight = False
+
+    def metrics(self) -> Dict[str, Any]:
+        with self.lock:
+            return {"state": self.state, "consecutive_failures": self.failures,
+                    "times_opened": self.opened_count, "rejected": self.rejected}
+
+
+class BreakerCallback(BaseCallbackHandler):
+    """Feeds the duration and outcome of every LLM call into a CircuitBreaker."""
+
+    def __init__(self, breaker: CircuitBreaker):
+        self.breaker = breaker
+        self.started: Dict[Any, float] = {}
+
+    def on_llm_start(self, serialized, prompts, *, run_id, **kwargs) -> None:
+        self.started[run_id] = time.perf_counter()
+
+    def on_chat_model_start(self, serialized, messages, *, run_id, **kwargs) -> None:
+        self.started[run_id] = time.perf_counter()
+
+    def on_llm_end(self, response, *, run_id, **kwargs) -> None:
+        started = self.started.pop(run_id, None)
+        if started is not None:
+            self.breaker.record(time.perf_counter() - started)
+
+    def on_llm_error(self, error, *, run_id, **kwargs) -> None:
+        started = self.started.pop(run_id, None)
+        self.breaker.record(time.perf_counter() - started if started else 0.0, failed=True)
+
+
+class ResponseCache:
+    """Small LRU of LLM answers (idiom explanations, translations) served when the LLM is unavailable"""
+
+    def __init__(self, max_size: int = 1000):
+        self.max_size = max_size
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+
+    @staticmethod
+    def key(*parts: str) -> Tuple[str, ...]:
+        return tuple(" ".join(str(part).lower().split()) for part in parts)
+
+    def get(self, key: Tuple[str, ...]):
+        with self.lock:
+            value = self.entries.get(key)
+            if value is not None:
+                self.entries.move_to_end(key)
+            return value
+
+    def put(self, key: Tuple[str, ...], value) -> None:
+        with self.lock:
+            self.entries[key] = value
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_size:
+                self.entries.popitem(last=False)
+
+
+class DegradationLog:
+    """Counts responses served from fallbacks, by operation and reason"""
+
+    def __init__(self, breaker: CircuitBreaker = None):
+        self.breaker = breaker
+        self.lock = threading.Lock()
+        self.counts = {}
+
+    def record(self, operation: str, reason: str) -> None:
+        with self.lock:
+            self.counts[(operation, reason)] = self.counts.get((operation, reason), 0) + 1
+
+    def report(self) -> Dict:
+        with self.lock:
+            counts = {f"{operation}:{reason}": count for (operation, reason), count in self.counts.items()}
+        return {"degraded": counts, "breaker": self.breaker.state if self.breaker else None}
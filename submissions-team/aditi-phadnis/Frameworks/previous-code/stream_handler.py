@@ -0,0 +1,132 @@
+"""
+Throttled Streamlit token streaming for the LangChain demo apps.
+
+StreamHandler buffers streamed tokens and redraws its container on a
+time/size cadence. Run this file to replay a long stream through it and
+through a handler that redraws on every token.
+"""
+import argparse
+import time
+from langchain_core.callbacks import BaseCallbackHandler
+
+# Streamed tokens are drawn at most this often, or sooner once this many characters are waiting
+STREAM_FLUSH_SECONDS = 0.1
+STREAM_FLUSH_CHARS = 400
+
+class StreamHandler(BaseCallbackHandler):
+    """
+    Buffers streamed tokens and redraws the container on a time/size cadence
+    instead of on every token, so a long answer is rendered tens of times rather
+    than thousands.
+    """
+
+    def __init__(self, container, initial_text="", flush_seconds=STREAM_FLUSH_SECONDS,
+                 flush_chars=STREAM_FLUSH_CHARS):
+        self.container = container
+        self.flush_seconds = flush_seconds
+        self.flush_chars = flush_chars
+        self.shown = initial_text
+        self.pending = []
+        self.pending_chars = 0
+        self.tokens = 0
+        self.flushes = 0
+        self.render_seconds = 0.0
+        self.started = time.perf_counter()
+        self.last_flush = self.started
+
+    @property
+    def text(self):
+        return self.shown + "".join(self.pending)
+
+    def on_llm_new_token(self, token: str, **kwargs):
+        self.pending.append(token)
+        self.pending_chars += len(token)
+        self.tokens += 1
+        if (self.pending_chars >= self.flush_chars
+                or time.perf_counter() - self.last_flush >= self.flush_seconds):
+            self.flush()
+
+    def on_llm_end(self, response, **kwargs):
+        self.flush()
+
+    def on_llm_error(self, error, **kwargs):
+        self.flush()
+
+    def flush(self):
+        """Draws everything buffered so far."""
+        if not self.pending:
+            return
+        self.shown += "".join(self.pending)
+        self.pending = []
+        self.pending_chars = 0
+        started = time.perf_counter()
+        self.container.markdown(self.shown)
+        self.last_flush = time.perf_counter()
+        self.render_seconds += self.last_flush - started
+        self.flushes += 1
+
+    def stats(self):
+        """Tokens, redraws and redraws per second since the handler was created."""
+        elapsed = time.perf_counter() - self.started
+        return {
+            "tokens": self.tokens,
+            "flushes": self.flushes,
+            "flushes_per_second": round(self.flushes / elapsed, 1) if elapsed else 0.0,
+            "tokens_per_flush": round(self.tokens / self.flushes, 1) if self.flushes else 0.0,
+            "render_ms": round(self.render_seconds * 1000, 1),
+        }
+
+
+class _PerTokenHandler(BaseCallbackHandler):
+    """The handler StreamHandler replaced: redraws the full text on every token."""
+
+    def __init__(self, container):
+        self.container = container
+        self.text = ""
+
+    def on_llm_new_token(self, token: str, **kwargs):
+        self.text += token
+        self.container.markdown(self.text)
+
+
+class _CountingContainer:
+    """Stands in for st.empty(): counts redraws and the characters drawn."""
+
+    def __init__(self):
+        self.redraws = 0
+        self.chars = 0
+
+    def markdown(self, text):
+        self.redraws += 1
+        self.chars += len(text)
+
+
+def benchmark(tokens: int = 6000, token_seconds: float = 0.0):
+    """Replays `tokens` tokens, `token_seconds` apart, through both handlers."""
+    results = {}
+    for name, make in (("per_token", _PerTokenHandler), ("throttled", StreamHandler)):
+        container = _CountingContainer()
+        handler = make(container)
+        started = time.perf_counter()
+        for i in range(tokens):
+            handler.on_llm_new_token(f"palabra{i % 10} ")
+            if token_seconds:
+                time.sleep(token_seconds)
+        if isinstance(handler, StreamHandler):
+            handler.flush()
+        results[name] = {"redraws": container.redraws, "chars_drawn": container.chars,
+                         "seconds": round(time.perf_counter() - started, 3)}
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay a token stream through the streaming handlers.")
+    parser.add_argument("--tokens", type=int, default=6000)
+    parser.add_argument("--token-ms", type=float, default=0.0, help="Delay between tokens, like a live model")
+    args = parser.parse_args()
+    for name, figures in benchmark(args.tokens, args.token_ms / 1000).items():
+        print(f"{name:<10} {figures}")
+
+
+if __name__ == "__main__":
+    main()
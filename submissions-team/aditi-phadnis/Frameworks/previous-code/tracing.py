@@ -0,0 +1,256 @@
+"""
+Request-scoped tracing for multi-agent.py.
+
+Each user message opens a trace; spans nest through a context variable, so the
+router, agent, tool and LLM spans of one turn form a tree even across the
+orchestrator's worker threads (submit work with `propagate`). Finished spans
+are appended as JSON lines to TRACE_PATH. Run this file to print a flame-style
+breakdown of the recorded traces.
+
+Tracing is off unless POLYGLOT_TRACING=1; disabled, `span` returns a shared
+no-op context manager and the callback handler returns immediately.
+"""
+import argparse
+import contextvars
+import json
+import os
+import threading
+import time
+import uuid
+from collections import defaultdict
+from typing import Any, Dict, List, Optional
+from langchain_core.callbacks import BaseCallbackHandler
+
+TRACING_ENABLED = os.getenv("POLYGLOT_TRACING") == "1"
+TRACE_PATH = os.getenv("POLYGLOT_TRACE_PATH", "traces.jsonl")
+BAR_WIDTH = 30
+
+_current_span: contextvars.ContextVar = contextvars.ContextVar("current_span", default=None)
+
+
+class Span:
+    __slots__ = ("tracer", "trace_id", "span_id", "parent_id", "name", "attributes", "started_at", "started",
+                 "status", "error", "token")
+
+    def __init__(self, tracer: "Tracer", name: str, parent: Optional["Span"], attributes: Dict[str, Any]):
+        self.tracer = tracer
+        self.trace_id = parent.trace_id if parent is not None else uuid.uuid4().hex
+        self.span_id = uuid.uuid4().hex[:16]
+        self.parent_id = parent.span_id if parent is not None else None
+        self.name = name
+        self.attributes = attributes
+        self.started_at = time.time()
+        self.started = time.perf_counter()
+        self.status = "ok"
+        self.error = None
+        self.token = None
+
+    def set(self, **attributes) -> None:
+        self.attributes.update(attributes)
+
+    def end(self, error: BaseException = None) -> None:
+        if error is not None:
+            self.status = "error"
+            self.error = f"{type(error).__name__}: {error}"
+        self.tracer.export({
+            "trace_id": self.trace_id,
+            "span_id": self.span_id,
+            "parent_id": self.parent_id,
+            "name": self.name,
+            "start": self.started_at,
+            "duration_ms": round((time.perf_counter() - self.started) * 1000, 3),
+            "status": self.status,
+            "error": self.error,
+            "thread": threading.current_thread().name,
+            "attributes": self.attributes,
+        })
+
+    def __enter__(self) -> "Span":
+        self.token = _current_span.set(self)
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> bool:
+        _current_span.reset(self.token)
+        self.end(exc)
+        return False
+
+
+class _NoopSpan:
+    """Returned by Tracer.span when tracing is off."""
+
+    def set(self, **attributes) -> None:
+        pass
+
+    def __enter__(self) -> "_NoopSpan":
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> bool:
+        return False
+
+
+NOOP_SPAN = _NoopSpan()
+
+
+class Tracer:
+    """Creates spans and appends finished ones to a JSON-lines file."""
+
+    def __init__(self, path: str = TRACE_PATH, enabled: bool = TRACING_ENABLED):
+        self.path = path
+        self.enabled = enabled
+        self.lock = threading.Lock()
+
+    def span(self, name: str, **attributes):
+        """A child of the current span, or the root of a new trace when there is none."""
+        if not self.enabled:
+            return NOOP_SPAN
+        return Span(self, name, _current_span.get(), attributes)
+
+    def trace(self, name: str, **attributes):
+        """Always starts a new trace, e.g. one per user message."""
+        if not self.enabled:
+            return NOOP_SPAN
+        return Span(self, name, None, attributes)
+
+    def export(self, record: Dict[str, Any]) -> None:
+        line = json.dumps(record, ensure_ascii=False, default=str) + "\n"
+        with self.lock:
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.write(line)
+
+
+TRACER = Tracer()
+
+
+def propagate(func):
+    """Binds func to the caller's context so spans opened on a worker thread keep their parent."""
+    if not TRACER.enabled:
+        return func
+    # A fresh copy per call: one Context can't be entered by two threads at once
+    context = contextvars.copy_context()
+
+    def run(*args, **kwargs):
+        return context.run(func, *args, **kwargs)
+    return run
+
+
+class TraceCallbackHandler(BaseCallbackHandler):
+    """Records a span per LLM call and per tool call made through LangChain."""
+
+    def __init__(self, tracer: Tracer = TRACER):
+        self.tracer = tracer
+        self.spans: Dict[Any, Span] = {}
+
+    def _start(self, run_id, parent_run_id, name: str, attributes: Dict[str, Any]) -> None:
+        if not self.tracer.enabled:
+            return
+        # Inside a tool the parent is that tool's span; otherwise the span open on this thread
+        parent = self.spans.get(parent_run_id) or _current_span.get()
+        self.spans[run_id] = Span(self.tracer, name, parent, attributes)
+
+    def _end(self, run_id, error: BaseException = None, **attributes) -> None:
+        span = self.spans.pop(run_id, None)
+        if span is not None:
+            span.set(**attributes)
+            span.end(error)
+
+    def on_llm_start(self, serialized, prompts, *, run_id, parent_run_id=None, **kwargs):
+        self._start(run_id, parent_run_id, "llm", {"model": (serialized or {}).get("name")})
+
+    def on_chat_model_start(self, serialized, messages, *, run_id, parent_run_id=None, **kwargs):
+        self._start(run_id, parent_run_id, "llm", {"model": (serialized or {}).get("name"),
+                                                   "messages": sum(len(batch) for batch in messages)})
+
+    def on_llm_end(self, response, *, run_id, **kwargs):
+        if run_id not in self.spans:
+            return
+        usage = (response.llm_output or {}).get("token_usage") or {}
+        self._end(run_id, **{key: usage[key] for key in ("prompt_tokens", "completion_tokens") if key in usage})
+
+    def on_llm_error(self, error, *, run_id, **kwargs):
+        self._end(run_id, error)
+
+    def on_tool_start(self, serialized, input_str, *, run_id, parent_run_id=None, **kwargs):
+        self._start(run_id, parent_run_id, f"tool.{(serialized or {}).get('name', 'unknown')}", {})
+        span = self.spans.get(run_id)
+        if span is not None:
+            # The tool runs on this thread between start and end, so LLM calls it makes nest under it
+            span.token = _current_span.set(span)
+
+    def _end_tool(self, run_id, error: BaseException = None) -> None:
+        span = self.spans.get(run_id)
+        if span is not None and span.token is not None:
+            _current_span.reset(span.token)
+        self._end(run_id, error)
+
+    def on_tool_end(self, output, *, run_id, **kwargs):
+        self._end_tool(run_id)
+
+    def on_tool_error(self, error, *, run_id, **kwargs):
+        self._end_tool(run_id, error)
+
+
+TRACE_CALLBACK = TraceCallbackHandler()
+
+
+def load_traces(path: str = TRACE_PATH) -> Dict[str, List[Dict]]:
+    """trace_id -> spans, in file order"""
+    traces = defaultdict(list)
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            if line.strip():
+                record = json.loads(line)
+                traces[record["trace_id"]].append(record)
+    return traces
+
+
+def flame(spans: List[Dict]) -> List[str]:
+    """Indented span tree with durations, self time and a bar scaled to the slowest root."""
+    children = defaultdict(list)
+    ids = {span["span_id"] for span in spans}
+    for span in spans:
+        parent = span["parent_id"] if span["parent_id"] in ids else None
+        children[parent].append(span)
+    for siblings in children.values():
+        siblings.sort(key=lambda span: span["start"])
+    roots = children[None]
+    total = max((span["duration_ms"] for span in roots), default=0) or 1
+
+    lines = []
+
+    def walk(span: Dict, depth: int) -> None:
+        self_ms = span["duration_ms"] - sum(child["duration_ms"] for child in children[span["span_id"]])
+        bar = "█" * max(1, round(BAR_WIDTH * span["duration_ms"] / total))
+        label = ("  " * depth + span["name"])[:48]
+        flag = " !" if span["status"] == "error" else ""
+        lines.append(f"{label:<48} {span['duration_ms']:>10.1f} ms {100 * span['duration_ms'] / total:>5.1f}% "
+                     f"self {max(self_ms, 0):>9.1f} ms {bar}{flag}")
+        for child in children[span["span_id"]]:
+            walk(child, depth + 1)
+
+    for root in roots:
+        walk(root, 0)
+    return lines
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Print a flame-style breakdown of recorded traces.")
+    parser.add_argument("path", nargs="?", default=TRACE_PATH)
+    parser.add_argument("--trace", help="Only this trace id (a prefix is enough)")
+    parser.add_argument("--last", type=int, default=5, help="Number of most recent traces to show")
+    args = parser.parse_args()
+
+    traces = load_traces(args.path)
+    selected = [trace_id for trace_id in traces if args.trace is None or trace_id.startswith(args.trace)]
+    selected.sort(key=lambda trace_id: min(span["start"] for span in traces[trace_id]))
+    for trace_id in selected[-args.last:]:
+        spans = traces[trace_id]
+        root = min(spans, key=lambda span: span["start"])
+        print(f"trace {trace_id}  {time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(root['start']))}  "
+              f"{root['attributes'].get('user_input', '')!s:.60}")
+        for line in flame(spans):
+            print("  " + line)
+        print()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,226 @@
+"""
+Small graph engine for the multi-agent.py turn pipeline.
+
+Nodes are functions `(state, context) -> dict of state updates`. The graph
+runs in steps: every node in the current frontier runs in parallel on a
+thread pool, their updates are merged into the state, and the next frontier
+is the union of their successors (fixed edges or a chooser function). Each
+finished node is checkpointed to SQLite with its update, so re-running a
+thread id after a crash replays finished nodes from disk instead of calling
+them again. A thread's checkpoints are deleted once it reaches END, and
+unfinished threads are pruned after a retention period. `context` carries objects that are not checkpointed (the user
+profile, agents); `state` must be JSON-serialisable.
+"""
+import contextvars
+import json
+import sqlite3
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeout
+from typing import Any, Callable, Dict, List
+
+START = "__start__"
+END = "__end__"
+
+
+class NodeTimeoutError(Exception):
+    """A node ran past its timeout and has no fallback."""
+
+
+class CheckpointStore:
+    """SQLite (WAL) log of finished nodes per thread (one thread = one turn)."""
+
+    def __init__(self, path: str = "turn_checkpoints.db"):
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.lock = threading.Lock()
+        with self.lock, self.conn:
+            self.conn.execute("PRAGMA journal_mode=WAL")
+            self.conn.execute("""
+                CREATE TABLE IF NOT EXISTS checkpoints (
+                    thread_id TEXT NOT NULL,
+                    node TEXT NOT NULL,
+                    step INTEGER NOT NULL,
+                    updates TEXT NOT NULL,
+                    status TEXT NOT NULL,
+                    seconds REAL NOT NULL,
+                    created_at REAL NOT NULL,
+                    PRIMARY KEY (thread_id, node)
+                )
+            """)
+
+    def save(self, thread_id: str, node: str, step: int, updates: Dict, status: str, seconds: float) -> None:
+        with self.lock, self.conn:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO checkpoints (thread_id, node, step, updates, status, seconds, created_at) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (thread_id, node, step, json.dumps(updates, ensure_ascii=False, default=str), status, seconds,
+                 time.time())
+            )
+
+    def load(self, thread_id: str) -> Dict[str, Dict]:
+        """node -> {"updates", "status", "seconds"} for the thread's finished nodes."""
+        with self.lock:
+            rows = self.conn.execute("SELECT node, updates, status, seconds FROM checkpoints WHERE thread_id = ?",
+                                     (thread_id,)).fetchall()
+        return {node: {"updates": json.loads(updates), "status": status, "seconds": seconds}
+                for node, updates, status, seconds in rows}
+
+    def delete(self, thread_id: str) -> None:
+        with self.lock, self.conn:
+            self.conn.execute("DELETE FROM checkpoints WHERE thread_id = ?", (thread_id,))
+
+    def prune(self, max_age_seconds: float) -> int:
+        """Deletes threads whose last checkpoint is older than `max_age_seconds`; returns how many."""
+        with self.lock, self.conn:
+            stale = [row[0] for row in self.conn.execute(
+                "SELECT thread_id FROM checkpoints GROUP BY thread_id HAVING MAX(created_at) < ?",
+                (time.time() - max_age_seconds,)
+            )]
+            self.conn.executemany("DELETE FROM checkpoints WHERE thread_id = ?", [(thread_id,) for thread_id in stale])
+        return len(stale)
+
+    def unfinished(self) -> List[str]:
+        """Thread ids that started but never reached END, e.g. after a crash."""
+        with self.lock:
+            rows = self.conn.execute(
+                "SELECT DISTINCT thread_id FROM checkpoints WHERE thread_id NOT IN "
+                "(SELECT thread_id FROM checkpoints WHERE node = ?)", (END,)
+            ).fetchall()
+        return [row[0] for row in rows]
+
+
+class TurnGraph:
+    """A directed graph of nodes with parallel fan-out, per-node timeouts and checkpointing."""
+
+    def __init__(self, checkpoints: CheckpointStore = None, max_workers: int = 4):
+        self.nodes: Dict[str, Dict[str, Any]] = {}
+        self.edges: Dict[str, List[str]] = {}
+        self.choosers: Dict[str, Callable[[Dict], List[str]]] = {}
+        self.checkpoints = checkpoints
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="turn-graph")
+        # Per-node timings of the last run: [{"node", "step", "seconds", "status"}]
+        self.last_timings: List[Dict] = []
+
+    def add_node(self, name: str, func: Callable[[Dict, Dict], Dict], timeout: float = None,
+                 fallback: Callable[[Dict, Dict, str], Dict] = None) -> None:
+        """`fallback(state, context, reason)` supplies the updates when the node times out or fails."""
+        self.nodes[name] = {"func": func, "timeout": timeout, "fallback": fallback}
+
+    def add_edge(self, source: str, target: str) -> None:
+        self.edges.setdefault(source, []).append(target)
+
+    def add_conditional_edges(self, source: str, chooser: Callable[[Dict], List[str]]) -> None:
+        """`chooser(state)` returns the next node names; several names fan out in parallel."""
+        self.choosers[source] = chooser
+
+    @staticmethod
+    def _timed(func: Callable[[Dict, Dict], Dict], state: Dict, context: Dict) -> tuple:
+        """Runs a node on its worker thread; returns (updates, seconds spent in the node itself)."""
+        started = time.perf_counter()
+        updates = func(state, context)
+        return updates, time.perf_counter() - started
+
+    def successors(self, node: str, state: Dict) -> List[str]:
+        targets = list(self.edges.get(node, []))
+        if node in self.choosers:
+            targets.extend(self.choosers[node](state))
+        return targets
+
+    def _result(self, name: str, future, started: float, state: Dict, context: Dict) -> Dict:
+        node = self.nodes[name]
+        timeout = node["timeout"]
+        try:
+            # The timeout counts from when the node was started, not from when we wait on it
+            updates, seconds = future.result(timeout=None if timeout is None else
+                                             max(0.0, timeout - (time.perf_counter() - started)))
+            return {"updates": updates or {}, "status": "ok", "seconds": round(seconds, 3)}
+        except FutureTimeout:
+            # The thread can't be killed; its result is ignored when it finishes
+            if node["fallback"] is None:
+                raise NodeTimeoutError(f"Node '{name}' timed out after {node['timeout']}s")
+            print(f"Node '{name}' timed out after {node['timeout']}s, using its fallback")
+            return {"updates": node["fallback"](state, context, "timeout"), "status": "timeout",
+                    "seconds": round(time.perf_counter() - started, 3)}
+        except Exception as e:
+            if node["fallback"] is None:
+                raise
+            print(f"Node '{name}' failed, using its fallback: {e}")
+            return {"updates": node["fallback"](state, context, "error"), "status": "fallback",
+                    "seconds": round(time.perf_counter() - started, 3)}
+
+    def run(self, state: Dict, context: Dict = None, thread_id: str = None) -> Dict:
+        """
+        Runs the graph from START and returns the final state. With a thread id and a
+        checkpoint store, nodes already finished for that thread are not run again.
+        Resuming (an empty `state`) a thread with no checkpoints raises KeyError.
+        """
+        context = context or {}
+        done = self.checkpoints.load(thread_id) if self.checkpoints and thread_id else {}
+        if START in done:
+            # Resuming: the turn's input as it was first checkpointed
+            state = dict(done[START]["updates"])
+        elif not state:
+            raise KeyError(f"No checkpointed turn '{thread_id}' to resume")
+        else:
+            state = dict(state)
+            if self.checkpoints and thread_id:
+                self.checkpoints.save(thread_id, START, 0, state, "ok", 0.0)
+
+        timings = []
+        self.last_timings = timings
+        frontier = self.successors(START, state)
+        step = 1
+        while frontier:
+            # A node reached from several branches runs once per step
+            frontier = [name for name in dict.fromkeys(frontier) if name != END]
+            pending = {}
+            results = {}
+            for name in frontier:
+                if name in done:
+                    results[name] = dict(done[name], status="replayed")
+                else:
+                    # Each node gets its own copy so parallel branches can't see each other's writes;
+                    # copy_context carries the caller's context variables (e.g. the open trace span)
+                    pending[name] = (time.perf_counter(),
+                                     self.executor.submit(contextvars.copy_context().run, self._timed,
+                                                          self.nodes[name]["func"], dict(state), context))
+
+            error = None
+            for name, (started, future) in pending.items():
+                try:
+                    result = self._result(name, future, started, state, context)
+                except Exception as e:
+                    # Let the other branches of this step finish and checkpoint first
+                    error = error or e
+                    timings.append({"node": name, "step": step, "status": "error",
+                                    "seconds": round(time.perf_counter() - started, 3)})
+                    continue
+                results[name] = result
+                if self.checkpoints and thread_id:
+                    self.checkpoints.save(thread_id, name, step, result["updates"], result["status"],
+                                          result["seconds"])
+            if error is not None:
+                raise error
+
+            next_frontier = []
+            for name in frontier:
+                state.update(results[name]["updates"])
+                timings.append({"node": name, "step": step, "status": results[name]["status"],
+                                "seconds": results[name]["seconds"]})
+            for name in frontier:
+                next_frontier.extend(self.successors(name, state))
+            frontier = next_frontier
+            step += 1
+
+        if self.checkpoints and thread_id:
+            # A finished turn is never resumed, so its checkpoints are no longer needed
+            self.checkpoints.delete(thread_id)
+        return state
+
+    def pending_threads(self, max_age_seconds: float = None) -> List[str]:
+        """Unfinished thread ids, after pruning those older than `max_age_seconds`."""
+        if not self.checkpoints:
+            return []
+        if max_age_seconds is not None:
+            self.checkpoints.prune(max_age_seconds)
+        return self.checkpoints.unfinished()